@@ -1,16 +1,22 @@
 import sys
 import os
+import multiprocessing
+import time
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox,
-    QGroupBox, QCheckBox, QDoubleSpinBox, QSizePolicy, QProgressDialog, QDialog, QTextEdit
+    QGroupBox, QCheckBox, QDoubleSpinBox, QSpinBox, QComboBox, QSizePolicy, QProgressDialog, QDialog, QTextEdit
 )
-from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtCore import Qt, QUrl, QObject, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import  QDragEnterEvent, QDropEvent, QDesktopServices, QIcon
 from PyQt5.QtWidgets import QStyle
 
-import pandas as pd
-import openpyxl
+# 处理模块依赖 pandas/numpy/openpyxl，导入需要较长时间；
+# 窗口显示后由 Preloader 在后台线程中导入，各方法中按需 import
+import scfa_report
+
+# 后台预加载开始前等待的时间（毫秒），让窗口先完成绘制
+PRELOAD_DELAY_MS = 100
 
 class ModernLineEdit(QLineEdit):
     def __init__(self, parent=None, mode='file', default_filename=''):
@@ -120,6 +126,101 @@ class AboutDialog(QDialog):
             }
         """)
 
+class Preloader(QObject):
+    """在后台线程中导入处理模块"""
+    finished = pyqtSignal()
+
+    def run(self):
+        try:
+            import openpyxl  # noqa: F401  写出 Excel 时使用，同时保证打包时包含
+            import scfa_batch  # noqa: F401
+            import scfa_cache  # noqa: F401
+            import scfa_engine  # noqa: F401
+            import scfa_output  # noqa: F401
+            import scfa_viewer  # noqa: F401
+        except ImportError:
+            # 缺少依赖时在开始处理时报错
+            pass
+        self.finished.emit()
+
+class PreflightWorker(QObject):
+    """在后台线程中检查批量输入，通过信号返回结果"""
+    # (FileCheck 列表, format_checks 的文本)
+    finished = pyqtSignal(list, str)
+
+    def __init__(self, file_paths, params):
+        super().__init__()
+        self.file_paths = file_paths
+        self.params = params
+
+    def run(self):
+        import scfa_preflight
+        start = time.perf_counter()
+        try:
+            checks = scfa_preflight.check_files(self.file_paths, self.params)
+        except Exception as e:
+            checks = [scfa_preflight.FileCheck(file_path=f, errors=[f"Check failed: {e}"]) for f in self.file_paths]
+        self.finished.emit(checks, scfa_preflight.format_checks(checks, time.perf_counter() - start))
+
+class BatchWorker(QObject):
+    """在后台线程中运行批量处理，通过信号报告进度"""
+    file_progress = pyqtSignal(str, str, int, int)
+    file_finished = pyqtSignal(int, int, str)
+    # (BatchItem 列表, 合并输出的结果文本)
+    finished = pyqtSignal(list, str)
+
+    def __init__(self, file_paths, save_path, params, workers=1, cache=None, pipeline=False, keep_frames=False):
+        super().__init__()
+        self.file_paths = file_paths
+        self.save_path = save_path
+        self.params = params
+        self.workers = workers
+        self.cache = cache
+        self.pipeline = pipeline
+        self.keep_frames = keep_frames
+        import scfa_engine
+        self.cancel_token = scfa_engine.CancelToken()
+
+    def run(self):
+        import scfa_batch
+        consolidated = None
+        try:
+            if self.params.consolidate:
+                # 每个文件完成后追加到合并的文件
+                consolidated = scfa_batch.ConsolidatedWriter(self.save_path, self.params, self.keep_frames,
+                                                             self.cancel_token)
+            items = scfa_batch.run_batch(
+                self.file_paths, self.save_path, self.params, self.workers,
+                on_progress=self.file_finished.emit,
+                on_file_progress=self.file_progress.emit,
+                cancel=self.cancel_token,
+                cache=self.cache,
+                pipeline=self.pipeline,
+                keep_frames=self.keep_frames,
+                on_result=consolidated.add if consolidated else None
+            )
+        except Exception as e:
+            import traceback
+            items = [
+                scfa_batch.BatchItem(file_path=f, error=str(e), traceback=traceback.format_exc())
+                for f in self.file_paths
+            ]
+        self.finished.emit(items, self._close_consolidated(consolidated))
+
+    def _close_consolidated(self, consolidated):
+        """所有文件处理完成后保存合并的标记结果，取消时删除"""
+        if consolidated is None:
+            return ""
+        try:
+            saved_files = consolidated.close()
+        except Exception as e:
+            return f"Consolidated output failed: {str(e)}"
+        return "".join(f"Consolidated file saved: {path}\n" for path in saved_files)
+
+    def cancel(self):
+        # 可在任意线程调用
+        self.cancel_token.cancel()
+
 class SCFA_Marker(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -128,12 +229,42 @@ class SCFA_Marker(QMainWindow):
         self.init_ui()
         self.init_variables()
         self.lineEdit_file_path.textChanged.connect(self._auto_set_save_dir)
+        # 窗口显示后再加载处理模块
+        QTimer.singleShot(PRELOAD_DELAY_MS, self._start_preload)
+
+    def _start_preload(self):
+        self.preload_thread = QThread(self)
+        self.preloader = Preloader()
+        self.preloader.moveToThread(self.preload_thread)
+        self.preload_thread.started.connect(self.preloader.run)
+        self.preloader.finished.connect(self._on_preload_finished)
+        self.preloader.finished.connect(self.preload_thread.quit)
+        self.preload_thread.finished.connect(self.preloader.deleteLater)
+        self.preload_thread.start()
+
+    def _on_preload_finished(self):
+        """处理模块加载完成后补全输出格式列表"""
+        try:
+            import scfa_output
+            import scfa_units
+        except ImportError:
+            return
+        current = self.comboBox_output_format.currentData()
+        self.comboBox_output_format.clear()
+        for name, output_format in scfa_output.FORMATS.items():
+            self.comboBox_output_format.addItem(f"{name} - {output_format.description}", name)
+        index = self.comboBox_output_format.findData(current)
+        self.comboBox_output_format.setCurrentIndex(max(index, 0))
+        for unit in scfa_units.UNITS:
+            self.comboBox_target_unit.addItem(unit, unit)
 
     def init_variables(self):
         self.filename = ""
         self.save_path = ""
         self.group_list = []
         self.faild_group = []
+        # 同一会话中再次运行时，只修改参数的文件不再重新读取和解析；第一次处理时创建
+        self.prepared_cache = None
 
     def init_ui(self):
         self.setWindowTitle("SCFA Marker v1.7")
@@ -201,7 +332,7 @@ class SCFA_Marker(QMainWindow):
                 font-size: 12px;
                 color: #333;
             }
-            QDoubleSpinBox {
+            QDoubleSpinBox, QSpinBox, QComboBox {
                 padding: 5px;
                 border: 2px solid #ddd;
                 border-radius: 5px;
@@ -276,6 +407,20 @@ class SCFA_Marker(QMainWindow):
         )
         dilution_layout.addWidget(dilution_label)
         dilution_layout.addWidget(self.doubleSpinBox_dilution)
+        dilution_layout.addSpacing(20)
+        # Target unit
+        unit_label = QLabel("Target Unit:")
+        self.comboBox_target_unit = QComboBox()
+        # 单位列表在处理模块加载后添加，见 _on_preload_finished
+        self.comboBox_target_unit.addItem("As exported", "")
+        self.comboBox_target_unit.setToolTip(
+            "Convert the quantities and standard ranges to this unit before marking.\n"
+            "- As exported: keep the values and units of the CSV file (default)\n"
+            "- Values in other units of the same kind (uM, mM, nM, ...) are converted;\n"
+            "  values whose unit cannot be converted are counted as unparsed"
+        )
+        dilution_layout.addWidget(unit_label)
+        dilution_layout.addWidget(self.comboBox_target_unit)
         dilution_layout.addStretch()
         layout.addLayout(dilution_layout)
         # Coefficient settings
@@ -332,10 +477,108 @@ class SCFA_Marker(QMainWindow):
         )
         group_option_layout.addWidget(control_label)
         group_option_layout.addWidget(self.lineEdit_control_group)
+        layout_label = QLabel("Layout:")
+        self.comboBox_group_layout = QComboBox()
+        # 与 scfa_engine.GROUP_LAYOUTS 相同，不在启动时导入处理模块
+        self.comboBox_group_layout.addItem("Sheet per group", "sheets")
+        self.comboBox_group_layout.addItem("Long table", "long")
+        self.comboBox_group_layout.addItem("Long + wide per group", "long-wide")
+        self.comboBox_group_layout.setToolTip(
+            "Layout of the GROUPED_* results.\n"
+            "- Sheet per group: one sheet per molecule and group (default)\n"
+            "- Long table: one table with Molecule, Group, Prefix, Replicate and Quantification;\n"
+            "  much faster to write and open when there are many molecules and groups\n"
+            "- Long + wide per group: the long table plus one sheet per group with the\n"
+            "  molecules' tables one below the other (workbooks only)"
+        )
+        group_option_layout.addWidget(layout_label)
+        group_option_layout.addWidget(self.comboBox_group_layout)
         group_option_layout.setSpacing(10)
         layout.addLayout(group_option_layout)
         self.lineEdit_group_list.setEnabled(False)
         self.lineEdit_control_group.setEnabled(False)
+        self.comboBox_group_layout.setEnabled(False)
+        # Parallel workers
+        workers_layout = QHBoxLayout()
+        workers_label = QLabel("Parallel Workers:")
+        self.spinBox_workers = QSpinBox()
+        self.spinBox_workers.setRange(1, max(1, os.cpu_count() or 1))
+        # 与 scfa_batch.default_workers() 相同（最多 4 个），不在启动时导入处理模块
+        self.spinBox_workers.setValue(max(1, min(os.cpu_count() or 1, 4)))
+        self.spinBox_workers.setToolTip(
+            "Number of files processed at the same time in separate worker processes.\n"
+            "- 1 processes the files one after another\n"
+            "- Each file is independent, so more workers finish large batches faster\n"
+            "- Each worker holds a whole file in memory, so the default is at most 4"
+        )
+        workers_layout.addWidget(workers_label)
+        workers_layout.addWidget(self.spinBox_workers)
+        self.checkBox_pipeline = QCheckBox("Overlap Stages")
+        self.checkBox_pipeline.setChecked(False)
+        self.checkBox_pipeline.setToolTip(
+            "With 1 worker, read the next file and write the previous file's results\n"
+            "while the current file is being marked (uses one extra writer process).\n"
+            "Results are the same; needs more than one CPU."
+        )
+        workers_layout.addWidget(self.checkBox_pipeline)
+        workers_layout.addSpacing(20)
+        # Output format
+        format_label = QLabel("Output Format:")
+        self.comboBox_output_format = QComboBox()
+        # 其余格式在处理模块加载后添加，见 _on_preload_finished
+        self.comboBox_output_format.addItem("xlsx - Excel workbook", "xlsx")
+        self.comboBox_output_format.setToolTip(
+            "Format of the MARKED_* and GROUPED_* result files.\n"
+            "- xlsx: Excel workbook, one sheet per molecule (default)\n"
+            "- xlsx-stream: the same workbook written row by row with constant memory\n"
+            "- parquet/feather/csv: one table each, much faster to write and read in pipelines"
+        )
+        workers_layout.addWidget(format_label)
+        workers_layout.addWidget(self.comboBox_output_format)
+        workers_layout.addStretch()
+        layout.addLayout(workers_layout)
+        # Run report
+        report_layout = QHBoxLayout()
+        self.checkBox_save_report = QCheckBox("Save Run Report")
+        self.checkBox_save_report.setChecked(False)
+        self.checkBox_save_report.setToolTip(
+            "Save REPORT_*.json next to the results with the time, rows and peak memory\n"
+            "of each processing phase and the time spent on each molecule."
+        )
+        self.checkBox_profile = QCheckBox("Profile (cProfile)")
+        self.checkBox_profile.setChecked(False)
+        self.checkBox_profile.setToolTip(
+            "Record a cProfile profile of the processing and save it as PROFILE_*.prof.\n"
+            "Slows processing down; use it to find out where a slow batch spends its time."
+        )
+        self.checkBox_consolidate = QCheckBox("Consolidated Output")
+        self.checkBox_consolidate.setChecked(False)
+        self.checkBox_consolidate.setToolTip(
+            "Also save the marked results of every file in one CONSOLIDATED_MARKED_<time> file\n"
+            "with a Source File column, a combined All table and one table per molecule\n"
+            "spanning all files. Each file is appended as soon as it is processed."
+        )
+        self.checkBox_compact = QCheckBox("Compact Memory")
+        self.checkBox_compact.setChecked(False)
+        self.checkBox_compact.setToolTip(
+            "Keep the marked tables in a compact form while processing: repeated labels are\n"
+            "stored as categories and standard ranges as numbers, formatted only when written.\n"
+            "The output files are the same; use it for very large exports."
+        )
+        report_layout.addWidget(self.checkBox_save_report)
+        report_layout.addWidget(self.checkBox_profile)
+        report_layout.addWidget(self.checkBox_consolidate)
+        self.checkBox_preview = QCheckBox("Preview Results")
+        self.checkBox_preview.setChecked(False)
+        self.checkBox_preview.setToolTip(
+            "Keep the marked table of each file in memory after processing, so it can be\n"
+            "browsed, filtered and sorted with Preview Results in the result window\n"
+            "without opening the output files."
+        )
+        report_layout.addWidget(self.checkBox_compact)
+        report_layout.addWidget(self.checkBox_preview)
+        report_layout.addStretch()
+        layout.addLayout(report_layout)
         return group
 
     def on_pushButton_open_files(self):
@@ -360,7 +603,10 @@ class SCFA_Marker(QMainWindow):
         if save_dir_path:
             self.lineEdit_save_dir_path.setText(save_dir_path)
 
-    def show_result_dialog(self, title, content):
+    def show_result_dialog(self, title, content, frames=None):
+        """
+        显示结果文本；frames（文件名 -> 标记结果）不为空时可打开结果预览
+        """
         dialog = QDialog(self)
         dialog.setWindowTitle(title)
         dialog.resize(700, 500)
@@ -369,11 +615,23 @@ class SCFA_Marker(QMainWindow):
         text_edit.setReadOnly(True)
         text_edit.setPlainText(content)
         layout.addWidget(text_edit)
+        button_layout = QHBoxLayout()
+        if frames:
+            preview_btn = QPushButton("Preview Results")
+            preview_btn.clicked.connect(lambda: self.show_preview(frames, dialog))
+            button_layout.addWidget(preview_btn)
         btn = QPushButton("OK")
         btn.clicked.connect(dialog.accept)
-        layout.addWidget(btn)
+        button_layout.addWidget(btn)
+        layout.addLayout(button_layout)
         dialog.exec_()
 
+    def show_preview(self, frames, parent=None):
+        """在表格中浏览标记结果"""
+        import scfa_viewer
+        viewer = scfa_viewer.ResultViewer(frames, parent or self)
+        viewer.exec_()
+
     def on_pushButton_run(self):
         # 支持多文件批量处理
         file_path_text = self.lineEdit_file_path.text()
@@ -381,33 +639,184 @@ class SCFA_Marker(QMainWindow):
         self.save_path = self.lineEdit_save_dir_path.text()
         if not self._validate_inputs(file_paths):
             return
+        params = self._collect_params()
+        self._start_preflight(file_paths, params)
+
+    def _start_preflight(self, file_paths, params):
+        """在后台线程中检查所有文件，完成后由 _on_preflight_finished 决定是否开始处理"""
+        self._preflight_args = (file_paths, params)
+        self.progress = QProgressDialog(f"Checking {len(file_paths)} file(s)...", "Cancel", 0, 0, self)
+        self.progress.setWindowTitle("Pre-flight check")
+        self.progress.setWindowModality(Qt.WindowModal)
+        self.progress.setMinimumDuration(0)
+        self.progress.setAutoClose(False)
+        self.progress.setValue(0)
+        # 检查完成前不能再次开始
+        self.progress.canceled.connect(self.progress.close)
+
+        self.preflight_thread = QThread(self)
+        self.preflight_worker = PreflightWorker(file_paths, params)
+        self.preflight_worker.moveToThread(self.preflight_thread)
+        self.preflight_thread.started.connect(self.preflight_worker.run)
+        self.preflight_worker.finished.connect(self._on_preflight_finished)
+        self.preflight_worker.finished.connect(self.preflight_thread.quit)
+        self.preflight_thread.finished.connect(self.preflight_worker.deleteLater)
+        self.run_button.setEnabled(False)
+        self.preflight_thread.start()
+
+    def _on_preflight_finished(self, checks, text):
+        # 检查本身不能中断，取消时丢弃结果
+        canceled = self.progress.wasCanceled()
+        self.progress.close()
+        self.run_button.setEnabled(True)
+        if canceled or not self._confirm_preflight(checks, text):
+            return
+        self._start_batch(*self._preflight_args)
+
+    def _start_batch(self, file_paths, params):
+        workers = min(self.spinBox_workers.value(), len(file_paths))
+        # 每个文件内部的处理阶段，用于计算进度条
+        self._batch_stages = ["mark", "write_marked"]
+        if params.split_by_group:
+            self._batch_stages = ["mark", "group", "write_marked", "write_grouped"]
+        self._batch_params = params
+        self._batch_file_paths = file_paths
+        self._batch_files_done = 0
+        # 正在处理的文件 -> 已完成的比例；多个工作进程时同时有多个文件
+        self._batch_file_fractions = {}
+
+        self.progress = QProgressDialog("Processing files...", "Cancel", 0, len(file_paths) * 100, self)
+        self.progress.setWindowTitle("Processing progress")
+        self.progress.setWindowModality(Qt.WindowModal)
+        self.progress.setMinimumDuration(0)
+        self.progress.setAutoClose(False)
+        self.progress.setValue(0)
+        self.progress.setLabelText(f"Processing {len(file_paths)} file(s) with {workers} worker(s)...")
+
+        # 在后台线程中处理，界面保持响应
+        self.batch_thread = QThread(self)
+        self.batch_worker = BatchWorker(file_paths, self.save_path, params, workers, self._get_prepared_cache(),
+                                        pipeline=self.checkBox_pipeline.isChecked(),
+                                        keep_frames="marked" if self.checkBox_preview.isChecked() else False)
+        self.batch_worker.moveToThread(self.batch_thread)
+        self.batch_thread.started.connect(self.batch_worker.run)
+        self.batch_worker.file_progress.connect(self._on_batch_file_progress)
+        self.batch_worker.file_finished.connect(self._on_batch_file_finished)
+        self.batch_worker.finished.connect(self._on_batch_finished)
+        self.batch_worker.finished.connect(self.batch_thread.quit)
+        self.batch_thread.finished.connect(self.batch_worker.deleteLater)
+        # 直接调用，不经过工作线程的事件循环
+        self.progress.canceled.connect(self.batch_worker.cancel_token.cancel)
+        self.run_button.setEnabled(False)
+        self.batch_thread.start()
+
+    def _on_batch_file_progress(self, file_path, stage, done, total):
+        """文件内部进度：每个分子/sheet 更新一次"""
+        if self.progress.wasCanceled():
+            return
+        stage_names = {
+            "mark": "Marking molecule",
+            "group": "Splitting groups for molecule",
+            "write_marked": "Writing MARKED sheet",
+            "write_grouped": "Writing GROUPED sheet",
+        }
+        n_files = len(self._batch_file_paths)
+        index = self._batch_files_done
+        if stage == "save" and not total:
+            # 保存工作簿不能中断，也没有进度；没有其他文件在处理时显示为忙碌状态
+            if not self._batch_file_fractions.keys() - {file_path}:
+                self.progress.setRange(0, 0)
+            self.progress.setLabelText(
+                f"Processing file {index + 1}/{n_files}: {os.path.basename(file_path)}\n"
+                "Saving workbook (cannot be canceled until it is saved)..."
+            )
+            return
+        self.progress.setRange(0, n_files * 100)
+        stage_index = self._batch_stages.index(stage) if stage in self._batch_stages else 0
+        self._batch_file_fractions[file_path] = (stage_index + done / max(total, 1)) / len(self._batch_stages)
+        fraction = sum(self._batch_file_fractions.values())
+        self.progress.setValue(min(index * 100 + int(fraction * 100), n_files * 100 - 1))
+        self.progress.setLabelText(
+            f"Processing file {index + 1}/{n_files}: {os.path.basename(file_path)}\n"
+            f"{stage_names.get(stage, stage)} {done}/{total}"
+        )
+
+    def _on_batch_file_finished(self, done, total, file_path):
+        self._batch_files_done = done
+        self._batch_file_fractions.pop(file_path, None)
+        if self.progress.wasCanceled():
+            return
+        fraction = sum(self._batch_file_fractions.values())
+        self.progress.setRange(0, total * 100)
+        self.progress.setValue(min(done * 100 + int(fraction * 100), total * 100))
+        self.progress.setLabelText(f"Processed file {done}/{total}: {os.path.basename(file_path)}")
+
+    def _on_batch_finished(self, items, consolidated_msg=""):
+        params = self._batch_params
         all_msgs = []
-        progress = QProgressDialog("Processing files...", "Cancel", 0, len(file_paths), self)
-        progress.setWindowTitle("Processing progress")
-        progress.setWindowModality(Qt.WindowModal)
-        progress.setMinimumDuration(0)
-        for i, file_path in enumerate(file_paths):
-            progress.setValue(i)
-            progress.setLabelText(f"Processing file {i+1}/{len(file_paths)}: {os.path.basename(file_path)}")
-            QApplication.processEvents()
-            if progress.wasCanceled():
-                all_msgs.append("User canceled batch processing.")
-                break
-            self.filename = file_path
-            try:
-                msg = self.process_file(batch_mode=True)
-                file_msg = f"Processed file: {os.path.basename(file_path)}\n" + msg
-                all_msgs.append(file_msg)
-            except Exception as e:
-                all_msgs.append(f"Processed file: {os.path.basename(file_path)}\nFile processing failed: {str(e)}")
-        progress.setValue(len(file_paths))
-        self.show_result_dialog('Batch processing completed', '\n\n'.join(all_msgs))
+        self.faild_group = []
+        # 结果预览：文件名 -> 标记结果，只在结果窗口打开期间保留
+        frames = {}
+        for item in items:
+            if item.canceled:
+                continue
+            all_msgs.append(self._format_batch_item(item, params))
+            if item.result:
+                self.faild_group.extend(item.result.failed_groups)
+                if self.checkBox_preview.isChecked() and "All" in item.result.marked:
+                    name = os.path.basename(item.file_path)
+                    if name in frames:
+                        name = item.file_path
+                    frames[name] = item.result.marked["All"]
+        if consolidated_msg:
+            all_msgs.insert(0, consolidated_msg)
+        if any(item.canceled for item in items):
+            all_msgs.append("User canceled batch processing.")
+        self.progress.setValue(self.progress.maximum())
+        self.progress.close()
+        self.run_button.setEnabled(True)
+        self.show_result_dialog('Batch processing completed', '\n\n'.join(all_msgs), frames)
+
+    def closeEvent(self, event):
+        # 关闭窗口时停止后台处理
+        thread = getattr(self, "batch_thread", None)
+        # finished -> quit 是排队连接，主线程在这里阻塞时不会执行，因此直接调用 quit()
+        if thread is not None and thread.isRunning():
+            self.batch_worker.cancel()
+            thread.quit()
+            thread.wait()
+        # 预加载和文件检查很快结束，等待即可
+        for name in ("preload_thread", "preflight_thread"):
+            other = getattr(self, name, None)
+            if other is not None and other.isRunning():
+                other.quit()
+                other.wait()
+        super().closeEvent(event)
+
+    def _get_prepared_cache(self):
+        if self.prepared_cache is None:
+            import scfa_cache
+            self.prepared_cache = scfa_cache.PreparedCache()
+        return self.prepared_cache
+
+    def _format_batch_item(self, item, params):
+        """生成单个文件的结果文本"""
+        file_msg = f"Processed file: {os.path.basename(item.file_path)}\n"
+        import scfa_engine
+        if item.result:
+            return (file_msg + scfa_engine.format_message(item.result, params)
+                    + "\n" + scfa_report.format_report(item.result.report))
+        return file_msg + (
+            f"Error occurred during processing:\n{item.error}\n\n"
+            f"Detailed error information:\n{item.traceback}"
+        )
 
     def on_split_group_changed(self, state):
         """处理分组选项状态改变事件"""
         is_enabled = state == Qt.Checked
         self.lineEdit_group_list.setEnabled(is_enabled)
         self.lineEdit_control_group.setEnabled(is_enabled)
+        self.comboBox_group_layout.setEnabled(is_enabled)
         
         # 更新提示文本
         if is_enabled:
@@ -447,129 +856,58 @@ class SCFA_Marker(QMainWindow):
                 return False
         return True
 
+    def _confirm_preflight(self, checks, text):
+        """
+        显示批量处理前的检查结果：有错误时不开始，只有警告时询问是否继续
+        Args:
+            checks (list): PreflightWorker 返回的 FileCheck 列表
+            text (str): format_checks 的文本
+        Returns:
+            bool: 是否开始处理
+        """
+        summary = text.splitlines()[-1]
+        if any(not check.ok for check in checks):
+            box = QMessageBox(QMessageBox.Critical, 'Pre-flight check failed',
+                              summary + "\n\nThe batch was not started.", QMessageBox.Ok, self)
+            box.setDetailedText(text)
+            box.exec_()
+            return False
+        if any(check.warnings for check in checks):
+            box = QMessageBox(QMessageBox.Warning, 'Pre-flight warnings', summary,
+                              QMessageBox.Yes | QMessageBox.No, self)
+            box.setInformativeText("Start processing anyway?")
+            box.setDetailedText(text)
+            box.setDefaultButton(QMessageBox.Yes)
+            return box.exec_() == QMessageBox.Yes
+        return True
+
+    def _collect_params(self):
+        """从界面控件读取处理参数"""
+        import scfa_engine
+        return scfa_engine.MarkerParams(
+            dilution=self.doubleSpinBox_dilution.value(),
+            min_coeff=self.doubleSpinBox_mini_coe_value.value(),
+            max_coeff=self.doubleSpinBox_max_coe_value.value(),
+            split_by_group=self.checkBox_split_by_group.isChecked(),
+            group_list=self._get_group_list(),
+            control_group=self.lineEdit_control_group.text(),
+            group_layout=self.comboBox_group_layout.currentData(),
+            output_formats=[self.comboBox_output_format.currentData()],
+            save_report=self.checkBox_save_report.isChecked(),
+            profile=self.checkBox_profile.isChecked(),
+            consolidate=self.checkBox_consolidate.isChecked(),
+            compact=self.checkBox_compact.isChecked(),
+            target_unit=self.comboBox_target_unit.currentData(),
+        )
+
     def process_file(self, batch_mode=False):
         try:
-            df = pd.read_csv(self.filename)
-            # 设置min_val和max_val的系数
-            min_coeff = self.doubleSpinBox_mini_coe_value.value()
-            max_coeff = self.doubleSpinBox_max_coe_value.value()
-            dilution = self.doubleSpinBox_dilution.value()
-
-            # only keep 6 columns
-            df = df[['Molecule', "Replicate", 'Quantification', 'Sample Type', 'Analyte Concentration',
-                'Exclude From Calibration']]
-            # make all str in 'Exclude From Calibration as lower case, convert to str first
-            df['Exclude From Calibration'] = df['Exclude From Calibration'].astype(str).str.lower()
-
-            group_list = df["Molecule"].value_counts().index.tolist()
-            group_list = list(set(group_list))
-            group_list.sort()
-            print(f'Start processing file: {os.path.basename(self.filename)}')
-            print(f'total molecules:{len(group_list)}')
-            # print(group_list)            
-            group_dict = {}
-
-            # 记录处理结果
-            processed_results = {
-                "success": [],
-                "failed": []
-            }
-
-            for group in group_list:
-                try:
-                    # print(f'processing {group}...')
-                    dft = df[df["Molecule"] == group].copy()
-                    dft_i = dft[(dft["Sample Type"] == "Standard") & (dft["Exclude From Calibration"] == "false")]
-                    min_val = dft_i["Analyte Concentration"].min()
-                    max_val = dft_i["Analyte Concentration"].max()
-                    # 标准范围（原始）
-                    min_val_str = int(min_val)  if min_val.is_integer() else round(min_val, 2)
-                    max_val_str = int(max_val)  if max_val.is_integer() else round(max_val, 2)
-                    dft["Standard Range"] = f"{min_val_str} - {max_val_str}"
-
-                    dft[["Quantification", "Unit"]] = dft["Quantification"].str.split(' ', expand=True)
-                    dft["Quantification"] = pd.to_numeric(dft["Quantification"], errors='coerce')
-
-                    # 稀释修正后列，仅当dilution!=1时生成
-                    if dilution != 1.0:
-                        dft["Quantification(diluted_adjusted)"] = dft["Quantification"] * dilution
-                        min_val_diluted = min_val * dilution
-                        max_val_diluted = max_val * dilution
-                        min_val_str_dil = int(min_val_diluted) if min_val_diluted.is_integer() else round(min_val_diluted, 2)
-                        max_val_str_dil = int(max_val_diluted) if max_val_diluted.is_integer() else round(max_val_diluted, 2)
-                        dft["Standard Range(diluted_adjusted)"] = f"{min_val_str_dil} - {max_val_str_dil}"
-
-                    min_val_status = min_val * min_coeff
-                    max_val_status = max_val * max_coeff
-
-                    # 筛选除了 Standard 之外的样本
-                    dft = dft[dft["Sample Type"] != "Standard"]
-                    dft.drop(columns=["Sample Type", "Analyte Concentration", "Exclude From Calibration"], inplace=True)
-
-                    def status_func(x):
-                        if pd.isna(x):
-                            return ""
-                        if x < min_val_status:
-                            return "Low"
-                        elif x > max_val_status:
-                            return "High"
-                        else:
-                            return "In"
-                    dft["Standard"] = dft["Quantification"].apply(lambda x: " " if status_func(x) == "In" else "*")
-                    dft["Standard Status"] = dft["Quantification"].apply(status_func)
-
-                    group_dict[group] = dft
-                    processed_results["success"].append(group)
-                except Exception as e:
-                    print(f"Processing {group} failed: {str(e)}")
-                    processed_results["failed"].append(group)
-
-            # 将字典中的数据框合并为一个数据框, and save to dict named "All"
-            group_dict["All"] = pd.concat(group_dict.values(), ignore_index=True)
-            # save to all in in excel, key is the sheet name, all is the first sheet
-            original_name = os.path.basename(self.filename).split(".")[0]
-            save_path_marked = os.path.join(self.save_path, f"MARKED_{original_name}.xlsx")
-            with pd.ExcelWriter(save_path_marked) as writer:
-                group_dict["All"].to_excel(writer, sheet_name="All", index=False)
-                for key in group_dict.keys():
-                    if key != "All":
-                        group_dict[key].to_excel(writer, sheet_name=key, index=False)
-            
-            saved_files = [save_path_marked]
-
-            group_processing_results = {"success": [], "failed": []}
-            save_path_grouped = None
-            if self.checkBox_split_by_group.isChecked():
-                try:
-                    res_dict = self.process_group(group_dict, dilution)
-                    if res_dict:
-                        save_path_grouped = os.path.join(self.save_path, f"GROUPED_{original_name}.xlsx")
-                        with pd.ExcelWriter(save_path_grouped) as writer:
-                            for sheet_name, dft in res_dict.items():
-                                # set index name to replicate
-                                dft.index.name = "Replicate"
-                                dft.to_excel(writer, sheet_name=sheet_name, index=True)
-                        group_processing_results["success"].append("Group processing")
-                        saved_files.append(save_path_grouped)
-                except Exception as e:
-                    group_processing_results["failed"].append(f"Group processing: {str(e)}")
-
-            msg = f"File processing completed.\n"
-            msg += "Saved files:\n"
-            for f in saved_files:
-                msg += f"{f}\n"
-            msg += "\n"
-            if processed_results["success"]:
-                msg += f"Successfully processed molecules ({len(processed_results['success'])}):\n"
-                msg += ", ".join(processed_results["success"]) + "\n\n"
-            if processed_results["failed"]:
-                msg += f"Failed molecules ({len(processed_results['failed'])}):\n"
-                msg += ", ".join(processed_results["failed"]) + "\n\n"
-            if self.checkBox_split_by_group.isChecked():
-                if group_processing_results["success"]:
-                    msg += "Group processing succeeded\n"
-                if group_processing_results["failed"]:
-                    msg += f"Group processing failed:\n{group_processing_results['failed'][0]}\n"
+            params = self._collect_params()
+            import scfa_engine
+            result = scfa_engine.process_file(self.filename, self.save_path, params,
+                                              cache=self._get_prepared_cache())
+            self.faild_group = result.failed_groups
+            msg = scfa_engine.format_message(result, params) + "\n" + scfa_report.format_report(result.report)
             if batch_mode:
                 return msg
             else:
@@ -582,113 +920,11 @@ class SCFA_Marker(QMainWindow):
                 return error_msg
             else:
                 QMessageBox.critical(self, 'Error', error_msg)
-         
-
-    def process_group(self, group_dict, dilution=1.0):
-        """
-        处理分组数据，将数据按照不同的组别进行拆分和重组
-        Args:
-            group_dict (dict): 包含所有分组数据的字典
-            dilution (float): 稀释倍数
-        Returns:
-            dict: 处理后的分组数据字典
-        """
-        # 获取控制组和组别列表
-        control_group = self.lineEdit_control_group.text()
-        group_list = self._get_group_list()
-        if not group_list:
-            print("No group list input, skip group processing")
-            return {}
-            
-        result_dict = {}
-        self.faild_group = []
-        for sheet_name, df in group_dict.items():
-            if sheet_name == 'All':
-                continue
-            print(f"Processing sheet: {sheet_name}")
-            processed_data = self._process_sheet_data(df, group_list, control_group, sheet_name, dilution)
-            if processed_data:
-                result_dict.update(processed_data)
-        return result_dict
 
     def _get_group_list(self):
         """获取并处理组别列表"""
-        group_list_str = self.lineEdit_group_list.text()
-        if not group_list_str or group_list_str == "value1, value2, value3":
-            return []
-            
-        return [x.strip() for x in group_list_str.split(",")]
-    
-    def _process_sheet_data(self, df, group_list, control_group, sheet_name, dilution=1.0):
-        """
-        处理单个sheet的数据
-        Args:
-            df (DataFrame): 原始数据框
-            group_list (list): 组别列表
-            control_group (str): 控制组名称（可选）
-            sheet_name (str): 当前sheet名称
-            dilution (float): 稀释倍数
-        Returns:
-            dict: 处理后的数据字典
-        """
-        result_dict = {}
-        df = df.copy()
-        # 处理Quantification列
-        df.loc[df["Standard Status"] == "Out", "Quantification"] = ""
-        df["Quantification"] = pd.to_numeric(df["Quantification"], errors='coerce') * dilution
-        df = df[["Replicate", "Quantification"]]
-        for individual in group_list:
-            processed_data = self._process_individual_data(df, individual, control_group)
-            if processed_data is not None:
-                result_dict[f"{sheet_name}_{individual}"] = processed_data
-            else:
-                self.faild_group.append(individual)
-        return result_dict
-    
-    def _process_individual_data(self, df, individual, control_group):
-        """
-        处理单个组别的数据
-        
-        Args:
-            df (DataFrame): 原始数据框
-            individual (str): 组别名称
-            control_group (str): 控制组名称（可选）
-            
-        Returns:
-            DataFrame: 处理后的数据框，如果组别不存在则返回None
-        """
-        # 筛选特定组别的数据
-        df_individual = df[df["Replicate"].str.contains(individual)].copy()
-        if df_individual.empty:
-            print(f"Group {individual} not found in data")
-            return None
-            
-        # 分割Replicate列
-        split_df = df_individual["Replicate"].str.split(f'_{individual}_', expand=True)
-        df_individual['Group'] = split_df[0]
-        df_individual['Replicate'] = split_df[1]
-        df_individual['Individual'] = individual
-        
-        # 处理Group列
-        df_individual["Group"] = df_individual["Group"].str.replace("d_", "") + "_" + df_individual['Individual']
-        
-        # 转换为透视表
-        df_pivot = df_individual.pivot(
-            index='Replicate',
-            columns='Group',
-            values='Quantification'
-        )
-        df_pivot.index.name = None
-        
-        # 如果有控制组，则按控制组优先排序
-        if control_group:
-            df_pivot = df_pivot[sorted(
-                df_pivot.columns,
-                key=lambda x: control_group in x if x else False,
-                reverse=True
-            )]
-        
-        return df_pivot
+        import scfa_engine
+        return scfa_engine.parse_group_list(self.lineEdit_group_list.text())
 
     def _auto_set_save_dir(self, file_path):
         # 支持多文件时，只取第一个文件
@@ -703,6 +939,8 @@ class SCFA_Marker(QMainWindow):
         dialog.exec_()
 
 if __name__ == '__main__':
+    # 打包为可执行文件时，工作进程需要 freeze_support
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = SCFA_Marker()
     window.show()
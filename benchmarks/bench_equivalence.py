@@ -0,0 +1,353 @@
+"""
+差异对比：原始实现与优化实现的结果逐格比较，并报告加速比
+
+Runs the reference implementation (read_input_legacy, mark_dataframe_legacy,
+process_group_legacy) and one or more alternative engines on the same inputs
+and compares the tables they would write, cell by cell:
+
+    MARKED    sheet order ("All" first), columns, then every cell after
+              display_frame (so the "Standard Range" strings of the compact
+              mode are compared as written)
+    GROUPED   sheet order, columns and their name, the Replicate index and
+              every cell
+
+Missing values are equal to each other and to nothing else; other cells must
+be exactly equal, and each column must hold the same kind of value (an int
+column is written as "5", a float column as "5.0"). When the reference fails
+on an input, the engine must fail with the same message.
+
+Inputs are CSV files given on the command line (real exports), synthetic
+exports from benchmarks/synth.py (--synthetic) and two edge-case fixtures
+(unparseable and three-part Quantification values, integer values, missing
+molecules and replicates, molecules without standards, Replicate values
+without a group; the second one makes group splitting fail, so the error
+messages are compared). Like process_frame, a grouping error is recorded
+rather than failing the file. For every input and engine it prints whether the results are
+identical and the speedup over the reference (best of --repeat runs, reading
+the CSV included). The exit code is 1 when any engine differs.
+
+Engines:
+    optimized   process_frame with the default parameters
+    compact     process_frame with compact=True
+    float32     process_frame with compact=True, float32=True
+    MODULE:FUNC any function FUNC(path, params) -> (marked, grouped), or
+                (marked, grouped, group_failed) like FileResult
+
+Usage:
+    python benchmarks/bench_equivalence.py
+    python benchmarks/bench_equivalence.py export1.csv export2.csv --synthetic medium --repeat 3
+    python benchmarks/bench_equivalence.py --engine optimized --engine my_engine:run --json equivalence.json
+"""
+import argparse
+import contextlib
+import dataclasses
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scfa_engine  # noqa: E402
+from synth import make_skyline_export, make_skyline_frame  # noqa: E402
+
+# 合成输入的规模和特点，参数见 synth.make_skyline_frame
+SYNTHETIC = {
+    "small": {"molecules": 20, "replicates": 6},
+    "units": {"molecules": 30, "replicates": 10, "units": ["uM", "ng/mL", "nM"]},
+    "missing": {"molecules": 30, "replicates": 10, "missing_rate": 0.3, "exclude_rate": 0.4},
+    "prefixes": {"molecules": 40, "replicates": 12, "prefixes": ["Day1", "Day2", "Day3"],
+                 "groups": ["WT", "KO", "HET"]},
+    "medium": {"molecules": 200, "replicates": 50},
+    "large": {"molecules": 400, "replicates": 200, "prefixes": ["Day1", "Day2"]},
+}
+DEFAULT_SYNTHETIC = ["small", "units", "missing", "prefixes", "medium"]
+# 每个表最多列出的不同单元格
+MAX_REPORTED = 5
+
+
+def run_reference(path, params):
+    """原始实现；与 process_frame 相同，分组失败时不作为文件失败，记录错误信息"""
+    marked, _ = scfa_engine.mark_dataframe_legacy(scfa_engine.read_input_legacy(path), params)
+    grouped, group_failed = {}, []
+    if params.split_by_group:
+        try:
+            grouped, _ = scfa_engine.process_group_legacy(marked, params)
+        except Exception as e:
+            group_failed.append(f"Group processing: {str(e)}")
+    return marked, grouped, group_failed
+
+
+def _process_frame(**overrides):
+    def run(path, params):
+        if overrides:
+            params = dataclasses.replace(params, **overrides)
+        result = scfa_engine.process_frame(path, params)
+        return result.marked, result.grouped, result.group_failed
+    return run
+
+
+ENGINES = {
+    "optimized": _process_frame(),
+    "compact": _process_frame(compact=True),
+    "float32": _process_frame(compact=True, float32=True),
+}
+
+
+def resolve_engine(name):
+    """内置引擎名称或 MODULE:FUNC"""
+    if name in ENGINES:
+        return ENGINES[name]
+    if ":" not in name:
+        raise ValueError(f"Unknown engine: {name}. Available: {', '.join(ENGINES)} or MODULE:FUNC")
+    module, func = name.split(":", 1)
+    return getattr(importlib.import_module(module), func)
+
+
+def edge_fixture(path, nan_replicate=False):
+    """
+    生成包含边界情况的输入文件
+    Args:
+        nan_replicate (bool): 一个样本的 Replicate 为空（分组失败，比较错误信息）
+    """
+    df = make_skyline_frame(molecules=12, replicates=5, groups=["WT", "KO"], units=["uM"], seed=7)
+    molecules = list(dict.fromkeys(df["Molecule"]))
+    unknown = df["Sample Type"] == "Unknown"
+    quantification = df["Quantification"].to_numpy(dtype=object)
+
+    def rows(k, mask=None):
+        selected = (df["Molecule"] == molecules[k]).to_numpy()
+        return selected & mask.to_numpy() if mask is not None else selected
+
+    # 整数数值（Quantification 为整数列）
+    for k in (0, 1):
+        quantification[rows(k)] = [f"{i} uM" for i in range(rows(k).sum())]
+    # 一个分子中有整数也有小数
+    quantification[np.flatnonzero(rows(2, unknown))[:3]] = ["1 uM", "2 uM", "3 uM"]
+    # 无法解析的数值和三段的 Quantification（分子失败）
+    quantification[np.flatnonzero(rows(3, unknown))[:2]] = ["abc uM", "1,5 uM"]
+    quantification[np.flatnonzero(rows(4, unknown))[:1]] = ["1.0 uM extra"]
+    # 只有数值没有单位（分子失败）
+    quantification[rows(5)] = [f"{i}.5" for i in range(rows(5).sum())]
+    df["Quantification"] = quantification
+    # 没有标准品、标准品全部排除
+    df.loc[rows(6) & (df["Sample Type"] == "Standard").to_numpy(), "Sample Type"] = "Unknown"
+    df.loc[rows(7) & (df["Sample Type"] == "Standard").to_numpy(), "Exclude From Calibration"] = "TRUE"
+    # Exclude From Calibration 大小写和缺失值
+    df.loc[rows(8), "Exclude From Calibration"] = "false"
+    df.loc[np.flatnonzero(rows(9))[:2], "Exclude From Calibration"] = np.nan
+    # 缺失的 Replicate（标准品不参与分组）、不含 "_组别_" 的 Replicate 和缺失的 Molecule
+    df.loc[np.flatnonzero(rows(10, ~unknown))[:1], "Replicate"] = np.nan
+    if nan_replicate:
+        df.loc[np.flatnonzero(rows(10, unknown))[:1], "Replicate"] = np.nan
+    df.loc[np.flatnonzero(rows(11, unknown))[:2], "Replicate"] = ["d_Day1_WT", "KO_only"]
+    extra = df.iloc[:3].copy()
+    extra["Molecule"] = np.nan
+    pd.concat([df, extra], ignore_index=True).to_csv(path, index=False)
+
+
+def _value_kind(series):
+    """写出时值的类型：整数、浮点数、布尔值或文本（category 按类别的类型）"""
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        dtype = dtype.categories.dtype
+    kind = getattr(dtype, "kind", "O")
+    return {"u": "i", "U": "O", "S": "O"}.get(kind, kind)
+
+
+def _show(value):
+    return "NaN" if pd.isna(value) else repr(value)
+
+
+def compare_table(name, ref, other, with_index):
+    """
+    逐格比较两个表
+    Returns:
+        tuple: (不同的单元格数, 说明列表)
+    """
+    notes = []
+    if list(ref.columns) != list(other.columns):
+        return 1, [f"{name}: columns differ: {list(ref.columns)} vs {list(other.columns)}"]
+    if len(ref) != len(other):
+        return 1, [f"{name}: {len(ref)} rows vs {len(other)} rows"]
+    columns = [(col, ref[col], other[col]) for col in ref.columns]
+    if with_index:
+        if ref.columns.name != other.columns.name:
+            notes.append(f"{name}: column name {ref.columns.name!r} vs {other.columns.name!r}")
+        columns.insert(0, ("(index)", ref.index.to_series(), other.index.to_series()))
+    n_diff = len(notes)
+    for col, a, b in columns:
+        if _value_kind(a) != _value_kind(b):
+            n_diff += 1
+            notes.append(f"{name}[{col}]: dtype {a.dtype} vs {b.dtype}")
+            continue
+        missing_a, missing_b = a.isna().to_numpy(), b.isna().to_numpy()
+        values_a, values_b = a.to_numpy(dtype=object), b.to_numpy(dtype=object)
+        equal = missing_a & missing_b
+        both = ~missing_a & ~missing_b
+        equal[both] = values_a[both] == values_b[both]
+        rows = np.flatnonzero(~equal)
+        n_diff += len(rows)
+        for row in rows[:MAX_REPORTED]:
+            notes.append(f"{name}[{col}] row {row}: {_show(values_a[row])} vs {_show(values_b[row])}")
+        if len(rows) > MAX_REPORTED:
+            notes.append(f"{name}[{col}]: ... {len(rows) - MAX_REPORTED} more")
+    return n_diff, notes
+
+
+def compare_results(ref, other):
+    """
+    比较两个引擎的 (marked, grouped)，按写出的形式
+    Returns:
+        tuple: (不同的单元格数, 说明列表, 比较的单元格数)
+    """
+    n_diff, notes, cells = 0, [], 0
+    failed_a = list(ref[2]) if len(ref) > 2 else []
+    failed_b = list(other[2]) if len(other) > 2 else []
+    if failed_a != failed_b:
+        n_diff += 1
+        notes.append(f"group errors: {failed_a} vs {failed_b}")
+    elif failed_a:
+        notes.append(f"group errors (both): {failed_a}")
+    for kind, tables_a, tables_b in (("MARKED", *[r[0] for r in (ref, other)]),
+                                     ("GROUPED", *[r[1] for r in (ref, other)])):
+        names_a, names_b = list(tables_a.keys()), list(tables_b.keys())
+        if kind == "MARKED":
+            # write_marked 把 "All" 放在第一个 sheet
+            names_a = ["All"] + [n for n in names_a if n != "All"]
+            names_b = ["All"] + [n for n in names_b if n != "All"]
+        if names_a != names_b:
+            n_diff += 1
+            notes.append(f"{kind}: sheet order differs: {names_a} vs {names_b}")
+        for sheet in names_a:
+            if sheet not in tables_b:
+                continue
+            a, b = tables_a[sheet], tables_b[sheet]
+            if kind == "MARKED":
+                a, b = scfa_engine.display_frame(a), scfa_engine.display_frame(b)
+            cells += a.size
+            diff, sheet_notes = compare_table(f"{kind}/{sheet}", a, b, with_index=kind == "GROUPED")
+            n_diff += diff
+            notes.extend(sheet_notes)
+    return n_diff, notes, cells
+
+
+def timed(func, path, params, repeat):
+    """运行 repeat 次，返回最后一次的结果（或异常）和最短耗时"""
+    best = float("inf")
+    outcome = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                outcome = func(path, params)
+        except Exception as e:
+            outcome = e
+        best = min(best, time.perf_counter() - start)
+    return outcome, best
+
+
+def check_input(label, path, params, engines, repeat):
+    """对一个输入运行原始实现和各引擎"""
+    ref, ref_seconds = timed(run_reference, path, params, repeat)
+    results = []
+    for name in engines:
+        outcome, seconds = timed(resolve_engine(name), path, params, repeat)
+        entry = {"input": label, "engine": name, "reference_seconds": round(ref_seconds, 4),
+                 "engine_seconds": round(seconds, 4), "speedup": round(ref_seconds / max(seconds, 1e-9), 2)}
+        if isinstance(ref, Exception) or isinstance(outcome, Exception):
+            same = type(ref) is type(outcome) and str(ref) == str(outcome)
+            entry.update(identical=same, cells=0, different_cells=0 if same else 1,
+                         notes=[f"reference: {ref!r}" if isinstance(ref, Exception) else "reference: ok",
+                                f"engine: {outcome!r}" if isinstance(outcome, Exception) else "engine: ok"])
+        else:
+            n_diff, notes, cells = compare_results(ref, outcome)
+            entry.update(identical=n_diff == 0, cells=int(cells), different_cells=int(n_diff), notes=notes)
+        results.append(entry)
+    return results
+
+
+def print_result(entry):
+    status = "identical" if entry["identical"] else f"DIFFERENT ({entry['different_cells']} cells)"
+    if entry["identical"] and not entry["cells"]:
+        status = "same error"
+    print(f"{entry['input']:<24}{entry['engine']:<12}{entry['cells']:>10}  {status:<24}"
+          f"{entry['reference_seconds']:>9.3f}{entry['engine_seconds']:>9.3f}{entry['speedup']:>8.2f}x")
+    if not entry["identical"] or not entry["cells"] or entry["notes"]:
+        for note in entry["notes"][:20]:
+            print(f"    {note}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="Skyline CSV files to compare on")
+    parser.add_argument("--engine", dest="engines", action="append",
+                        help="Engine to compare with the reference, can be repeated (default: optimized, compact)")
+    parser.add_argument("--synthetic", default=",".join(DEFAULT_SYNTHETIC),
+                        help=f"Comma-separated synthetic inputs from {', '.join(SYNTHETIC)}, "
+                             "or 'none' (default: %(default)s)")
+    parser.add_argument("--no-edge", action="store_true", help="Skip the edge-case fixtures")
+    parser.add_argument("--groups", default="WT,KO", help="Group list (default: %(default)s, empty to skip grouping)")
+    parser.add_argument("--control", default="KO", help="Control group (default: %(default)s)")
+    parser.add_argument("--dilution", type=float, default=2.0, help="Dilution factor (default: %(default)s)")
+    parser.add_argument("--min-coeff", type=float, default=0.8)
+    parser.add_argument("--max-coeff", type=float, default=1.5)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per engine, keep the fastest")
+    parser.add_argument("--data-dir", default="", help="Keep the generated inputs here (default: temporary)")
+    parser.add_argument("--json", default="", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    engines = args.engines or ["optimized", "compact"]
+    try:
+        for name in engines:
+            resolve_engine(name)
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+    synthetic = [] if args.synthetic in ("", "none") else [s.strip() for s in args.synthetic.split(",") if s.strip()]
+    unknown = [name for name in synthetic if name not in SYNTHETIC]
+    if unknown:
+        parser.error(f"Unknown synthetic input: {', '.join(unknown)}")
+    group_list = scfa_engine.parse_group_list(args.groups)
+    params = scfa_engine.MarkerParams(
+        dilution=args.dilution, min_coeff=args.min_coeff, max_coeff=args.max_coeff,
+        split_by_group=bool(group_list), group_list=group_list, control_group=args.control,
+    )
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        inputs = [(os.path.basename(path), path) for path in args.files]
+        if not args.no_edge:
+            for label, nan_replicate in (("edge", False), ("edge-nan-replicate", True)):
+                path = os.path.join(data_dir, f"equivalence_{label}.csv")
+                edge_fixture(path, nan_replicate)
+                inputs.append((label, path))
+        for name in synthetic:
+            path = os.path.join(data_dir, f"equivalence_{name}.csv")
+            if not os.path.exists(path):
+                make_skyline_export(path, **SYNTHETIC[name])
+            inputs.append((name, path))
+
+        print(f"{'input':<24}{'engine':<12}{'cells':>10}  {'result':<24}{'ref s':>9}{'engine s':>9}{'speedup':>9}")
+        for label, path in inputs:
+            for entry in check_input(label, path, params, engines, max(args.repeat, 1)):
+                print_result(entry)
+                results.append(entry)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": {"groups": group_list, "control": args.control, "dilution": args.dilution,
+                                  "min_coeff": args.min_coeff, "max_coeff": args.max_coeff},
+                       "results": results}, f, indent=2)
+    return 0 if all(entry["identical"] for entry in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+CSV 读取基准：原始读取方式与按列裁剪、指定类型的读取方式对比
+
+Each reader runs in a fresh subprocess so that its peak memory is measured
+in isolation.
+
+Usage:
+    python benchmarks/bench_ingest.py --rows 500000 --extra-columns 40
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scfa_engine  # noqa: E402
+from scfa_report import current_memory_mb, peak_memory_mb, reset_peak_memory  # noqa: E402
+
+READERS = {
+    "legacy": lambda path: scfa_engine.read_input_legacy(path),
+    "typed-c": lambda path: scfa_engine.read_input(path, engine="c"),
+    "typed-pyarrow": lambda path: scfa_engine.read_input(path, engine="pyarrow"),
+}
+
+
+def make_wide_export(path, rows, extra_columns, molecules=100):
+    """生成带有多余列的 Skyline 风格导出文件"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    molecule = np.array([f"Molecule-{i:03d}" for i in range(molecules)])[rng.integers(0, molecules, rows)]
+    is_standard = rng.random(rows) < 0.05
+    df = pd.DataFrame({
+        "Molecule": molecule,
+        "Replicate": [f"d_Day1_WT_{i % 12 + 1}" for i in range(rows)],
+        "Quantification": pd.Series(rng.uniform(0, 100, rows)).round(4).astype(str) + " uM",
+        "Sample Type": np.where(is_standard, "Standard", "Unknown"),
+        "Analyte Concentration": np.where(is_standard, rng.choice([1.0, 2.5, 10.0, 50.0], rows), np.nan),
+        "Exclude From Calibration": np.where(rng.random(rows) < 0.01, "True", "False"),
+    })
+    for i in range(extra_columns):
+        if i % 2:
+            df[f"Extra Column {i}"] = rng.uniform(0, 1e6, rows)
+        else:
+            df[f"Extra Column {i}"] = "Skyline annotation text " + str(i)
+    df.to_csv(path, index=False)
+
+
+def run_case(reader, path):
+    """在子进程中运行一个读取方式"""
+    import pandas  # noqa: F401  不计入读取时间和内存
+    reset_peak_memory()
+    base_memory = current_memory_mb()
+    start = time.perf_counter()
+    df = READERS[reader](path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "reader": reader,
+        "seconds": round(elapsed, 3),
+        "peak_memory_mb": round(peak_memory_mb() - base_memory, 1),
+        "frame_memory_mb": round(df.memory_usage(deep=True).sum() / 1024 ** 2, 1),
+        "rows": len(df),
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--extra-columns", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=1, help="Run each reader this many times, keep the fastest")
+    parser.add_argument("--json", default="", help="Write results to this JSON file")
+    parser.add_argument("--case", choices=sorted(READERS), help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        run_case(args.case, args.path)
+        return 0
+
+    readers = ["legacy", "typed-c"]
+    if scfa_engine.csv_engine("auto") == "pyarrow":
+        readers.append("typed-pyarrow")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "wide_export.csv")
+        make_wide_export(path, args.rows, args.extra_columns)
+        size_mb = os.path.getsize(path) / 1024 ** 2
+        print(f"Input: {args.rows} rows, {6 + args.extra_columns} columns, {size_mb:.1f} MB")
+        results = []
+        for reader in readers:
+            runs = []
+            for _ in range(args.repeat):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--case", reader, "--path", path],
+                    check=True, capture_output=True, text=True
+                )
+                runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            results.append(min(runs, key=lambda r: r["seconds"]))
+
+    legacy = results[0]
+    print(f"{'reader':<15}{'seconds':>10}{'speedup':>10}{'peak MB':>10}{'frame MB':>10}")
+    for r in results:
+        print(f"{r['reader']:<15}{r['seconds']:>10.3f}{legacy['seconds'] / r['seconds']:>9.1f}x"
+              f"{r['peak_memory_mb']:>10.1f}{r['frame_memory_mb']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"rows": args.rows, "extra_columns": args.extra_columns, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""
+内存回归检查：处理阶段和写出阶段的内存增量分别不超过输入文件大小的固定倍数
+
+Generates a synthetic Skyline export (benchmarks/synth.py) and processes it
+in a fresh subprocess per mode, as one unit from the file path:
+process_file reads, marks, groups and writes it with save_report, so the
+RunRecorder measures every phase (VmHWM, Linux). A tiny file is processed
+first in the same subprocess, so libraries that are only imported while
+reading or writing do not count.
+
+Two numbers are checked per mode, both as a multiple of the input CSV size:
+
+- engine: the largest memory increase of the processing phases (read,
+  prepare, mark, group), against one tight bound for every output format
+  (DEFAULT_MAX_RATIO or --max-ratio). A change that copies the input or the
+  marked results again shows up here.
+- writer: the largest memory increase of the write phases of each output
+  format, against that format's own bound (DEFAULT_WRITER_RATIOS or
+  --max-writer-ratio). xlsx is far above the other formats because
+  pd.ExcelWriter keeps every cell in memory until the workbook is saved;
+  xlsx-stream writes the same workbooks with constant memory.
+
+The check fails, with exit code 1, when either number exceeds its bound.
+The total is printed for information only.
+
+Usage:
+    python benchmarks/bench_memory.py
+    python benchmarks/bench_memory.py --mode default --format parquet --format csv --json memory.json
+
+The ratios depend little on the input size once the data dominates the
+interpreter and library overhead; small inputs (a few MB) are noisy.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from synth import make_skyline_export  # noqa: E402
+
+# 各模式的 MarkerParams 参数
+MODES = {
+    "default": {},
+    "compact": {"compact": True},
+    "float32": {"compact": True, "float32": True},
+}
+# 处理阶段内存增量上限（输入文件大小的倍数）：默认输入（400 个分子，47 MB）三种模式中最高的实测值
+# 约 2.5（read、prepare 约 2.3，float32 的 group 约 2.5）；多复制一次输入或标记结果就会超过
+DEFAULT_MAX_RATIO = 3.0
+# 各输出格式写出阶段的内存增量上限：实测 csv 2.5、parquet 1.1、feather 1.6、xlsx-stream 0.5、xlsx 34.8，
+# xlsx 由 pd.ExcelWriter 写出，所有单元格在保存前都在内存中
+DEFAULT_WRITER_RATIOS = {
+    "xlsx": 40.0,
+    "xlsx-stream": 3.0,
+    "csv": 3.0,
+    "parquet": 3.0,
+    "feather": 3.0,
+}
+
+
+def run_case(path, mode, groups, output_formats):
+    """在子进程中从文件路径开始处理文件（读取、标记、分组、写出），输出各阶段的内存增量（MB）"""
+    import io
+    from contextlib import redirect_stdout
+
+    import scfa_engine
+    from scfa_report import current_memory_mb, peak_memory_mb, reset_peak_memory
+
+    params = scfa_engine.MarkerParams(
+        split_by_group=True, group_list=groups, control_group=groups[0], output_formats=output_formats,
+        save_report=True, **MODES[mode]
+    )
+    with tempfile.TemporaryDirectory() as out_dir, redirect_stdout(io.StringIO()):
+        # 先处理一个很小的文件，读取和写出时才导入的库（pyarrow、xlsxwriter 等）不计入峰值
+        warm_up = os.path.join(out_dir, "warm_up.csv")
+        make_skyline_export(warm_up, molecules=2, replicates=2, groups=groups)
+        scfa_engine.process_file(warm_up, out_dir, params)
+        reset_peak_memory()
+        base = current_memory_mb()
+        result = scfa_engine.process_file(path, out_dir, params)
+        total = peak_memory_mb() - base
+    phases = [{"phase": p["phase"], "peak_memory_mb": p.get("peak_memory_mb")} for p in result.report["phases"]]
+    if any(p["peak_memory_mb"] is None for p in phases):
+        raise SystemExit("Phase memory is not available on this platform (needs Linux /proc)")
+    print(json.dumps({"phases": phases, "total_memory_mb": round(max(total, 0.0), 1)}))
+
+
+def split_phases(phases, formats):
+    """
+    把阶段内存增量分为处理阶段和各输出格式的写出阶段
+    Args:
+        phases (list): run_case 输出的阶段列表
+        formats (list): 输出格式名
+    Returns:
+        tuple: (最大的处理阶段 (名称, MB), {格式: 最大的写出阶段 MB})
+    """
+    engine = max(((p["phase"], p["peak_memory_mb"]) for p in phases if not p["phase"].startswith("write_")),
+                 key=lambda item: item[1])
+    writers = {}
+    for p in phases:
+        if p["phase"].startswith("write_"):
+            fmt = p["phase"].partition(":")[2] or formats[0]
+            writers[fmt] = max(writers.get(fmt, 0.0), p["peak_memory_mb"])
+    return engine, writers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--molecules", type=int, default=400)
+    parser.add_argument("--replicates", type=int, default=300, help="Replicates per prefix and group")
+    parser.add_argument("--groups", default="WT,KO", help="Comma-separated group names")
+    parser.add_argument("--prefixes", default="Day1,Day2,Day3,Day4", help="Comma-separated replicate prefixes")
+    parser.add_argument("--extra-columns", type=int, default=0, help="Extra annotation columns in the input")
+    parser.add_argument("--mode", dest="modes", action="append", choices=list(MODES),
+                        help="Processing mode, can be repeated (default: all)")
+    parser.add_argument("--format", dest="formats", action="append",
+                        help="Output format, can be repeated (default: xlsx)")
+    parser.add_argument("--max-ratio", type=float, default=DEFAULT_MAX_RATIO,
+                        help="Allowed memory increase of the processing phases as a multiple of the input "
+                             f"file size (default: {DEFAULT_MAX_RATIO:g})")
+    parser.add_argument("--max-writer-ratio", type=float, default=0.0,
+                        help="Allowed memory increase of the write phases of every format "
+                             "(default: per format, see DEFAULT_WRITER_RATIOS)")
+    parser.add_argument("--data-dir", default="", help="Keep the generated input here (default: temporary)")
+    parser.add_argument("--json", default="", help="Write results to this JSON file")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--case-mode", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    groups = args.groups.split(",")
+    formats = args.formats or ["xlsx"]
+    if args.case:
+        run_case(args.case, args.case_mode, groups, formats)
+        return 0
+    writer_limits = {fmt: args.max_writer_ratio or DEFAULT_WRITER_RATIOS.get(fmt, DEFAULT_WRITER_RATIOS["xlsx"])
+                     for fmt in formats}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        path = os.path.join(data_dir, f"memory_{args.molecules}x{args.replicates}.csv")
+        if not os.path.exists(path):
+            make_skyline_export(path, molecules=args.molecules, replicates=args.replicates, groups=groups,
+                                prefixes=args.prefixes.split(","), extra_columns=args.extra_columns)
+        input_mb = os.path.getsize(path) / 1024 ** 2
+        limits = ", ".join(f"{fmt} {limit:g}x" for fmt, limit in writer_limits.items())
+        print(f"Input: {input_mb:.1f} MB, engine limit {args.max_ratio:g}x, writer limits {limits}")
+        print(f"{'mode':<10}{'phase':<24}{'increase':>13}{'ratio':>9}")
+        for mode in args.modes or list(MODES):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--case", path, "--case-mode", mode,
+                 "--groups", args.groups, *[arg for fmt in formats for arg in ("--format", fmt)]],
+                capture_output=True, text=True
+            )
+            if out.returncode:
+                sys.stderr.write(out.stderr)
+                raise SystemExit(f"Mode {mode} failed with exit code {out.returncode}")
+            case = json.loads(out.stdout.strip().splitlines()[-1])
+            (engine_phase, engine_mb), writers = split_phases(case["phases"], formats)
+            checks = [(f"engine ({engine_phase})", engine_mb, args.max_ratio)]
+            checks += [(f"write:{fmt}", writers.get(fmt, 0.0), writer_limits[fmt]) for fmt in formats]
+            entry = {"mode": mode, "input_mb": round(input_mb, 1), "phases": case["phases"],
+                     "total_memory_mb": case["total_memory_mb"], "checks": []}
+            for name, mb, limit in checks:
+                ratio = mb / input_mb
+                entry["checks"].append({"check": name, "memory_mb": mb, "ratio": round(ratio, 2),
+                                        "max_ratio": limit, "passed": ratio <= limit})
+                print(f"{mode:<10}{name:<24}{mb:>10.1f} MB{ratio:>8.2f}x  {'ok' if ratio <= limit else 'FAILED'}")
+            print(f"{mode:<10}{'total (info)':<24}{case['total_memory_mb']:>10.1f} MB"
+                  f"{case['total_memory_mb'] / input_mb:>8.2f}x")
+            results.append(entry)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"max_ratio": args.max_ratio, "writer_ratios": writer_limits, "formats": formats,
+                       "results": results}, f, indent=2)
+    return 0 if all(c["passed"] for r in results for c in r["checks"]) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
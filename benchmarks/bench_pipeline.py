@@ -0,0 +1,108 @@
+"""
+流水线批量处理基准：依次处理与 scfa_pipeline 对比
+
+Generates a batch of synthetic Skyline exports (benchmarks/synth.py) and
+processes it twice with one worker: file by file (run_batch) and with the
+read, compute and write stages overlapped (scfa_pipeline.run_pipeline).
+For each mode it prints the wall time and the time spent in each stage,
+summed over the files from the run reports:
+
+    read      read + prepare (or load from the cache)
+    compute   mark + group
+    write     every MARKED_/GROUPED_ writer and the report
+
+Sequentially the wall time is about the sum of the stages; overlapped it
+should approach the slowest stage. The overlap needs at least two CPUs.
+
+Usage:
+    python benchmarks/bench_pipeline.py --files 4 --molecules 200 --replicates 200 --format parquet --format csv
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scfa_batch  # noqa: E402
+import scfa_engine  # noqa: E402
+import scfa_pipeline  # noqa: E402
+from synth import make_skyline_export  # noqa: E402
+
+STAGES = {"read": "read", "prepare": "read", "load": "read", "calibration": "compute", "mark": "compute",
+          "group": "compute"}
+
+
+def stage_seconds(items):
+    """按阶段汇总所有文件的运行报告"""
+    seconds = {"read": 0.0, "compute": 0.0, "write": 0.0}
+    for item in items:
+        if item.result is None:
+            raise RuntimeError(f"{item.file_path}: {item.error or 'canceled'}")
+        for phase in item.result.report["phases"]:
+            seconds[STAGES.get(phase["phase"].split(":")[0], "write")] += phase["seconds"]
+    return {name: round(value, 3) for name, value in seconds.items()}
+
+
+def run_mode(mode, paths, out_dir, params, depth):
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "pipeline":
+            items = scfa_pipeline.run_pipeline(paths, out_dir, params, depth=depth)
+        else:
+            items = scfa_batch.run_batch(paths, out_dir, params, workers=1)
+    wall = time.perf_counter() - start
+    stages = stage_seconds(items)
+    return {"mode": mode, "wall_seconds": round(wall, 3), "stages": stages,
+            "slowest_stage_seconds": max(stages.values())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4, help="Number of input files")
+    parser.add_argument("--molecules", type=int, default=200)
+    parser.add_argument("--replicates", type=int, default=200, help="Replicates per prefix and group")
+    parser.add_argument("--extra-columns", type=int, default=20, help="Extra annotation columns in the input")
+    parser.add_argument("--format", dest="formats", action="append", help="Output format (default: xlsx)")
+    parser.add_argument("--depth", type=int, default=1, help="Files waiting between two stages")
+    parser.add_argument("--data-dir", default="", help="Keep the generated inputs here (default: temporary)")
+    parser.add_argument("--json", default="", help="Write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(data_dir, f"pipeline_{args.molecules}_{args.replicates}_{i}.csv")
+            if not os.path.exists(path):
+                make_skyline_export(path, molecules=args.molecules, replicates=args.replicates,
+                                    groups=("WT", "KO", "HET"), prefixes=("Day1", "Day2"),
+                                    extra_columns=args.extra_columns, seed=i * 1000)
+            paths.append(path)
+        params = scfa_engine.MarkerParams(split_by_group=True, group_list=["WT", "KO"],
+                                          output_formats=args.formats or ["xlsx"], save_report=True)
+        results = [run_mode(mode, paths, os.path.join(tmp, mode), params, args.depth)
+                   for mode in ("sequential", "pipeline")]
+
+    print(f"{'mode':<12}{'wall s':>9}{'read s':>9}{'compute s':>11}{'write s':>9}{'wall/slowest':>14}")
+    for r in results:
+        s = r["stages"]
+        print(f"{r['mode']:<12}{r['wall_seconds']:>9.2f}{s['read']:>9.2f}{s['compute']:>11.2f}{s['write']:>9.2f}"
+              f"{r['wall_seconds'] / r['slowest_stage_seconds']:>14.2f}")
+    print(f"speedup {results[0]['wall_seconds'] / results[1]['wall_seconds']:.2f}x on {os.cpu_count()} CPU(s)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "files": args.files, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
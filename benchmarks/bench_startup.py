@@ -0,0 +1,128 @@
+"""
+界面启动基准：导入时间和首次绘制时间
+
+Each run starts a fresh Python process that imports SCFA_Marker, creates
+the main window and records, relative to the moment the parent launched
+the process:
+
+    import_qt      PyQt5 imported
+    import_app     SCFA_Marker module imported
+    window         main window constructed
+    first_paint    first paint event of the window
+    preloaded      processing modules (pandas, openpyxl, ...) loaded in the background
+
+Without a display the offscreen Qt platform is used.
+
+Usage:
+    python benchmarks/bench_startup.py --repeat 5 --json startup.json
+    python benchmarks/bench_startup.py --max-first-paint 1.0   # exit 1 if slower
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MILESTONES = ["import_qt", "import_app", "window", "first_paint", "preloaded"]
+
+
+def run_case(launched, timeout):
+    """在子进程中启动界面并记录各时间点（相对父进程启动子进程的时间）"""
+    marks = {}
+
+    def mark(name):
+        marks.setdefault(name, round(time.time() - launched, 4))
+
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+    mark("import_qt")
+    sys.path.insert(0, REPO_DIR)
+    import SCFA_Marker
+    mark("import_app")
+
+    app = QApplication(sys.argv)
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint:
+                mark("first_paint")
+                check_done()
+            return False
+
+    def check_done():
+        if all(name in marks for name in MILESTONES):
+            QTimer.singleShot(0, app.quit)
+
+    watcher = PaintWatcher()
+    app.installEventFilter(watcher)
+    window = SCFA_Marker.SCFA_Marker()
+    mark("window")
+    window.show()
+
+    def poll_preload():
+        # 预加载在 PRELOAD_DELAY_MS 后开始
+        thread = getattr(window, "preload_thread", None)
+        if thread is not None and thread.isFinished():
+            mark("preloaded")
+            check_done()
+
+    poll = QTimer()
+    poll.timeout.connect(poll_preload)
+    poll.start(5)
+    QTimer.singleShot(int(timeout * 1000), app.quit)
+    app.exec_()
+    app.removeEventFilter(watcher)
+    window.close()
+    print(json.dumps(marks))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of launches; the median is reported")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for each launch")
+    parser.add_argument("--json", default="", help="Write results to this JSON file")
+    parser.add_argument("--max-first-paint", type=float, default=0.0,
+                        help="Exit with status 1 if the median time to first paint exceeds this many seconds")
+    parser.add_argument("--case", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case is not None:
+        run_case(args.case, args.timeout)
+        return 0
+
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    runs = []
+    for _ in range(args.repeat):
+        launched = time.time()
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--case", repr(launched), "--timeout", str(args.timeout)],
+            check=True, capture_output=True, text=True, env=env
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    median = {}
+    print(f"{'milestone':<14}{'median s':>10}{'min s':>10}{'max s':>10}")
+    for name in MILESTONES:
+        values = [run[name] for run in runs if name in run]
+        if not values:
+            print(f"{name:<14}{'-':>10}")
+            continue
+        median[name] = round(statistics.median(values), 4)
+        print(f"{name:<14}{median[name]:>10.3f}{min(values):>10.3f}{max(values):>10.3f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0], "median": median, "runs": runs}, f, indent=2)
+    if args.max_first_paint and median.get("first_paint", float("inf")) > args.max_first_paint:
+        print(f"First paint took {median.get('first_paint')} s, more than {args.max_first_paint} s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
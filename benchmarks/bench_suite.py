@@ -0,0 +1,272 @@
+"""
+处理流程基准：按阶段计时并记录内存峰值
+
+Generates synthetic Skyline exports (benchmarks/synth.py) at fixed scales and
+times each phase of process_file separately: read, mark, group, write
+MARKED and write GROUPED. Each scale runs in a fresh subprocess; the peak
+memory of every phase is measured by resetting VmHWM before it (Linux).
+
+Results are written as JSON together with the commit, Python, pandas and
+numpy versions, so two runs can be compared:
+
+Usage:
+    python benchmarks/bench_suite.py --scales small,medium --json before.json
+    python benchmarks/bench_suite.py --scales small,medium --json after.json
+    python benchmarks/bench_suite.py --compare before.json after.json
+
+--compact/--float32 run every phase in compact mode (see MarkerParams), so
+the memory of the two modes can be compared the same way.
+
+Excel sheets hold at most 1,048,576 rows, so the multi-million-row scale
+writes Parquet unless --format is given.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from scfa_report import current_memory_mb, frame_memory_mb, peak_memory_mb, reset_peak_memory  # noqa: E402
+from synth import make_skyline_export, n_rows  # noqa: E402
+
+# 固定规模，format 为默认输出格式
+SCALES = {
+    "small": dict(molecules=20, replicates=5, groups=["WT", "KO", "HET"], prefixes=["Day1", "Day2"],
+                  format="xlsx"),
+    "medium": dict(molecules=100, replicates=50, groups=["WT", "KO", "HET"], prefixes=["Day1", "Day2"],
+                   format="xlsx"),
+    "large": dict(molecules=200, replicates=200, groups=["WT", "KO", "HET", "CTRL"],
+                  prefixes=["Day1", "Day2", "Day3"], format="xlsx"),
+    "xlarge": dict(molecules=400, replicates=250, groups=["WT", "KO", "HET", "CTRL", "MUT"],
+                   prefixes=["Day1", "Day2", "Day3", "Day4"], format="parquet"),
+}
+
+PHASES = ["read", "mark", "group", "write_marked", "write_grouped"]
+
+
+def scale_config(name, args):
+    """规模参数，命令行参数覆盖默认值"""
+    config = dict(SCALES[name])
+    config.update(standards=args.standards, extra_columns=args.extra_columns, units=args.units.split(","))
+    if args.format:
+        config["format"] = args.format
+    return config
+
+
+def input_path(data_dir, name, config):
+    """生成（或复用）输入文件，文件名包含全部生成参数"""
+    key = "_".join([
+        name, str(config["molecules"]), str(config["replicates"]), "-".join(config["groups"]),
+        "-".join(config["prefixes"]), str(config["standards"]), str(config["extra_columns"]),
+        "-".join(u.replace("/", "") for u in config["units"]),
+    ])
+    path = os.path.join(data_dir, f"skyline_{key}.csv")
+    if not os.path.exists(path):
+        generate = {k: v for k, v in config.items() if k != "format"}
+        tmp_path = path + ".tmp"
+        make_skyline_export(tmp_path, **generate)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _measure(phases, name, func):
+    """运行一个阶段，记录耗时、内存峰值（相对阶段开始时）和阶段结束后的内存"""
+    reset_peak_memory()
+    base = current_memory_mb()
+    start = time.perf_counter()
+    value = func()
+    seconds = time.perf_counter() - start
+    phases[name] = {
+        "seconds": round(seconds, 4),
+        "peak_memory_mb": round(max(peak_memory_mb() - base, 0.0), 1),
+        "memory_mb": round(current_memory_mb(), 1),
+    }
+    return value
+
+
+def run_case(path, groups, output_format, compact=False, float32=False):
+    """在子进程中依次运行各阶段"""
+    import io
+    from contextlib import redirect_stdout
+
+    import scfa_engine
+    import scfa_output
+
+    params = scfa_engine.MarkerParams(
+        split_by_group=True, group_list=groups, control_group=groups[0], output_formats=[output_format],
+        compact=compact, float32=float32
+    )
+    writer = scfa_output.FORMATS[output_format]
+    phases = {}
+    # 处理过程中的 print 不计入结果
+    with tempfile.TemporaryDirectory() as out_dir, redirect_stdout(io.StringIO()):
+        df = _measure(phases, "read", lambda: scfa_engine.read_input(path, params.csv_engine))
+        marked, _ = _measure(
+            phases, "mark", lambda: scfa_engine.mark_prepared(scfa_engine.prepare_frame(df), params)
+        )
+        phases["mark"]["frame_mb"] = frame_memory_mb(marked["All"])
+        grouped, _ = _measure(phases, "group", lambda: scfa_engine.process_group(marked, params))
+        _measure(phases, "write_marked", lambda: writer.write_marked(
+            marked, os.path.join(out_dir, "MARKED_bench" + writer.suffix)))
+        _measure(phases, "write_grouped", lambda: writer.write_grouped(
+            grouped, os.path.join(out_dir, "GROUPED_bench" + writer.suffix)))
+    print(json.dumps({"phases": phases, "molecules": len(marked) - 1, "grouped_sheets": len(grouped)}))
+
+
+def environment():
+    """记录运行环境，便于比较不同提交的结果"""
+    import numpy
+    import pandas
+
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=REPO_DIR, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def scale_rows(config):
+    return n_rows(config["molecules"], config["replicates"], config["groups"], config["prefixes"],
+                  config["standards"])
+
+
+def run_scale(name, config, data_dir, repeat, mode_args=()):
+    """运行一个规模，每个阶段取 repeat 次中最快的一次"""
+    path = input_path(data_dir, name, config)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--case", path,
+             "--case-groups", ",".join(config["groups"]), "--case-format", config["format"], *mode_args],
+            check=True, capture_output=True, text=True
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    phases = {
+        phase: min((run["phases"][phase] for run in runs), key=lambda r: r["seconds"])
+        for phase in PHASES
+    }
+    return {
+        "scale": name,
+        "rows": scale_rows(config),
+        "file_mb": round(os.path.getsize(path) / 1024 ** 2, 1),
+        "config": config,
+        "molecules": runs[0]["molecules"],
+        "grouped_sheets": runs[0]["grouped_sheets"],
+        "total_seconds": round(sum(p["seconds"] for p in phases.values()), 4),
+        "phases": phases,
+    }
+
+
+def print_results(results):
+    """每个阶段的耗时（秒）和内存峰值（MB）"""
+    header = f"{'scale':<8}{'rows':>10}{'format':>9}  " + "".join(f"{p:>15}" for p in PHASES)
+    print(header + f"{'total':>10}")
+    for r in results:
+        prefix = f"{r['scale']:<8}{r['rows']:>10}{r['config']['format']:>9}"
+        print(prefix + " s" + "".join(f"{r['phases'][p]['seconds']:>15.3f}" for p in PHASES)
+              + f"{r['total_seconds']:>10.2f}")
+        print(" " * len(prefix) + "MB" + "".join(f"{r['phases'][p]['peak_memory_mb']:>15.1f}" for p in PHASES)
+              + f"   marked frames {r['phases']['mark'].get('frame_mb', float('nan')):.1f} MB")
+
+
+def compare(base_path, new_path):
+    """比较两次运行的结果，比值 > 1 表示变慢/占用更多内存"""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    def mode(run):
+        return "+".join(name for name in ("compact", "float32") if run.get(name)) or "default"
+
+    print(f"base: {base['environment']['commit']} ({mode(base)})  new: {new['environment']['commit']} ({mode(new)})")
+    base_results = {r["scale"]: r for r in base["results"]}
+    print(f"{'scale':<8}{'phase':<15}{'base s':>10}{'new s':>10}{'ratio':>8}{'base MB':>10}{'new MB':>10}")
+    for r in new["results"]:
+        old = base_results.get(r["scale"])
+        if old is None or old["rows"] != r["rows"]:
+            continue
+        for phase in PHASES + ["total"]:
+            if phase == "total":
+                b, n = old["total_seconds"], r["total_seconds"]
+                bm = nm = float("nan")
+            else:
+                b, n = old["phases"][phase]["seconds"], r["phases"][phase]["seconds"]
+                bm, nm = old["phases"][phase]["peak_memory_mb"], r["phases"][phase]["peak_memory_mb"]
+            ratio = n / b if b else float("nan")
+            print(f"{r['scale']:<8}{phase:<15}{b:>10.3f}{n:>10.3f}{ratio:>7.2f}x{bm:>10.1f}{nm:>10.1f}")
+        if "frame_mb" in old["phases"]["mark"] and "frame_mb" in r["phases"]["mark"]:
+            print(f"{r['scale']:<8}{'marked frames':<15}{'':>28}"
+                  f"{old['phases']['mark']['frame_mb']:>10.1f}{r['phases']['mark']['frame_mb']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="small,medium,large",
+                        help=f"Comma-separated scales from {', '.join(SCALES)} (default: %(default)s)")
+    parser.add_argument("--standards", type=int, default=5, help="Standards per molecule")
+    parser.add_argument("--extra-columns", type=int, default=0, help="Extra annotation columns in the input")
+    parser.add_argument("--units", default="uM,ng/mL", help="Comma-separated unit strings")
+    parser.add_argument("--format", default="", help="Output format for every scale (default: per scale)")
+    parser.add_argument("--compact", action="store_true", help="Run in compact mode")
+    parser.add_argument("--float32", action="store_true", help="Store quantities as float32")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scale, keep the fastest of each phase")
+    parser.add_argument("--data-dir", default="",
+                        help="Keep generated inputs here and reuse them (default: temporary directory)")
+    parser.add_argument("--json", default="", help="Write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two JSON result files")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--case-groups", help=argparse.SUPPRESS)
+    parser.add_argument("--case-format", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        run_case(args.case, args.case_groups.split(","), args.case_format, args.compact, args.float32)
+        return 0
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    names = [name.strip() for name in args.scales.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCALES]
+    if unknown:
+        parser.error(f"Unknown scale: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        os.makedirs(data_dir, exist_ok=True)
+        results = []
+        for name in names:
+            config = scale_config(name, args)
+            print(f"Running {name} ({scale_rows(config)} rows)...", flush=True)
+            mode_args = [flag for flag, on in (("--compact", args.compact), ("--float32", args.float32)) if on]
+            results.append(run_scale(name, config, data_dir, args.repeat, mode_args))
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": environment(), "compact": args.compact, "float32": args.float32,
+                       "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
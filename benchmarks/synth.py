@@ -0,0 +1,151 @@
+"""
+合成 Skyline 导出文件
+
+Generates CSV files shaped like Skyline "Molecule Quantification" exports:
+per molecule a set of calibration standards and, for every prefix (day or
+batch), group and replicate number, one unknown sample named
+"d_<prefix>_<group>_<replicate>". Quantification is "<value> <unit>" with a
+fraction of "#N/A" values, and optional extra columns imitate the many
+annotation columns of a full export.
+
+Usage:
+    python benchmarks/synth.py out.csv --molecules 200 --replicates 50 --groups WT,KO,HET
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 标准品浓度
+STANDARD_LEVELS = [0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0]
+
+
+def n_rows(molecules=100, replicates=12, groups=("WT", "KO"), prefixes=("Day1",), standards=5, blanks=1):
+    """生成文件的行数"""
+    return molecules * (len(prefixes) * len(groups) * replicates + standards + blanks)
+
+
+def make_skyline_frame(molecules=100, replicates=12, groups=("WT", "KO"), prefixes=("Day1",), standards=5,
+                       blanks=1, extra_columns=0, units=("uM",), missing_rate=0.02, exclude_rate=0.05, seed=0,
+                       first_molecule=0):
+    """
+    生成 Skyline 风格的数据框
+    Args:
+        molecules (int): 分子数
+        replicates (int): 每个前缀、每个组别的重复数
+        groups (list): 组别名称
+        prefixes (list): Replicate 前缀（天数、批次）
+        standards (int): 每个分子的标准品数，最多 len(STANDARD_LEVELS)
+        blanks (int): 每个分子的空白样本数
+        extra_columns (int): 额外的注释列数
+        units (list): 单位，每个分子随机选一个
+        missing_rate (float): Quantification 为 "#N/A" 的比例
+        exclude_rate (float): 标准品 Exclude From Calibration 为 True 的比例
+        seed (int): 随机种子
+        first_molecule (int): 第一个分子的编号，分块生成时使用
+    Returns:
+        DataFrame: 按分子排列的导出数据
+    """
+    rng = np.random.default_rng(seed)
+    standards = min(standards, len(STANDARD_LEVELS))
+    samples = [f"d_{prefix}_{group}_{r}" for prefix in prefixes for group in groups for r in range(1, replicates + 1)]
+    replicate_names = (
+        [f"STD_{s + 1}" for s in range(standards)]
+        + samples
+        + [f"Blank_{b + 1}" for b in range(blanks)]
+    )
+    sample_types = ["Standard"] * standards + ["Unknown"] * len(samples) + ["Blank"] * blanks
+    per_molecule = len(replicate_names)
+    total = molecules * per_molecule
+
+    numbers = range(first_molecule, first_molecule + molecules)
+    molecule_names = np.array([f"C{i % 10}-Acid-{i:04d}" for i in numbers], dtype=object)
+    molecule = np.repeat(molecule_names, per_molecule)
+    replicate = np.tile(np.array(replicate_names, dtype=object), molecules)
+    sample_type = np.tile(np.array(sample_types, dtype=object), molecules)
+    is_standard = sample_type == "Standard"
+
+    concentration = np.full(total, np.nan)
+    levels = np.tile(np.array(STANDARD_LEVELS[:standards] + [np.nan] * (per_molecule - standards)), molecules)
+    concentration[is_standard] = levels[is_standard]
+    # 未知样本大致落在标准范围附近，使 Low/In/High 都会出现
+    top = STANDARD_LEVELS[standards - 1] if standards else 100.0
+    value = rng.lognormal(np.log(top / 4), 1.0, total)
+    value[is_standard] = concentration[is_standard] * rng.normal(1.0, 0.05, is_standard.sum())
+    unit = np.repeat(np.array(units, dtype=object)[rng.integers(0, len(units), molecules)], per_molecule)
+    quantification = pd.Series(value).round(4).astype(str).to_numpy(dtype=object) + " " + unit
+    quantification[rng.random(total) < missing_rate] = "#N/A"
+    exclude = np.where(is_standard & (rng.random(total) < exclude_rate), "True", "False")
+
+    df = pd.DataFrame({
+        "Molecule": molecule,
+        "Replicate": replicate,
+        "Quantification": quantification,
+        "Sample Type": sample_type,
+        "Analyte Concentration": concentration,
+        "Exclude From Calibration": exclude,
+    })
+    for i in range(extra_columns):
+        if i % 2:
+            df[f"Extra Column {i}"] = rng.uniform(0, 1e6, total).round(3)
+        else:
+            df[f"Extra Column {i}"] = "Skyline annotation text " + str(i)
+    return df
+
+
+def make_skyline_export(path, chunk_molecules=50, **kwargs):
+    """
+    生成 Skyline 风格的 CSV 文件，按分子分块写出以限制内存
+    Args:
+        path (str): 输出路径
+        chunk_molecules (int): 每次生成并写出的分子数
+        kwargs: 见 make_skyline_frame
+    Returns:
+        int: 行数
+    """
+    molecules = kwargs.pop("molecules", 100)
+    seed = kwargs.pop("seed", 0)
+    rows = 0
+    for start in range(0, molecules, chunk_molecules):
+        df = make_skyline_frame(molecules=min(chunk_molecules, molecules - start), seed=seed + start,
+                                first_molecule=start, **kwargs)
+        df.to_csv(path, index=False, mode="w" if start == 0 else "a", header=start == 0)
+        rows += len(df)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Output CSV file")
+    parser.add_argument("--molecules", type=int, default=100)
+    parser.add_argument("--replicates", type=int, default=12, help="Replicates per prefix and group")
+    parser.add_argument("--groups", default="WT,KO", help="Comma-separated group names")
+    parser.add_argument("--prefixes", default="Day1", help="Comma-separated replicate prefixes")
+    parser.add_argument("--standards", type=int, default=5, help="Standards per molecule")
+    parser.add_argument("--blanks", type=int, default=1, help="Blanks per molecule")
+    parser.add_argument("--extra-columns", type=int, default=0)
+    parser.add_argument("--units", default="uM", help="Comma-separated unit strings")
+    parser.add_argument("--missing-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rows = make_skyline_export(
+        args.path,
+        molecules=args.molecules,
+        replicates=args.replicates,
+        groups=args.groups.split(","),
+        prefixes=args.prefixes.split(","),
+        standards=args.standards,
+        blanks=args.blanks,
+        extra_columns=args.extra_columns,
+        units=args.units.split(","),
+        missing_rate=args.missing_rate,
+        seed=args.seed,
+    )
+    print(f"Wrote {rows} rows to {args.path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
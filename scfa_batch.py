@@ -0,0 +1,281 @@
+"""
+多文件批量处理
+
+run_batch sends each file's process_file work to a pool of worker processes
+and returns the per-file outcome in input order. Like scfa_engine, this
+module does not import PyQt5; the GUI passes progress callbacks and a
+CancelToken.
+"""
+import multiprocessing
+import os
+import queue
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import ExitStack
+from dataclasses import dataclass
+from functools import partial
+
+import scfa_cache
+import scfa_engine
+import scfa_output
+
+# 默认进程数的上限：每个工作进程都保存一个文件的全部数据
+MAX_DEFAULT_WORKERS = 4
+
+
+@dataclass
+class BatchItem:
+    """
+    单个文件的批量处理结果
+    Args:
+        file_path (str): 输入文件路径
+        result (FileResult): 处理结果，失败或取消时为 None
+        error (str): 错误信息
+        traceback (str): 详细错误信息
+        canceled (bool): 是否因用户取消而未处理
+        prepared (PreparedFrame): 工作进程返回给主进程缓存的预处理结果，
+            run_batch 返回前清空
+    """
+    file_path: str
+    result: scfa_engine.FileResult = None
+    error: str = ""
+    traceback: str = ""
+    canceled: bool = False
+    prepared: scfa_engine.PreparedFrame = None
+
+
+def default_workers(n_files=None):
+    """默认进程数：CPU 核数，不超过 MAX_DEFAULT_WORKERS 和文件数"""
+    workers = min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS)
+    if n_files:
+        workers = min(workers, n_files)
+    return max(1, workers)
+
+
+def drop_frames(result, params, keep_frames=False):
+    """
+    不把数据框传回主进程（或保留到批量结束）
+    Args:
+        keep_frames (bool or str): True 时全部保留；"marked" 时只保留 "All" 表（结果预览使用）；
+            合并输出时总是保留 "All" 表，由 ConsolidatedWriter 在主进程中写出后去掉
+    """
+    if keep_frames is True:
+        return
+    # 流式处理（params.stream_rows）的结果不含数据框
+    keep_all = (params.consolidate or keep_frames == "marked") and "All" in result.marked
+    result.marked = {"All": result.marked["All"]} if keep_all else {}
+    result.grouped = {}
+
+
+def _queue_progress(progress_queue, file_path, stage, done, total):
+    """工作进程中的文件内部进度，经 Manager 的队列传回主进程"""
+    progress_queue.put((file_path, stage, done, total))
+
+
+def _drain_progress(progress_queue, on_file_progress):
+    """在主进程中按到达顺序转发工作进程的文件内部进度"""
+    while True:
+        try:
+            message = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        on_file_progress(*message)
+
+
+def _process_one(file_path, save_path, params, keep_frames=False, progress=None, cancel=None,
+                 cache=None, prepared=None, return_prepared=False):
+    """
+    在工作进程中处理单个文件
+    Args:
+        cache (PreparedCache): 当前进程中的预处理结果缓存
+        prepared (PreparedFrame): 主进程缓存中已有的预处理结果，不再读取文件
+        return_prepared (bool): 是否把预处理结果放入 BatchItem 返回给主进程
+    """
+    item = BatchItem(file_path=file_path)
+    try:
+        source = file_path
+        if prepared is not None:
+            source = prepared
+        elif return_prepared:
+            source = item.prepared = scfa_engine.load_prepared(file_path, params.csv_engine, cancel)
+        result = scfa_engine.process_file(source, save_path, params, filename=file_path,
+                                          progress=progress, cancel=cancel, cache=cache)
+        drop_frames(result, params, keep_frames)
+        item.result = result
+    except scfa_engine.ProcessingCanceled:
+        item.canceled = True
+    except Exception as e:
+        item.error = str(e)
+        item.traceback = traceback.format_exc()
+    return item
+
+
+def run_batch(file_paths, save_path, params, workers=1, on_progress=None, on_file_progress=None,
+              cancel=None, keep_frames=False, poll_interval=0.1, cache=None, pipeline=False, on_result=None):
+    """
+    批量处理多个文件
+    Args:
+        file_paths (list): 输入文件路径
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        workers (int): 进程数，1 表示在当前进程中依次处理
+        on_progress (callable): on_progress(done, total, file_path)，每个文件完成后调用
+        on_file_progress (callable): on_file_progress(file_path, stage, done, total)，
+            文件内部每个分子/sheet 调用一次；workers 大于 1 时在主进程中转发工作进程的进度，
+            多个文件的进度交替到达
+        cancel (CancelToken): 取消标记，正在处理的文件在下一个检查点停止，
+            未开始的文件不再处理
+        keep_frames (bool or str): 是否在结果中保留 marked/grouped 数据框；
+            "marked" 只保留 marked["All"]
+        poll_interval (float): 等待工作进程时检查取消的间隔（秒）
+        cache (PreparedCache): 预处理结果缓存。命中的文件直接把预处理结果交给
+            工作进程，未命中的文件由工作进程读取后把预处理结果传回并加入缓存
+        pipeline (bool): workers 为 1 时读取、计算和写出重叠进行，见 scfa_pipeline；
+            只有一个 CPU、params.profile 为 True 或流式处理时不使用（cProfile 只记录当前线程）
+        on_result (callable): on_result(item)，在当前进程中按输入顺序对每个结束（成功或失败）的文件调用，
+            例如 ConsolidatedWriter.add；先完成的文件等待前面的文件
+    Returns:
+        list: 与 file_paths 顺序一致的 BatchItem 列表，取消的文件 canceled 为 True
+    """
+    total = len(file_paths)
+    items = [BatchItem(file_path=f, canceled=True) for f in file_paths]
+    if params.stream_rows > 0:
+        # 流式处理不把整个文件读入内存，不使用预处理结果缓存和流水线
+        cache = None
+        pipeline = False
+
+    if workers <= 1 and pipeline and total > 1 and not params.profile and (os.cpu_count() or 1) > 1:
+        import scfa_pipeline
+        return scfa_pipeline.run_pipeline(file_paths, save_path, params, on_progress=on_progress,
+                                          on_file_progress=on_file_progress, cancel=cancel,
+                                          keep_frames=keep_frames, cache=cache, poll_interval=poll_interval,
+                                          on_result=on_result)
+
+    if workers <= 1:
+        for i, file_path in enumerate(file_paths):
+            if cancel is not None and cancel.is_canceled():
+                break
+            progress = None
+            if on_file_progress is not None:
+                progress = partial(on_file_progress, file_path)
+            items[i] = _process_one(file_path, save_path, params, keep_frames, progress, cancel, cache)
+            if items[i].canceled:
+                continue
+            if on_result:
+                on_result(items[i])
+            if on_progress:
+                on_progress(i + 1, total, file_path)
+        return items
+
+    with ExitStack() as stack:
+        shared_cancel = None
+        progress_queue = None
+        if cancel is not None or on_file_progress is not None:
+            manager = stack.enter_context(multiprocessing.Manager())
+        if cancel is not None:
+            # threading.Event 不能传给工作进程，使用 Manager 的共享事件
+            shared_cancel = scfa_engine.CancelToken(manager.Event())
+        if on_file_progress is not None:
+            # 工作进程的文件内部进度经 Manager 的队列传回，等待时在主进程中转发
+            progress_queue = manager.Queue()
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+        futures = {}
+        keys = [None] * total
+        for i, file_path in enumerate(file_paths):
+            prepared = None
+            if cache is not None:
+                try:
+                    keys[i] = scfa_cache.file_key(file_path, params.csv_engine)
+                    prepared = cache.get(keys[i])
+                except OSError:
+                    # 文件无法访问，由工作进程报告错误
+                    pass
+            progress = None
+            if progress_queue is not None:
+                progress = partial(_queue_progress, progress_queue, file_path)
+            future = executor.submit(_process_one, file_path, save_path, params, keep_frames, progress,
+                                     shared_cancel, None, prepared,
+                                     keys[i] is not None and prepared is None)
+            futures[future] = i
+        pending = set(futures)
+        done_count = 0
+        # on_result 按输入顺序调用：ended[i] 表示第 i 个文件已结束，next_result 为下一个要报告的文件
+        ended = [False] * total
+        next_result = 0
+        while pending:
+            if cancel is not None and cancel.is_canceled():
+                # 未开始的文件直接取消，正在处理的文件在下一个检查点停止
+                shared_cancel.cancel()
+                for future in pending:
+                    future.cancel()
+            finished, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if progress_queue is not None:
+                # 工作进程在返回结果之前放入进度，文件的进度总是在它的 on_progress 之前转发
+                _drain_progress(progress_queue, on_file_progress)
+            for future in finished:
+                if future.cancelled():
+                    continue
+                i = futures[future]
+                try:
+                    items[i] = future.result()
+                except Exception as e:
+                    # 工作进程异常退出
+                    items[i] = BatchItem(file_path=file_paths[i], error=str(e),
+                                         traceback=traceback.format_exc())
+                if items[i].prepared is not None:
+                    cache.put(keys[i], items[i].prepared)
+                    items[i].prepared = None
+                if items[i].canceled:
+                    continue
+                ended[i] = True
+                while on_result and next_result < total and ended[next_result]:
+                    on_result(items[next_result])
+                    next_result += 1
+                done_count += 1
+                if on_progress:
+                    on_progress(done_count, total, file_paths[i])
+    return items
+
+
+class ConsolidatedWriter:
+    """
+    合并输出：作为 run_batch 的 on_result，把每个处理成功的文件的标记结果追加到 CONSOLIDATED_MARKED_*
+    文件（见 scfa_output.ConsolidatedStream），之后从结果中去掉这些数据框，不保留到批量结束。
+    出错后不再追加，close 时抛出该错误
+    Args:
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        keep_frames (bool or str): 与 run_batch 相同，为 True 或 "marked" 时结果中保留 "All" 表
+        cancel (CancelToken): 取消标记
+    """
+    def __init__(self, save_path, params, keep_frames=False, cancel=None):
+        self.stream = scfa_output.ConsolidatedStream(save_path, params)
+        self.keep_frames = keep_frames
+        self.cancel = cancel
+        self.error = None
+
+    def add(self, item):
+        if item.result is None or "All" not in item.result.marked:
+            return
+        if self.error is None:
+            try:
+                self.stream.append(os.path.basename(item.file_path), item.result.marked["All"], self.cancel)
+            except Exception as e:
+                self.error = e
+        if self.keep_frames not in (True, "marked"):
+            item.result.marked = {}
+
+    def close(self):
+        """
+        保存合并的文件；批量被取消时删除已写出的部分
+        Returns:
+            list: 保存的文件路径，没有处理成功的文件或已取消时为空
+        Raises:
+            Exception: 追加或保存时出现的错误
+        """
+        if self.error is not None or (self.cancel is not None and self.cancel.is_canceled()):
+            self.stream.close(save=False)
+            if self.error is not None and not isinstance(self.error, scfa_engine.ProcessingCanceled):
+                raise self.error
+            return []
+        return self.stream.close()
@@ -0,0 +1,103 @@
+"""
+预处理结果缓存
+
+Reading and parsing a Skyline export (CSV parsing, Quantification split,
+standard ranges) does not depend on the coefficients or the dilution
+factor. PreparedCache keeps the PreparedFrame of recently processed files,
+keyed by path, modification time, size and CSV engine, so running again
+with different parameters only repeats the threshold comparison and the
+writers. Entries are evicted least-recently-used first once the estimated
+memory use exceeds max_bytes.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import scfa_engine
+
+# 默认缓存上限：512 MB
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def file_key(path, engine="auto"):
+    """
+    缓存 key：绝对路径、修改时间、文件大小和 CSV 解析器
+    Raises:
+        OSError: 文件不存在或无法访问
+    """
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, engine)
+
+
+class PreparedCache:
+    """
+    按内存上限淘汰的 LRU 缓存，可在多个线程中使用
+    Args:
+        max_bytes (int): 缓存的预处理结果占用内存的上限（估算值）
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key):
+        """返回缓存的 PreparedFrame，没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, prepared):
+        """加入缓存，超过上限时淘汰最久未使用的条目；单个条目超过上限时不缓存"""
+        size = prepared.nbytes()
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            if size > self.max_bytes:
+                return
+            # 同一文件的旧版本不再可能命中
+            for stale in [k for k in self._entries if k[0] == key[0] and k[3] == key[3]]:
+                self._nbytes -= self._entries.pop(stale)[1]
+            self._entries[key] = (prepared, size)
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._nbytes -= evicted_size
+
+    def load(self, path, engine="auto", cancel=None):
+        """
+        返回文件的预处理结果，未缓存或文件已修改时重新读取
+        Args:
+            path (str): CSV 文件路径
+            engine (str): CSV 解析器
+            cancel (CancelToken): 取消标记
+        Returns:
+            PreparedFrame: 预处理结果
+        """
+        # 读取前取得 key，读取期间文件被修改时下次会重新读取
+        key = file_key(path, engine)
+        prepared = self.get(key)
+        if prepared is None:
+            prepared = scfa_engine.load_prepared(path, engine, cancel)
+            self.put(key, prepared)
+        return prepared
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
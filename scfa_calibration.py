@@ -0,0 +1,146 @@
+"""
+标准范围库：保存每个分子的标准范围，供只含样本的文件使用
+
+CalibrationStore keeps per-molecule standard ranges (min and max Analyte
+Concentration of the calibration standards, and the molecule's unit) in a
+SQLite file, keyed by calibration batch and molecule. Ranges are saved from
+an export that contains the standards (`scfa_cli.py calibrate`) and looked
+up when processing with MarkerParams.calibration_store, so a large run can
+be split into sample-only files that are processed independently, in
+parallel, against one calibration.
+
+SQLite allows many readers at the same time, so worker processes each open
+the store themselves.
+"""
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import scfa_engine
+
+DEFAULT_BATCH = "default"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS standard_ranges (
+    batch TEXT NOT NULL,
+    molecule TEXT NOT NULL,
+    min REAL,
+    max REAL,
+    unit TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    updated TEXT NOT NULL,
+    PRIMARY KEY (batch, molecule)
+) WITHOUT ROWID
+"""
+
+
+class CalibrationStore:
+    """
+    SQLite 中的标准范围库，可作为上下文管理器使用
+    Args:
+        path (str): 数据库文件路径
+        create (bool): 文件不存在时是否创建；为 False 时文件不存在会报错
+    Raises:
+        FileNotFoundError: create 为 False 且文件不存在
+    """
+    def __init__(self, path, create=False):
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(f"Calibration store not found: {path}")
+        self.path = path
+        # 其他进程写入时等待，而不是立即报错
+        self.conn = sqlite3.connect(path, timeout=30)
+        if create:
+            with self.conn:
+                self.conn.execute(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def save(self, batch, ranges, units=None, source=""):
+        """
+        保存（覆盖）一个批次中分子的标准范围，没有标准品的分子不保存
+        Args:
+            batch (str): 校准批次名称
+            ranges (DataFrame): index 为分子名称，列为 min、max（见 scfa_engine.standard_ranges）
+            units (list): 与 ranges 行对应的单位，见 scfa_engine.molecule_units
+            source (str): 标准品所在的文件
+        Returns:
+            int: 保存的分子数
+        """
+        units = list(units) if units is not None else [""] * len(ranges)
+        updated = time.strftime("%Y-%m-%dT%H:%M:%S")
+        rows = [
+            (batch, str(molecule), float(min_val), float(max_val), unit or "", source, updated)
+            for molecule, min_val, max_val, unit in zip(ranges.index, ranges["min"], ranges["max"], units)
+            if not (np.isnan(min_val) and np.isnan(max_val))
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO standard_ranges (batch, molecule, min, max, unit, source, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def load(self, batch, molecules=None):
+        """
+        读取一个批次的标准范围
+        Args:
+            batch (str): 校准批次名称
+            molecules (list): 需要的分子，默认为批次中的全部分子
+        Returns:
+            DataFrame: index 为分子名称，列为 min、max、unit；库中没有的分子为 NaN
+        Raises:
+            ValueError: 批次不存在
+        """
+        stored = pd.read_sql_query(
+            "SELECT molecule, min, max, unit FROM standard_ranges WHERE batch = ?",
+            self.conn, params=(batch,), index_col="molecule"
+        )
+        if stored.empty:
+            raise ValueError(f"Calibration batch '{batch}' not found in {self.path}")
+        stored.index = stored.index.astype(object)
+        if molecules is not None:
+            stored = stored.reindex(molecules)
+        return stored
+
+    def batches(self):
+        """
+        库中的批次
+        Returns:
+            DataFrame: 列为 batch、molecules（分子数）、updated（最后更新时间）
+        """
+        return pd.read_sql_query(
+            "SELECT batch, COUNT(*) AS molecules, MAX(updated) AS updated "
+            "FROM standard_ranges GROUP BY batch ORDER BY batch", self.conn
+        )
+
+    def delete(self, batch):
+        """删除一个批次，返回删除的分子数"""
+        with self.conn:
+            return self.conn.execute("DELETE FROM standard_ranges WHERE batch = ?", (batch,)).rowcount
+
+
+def save_calibration(source, store_path, batch=DEFAULT_BATCH, engine="auto"):
+    """
+    从含有标准品的文件计算标准范围并保存到库中
+    Args:
+        source (str or DataFrame): CSV 文件路径或数据框
+        store_path (str): 数据库文件路径，不存在时创建
+        batch (str): 校准批次名称
+        engine (str): CSV 解析器
+    Returns:
+        int: 保存的分子数
+    """
+    prepared = scfa_engine.load_prepared(source, engine)
+    name = os.path.basename(source) if isinstance(source, str) else ""
+    with CalibrationStore(store_path, create=True) as store:
+        return store.save(batch, prepared.ranges, scfa_engine.molecule_units(prepared), source=name)
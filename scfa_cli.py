@@ -0,0 +1,432 @@
+"""
+SCFA Marker 命令行入口
+
+Examples:
+    python scfa_cli.py run data1.csv data2.csv -o results --min-coeff 0.8 --max-coeff 1.5
+    python scfa_cli.py run data.csv --groups "WT, KO" --control KO
+    python scfa_cli.py run data.csv --groups "WT, KO" --group-layout long
+    python scfa_cli.py run plate_*.csv -o results -j 8
+    python scfa_cli.py run plate_*.csv -o results -j 1 --pipeline
+    python scfa_cli.py run plate_*.csv --groups "WT, KO" --preflight-only
+    python scfa_cli.py run data.csv --format parquet --format xlsx-stream
+    python scfa_cli.py run data.csv --unit uM
+    python scfa_cli.py run merged_export.csv --stream-rows 500000 --format csv
+    python scfa_cli.py sweep data.csv --min-grid 0.5:1.0:0.05 --max-grid 1.2,1.5,2.0
+    python scfa_cli.py watch /data/skyline -o /data/results -j 4
+    python scfa_cli.py serve -j 4      (then: python scfa_client.py plate_01.csv -o results)
+    python scfa_cli.py calibrate standards.csv --store calib.db --batch run42
+    python scfa_cli.py run shard_*.csv --calibration calib.db --calibration-batch run42
+"""
+import argparse
+import os
+import signal
+import sys
+import time
+
+# 各子命令的模块在 cmd_* 中导入，只导入参数解析需要的模块
+import scfa_engine
+import scfa_output
+import scfa_units
+
+
+def add_param_arguments(parser):
+    """添加与界面 Parameter Settings 对应的参数"""
+    defaults = scfa_engine.MarkerParams()
+    parser.add_argument("--dilution", type=float, default=defaults.dilution,
+                        help="Dilution factor applied to all quantification results (default: %(default)s)")
+    parser.add_argument("--min-coeff", type=float, default=defaults.min_coeff,
+                        help="Minimum coefficient of the standard range (default: %(default)s)")
+    parser.add_argument("--max-coeff", type=float, default=defaults.max_coeff,
+                        help="Maximum coefficient of the standard range (default: %(default)s)")
+    parser.add_argument("--groups", default="",
+                        help="Comma-separated group list, e.g. 'WT, KO'. Enables group splitting")
+    parser.add_argument("--control", default="",
+                        help="Control group shown first in grouped results")
+    parser.add_argument("--group-layout", default=defaults.group_layout, choices=scfa_engine.GROUP_LAYOUTS,
+                        help="Layout of the GROUPED results: 'sheets' has one sheet per molecule and group; "
+                             "'long' one table with Molecule, Group, Prefix, Replicate and Quantification "
+                             "columns; 'long-wide' adds one wide sheet per group (default: %(default)s)")
+    parser.add_argument("--csv-engine", default=defaults.csv_engine, choices=["auto", "pyarrow", "c", "python"],
+                        help="CSV parser; auto uses the multi-threaded pyarrow parser when installed (default: %(default)s)")
+    parser.add_argument("--format", dest="formats", action="append", choices=list(scfa_output.FORMATS),
+                        help="Output format, may be given several times (default: xlsx)")
+    parser.add_argument("--report", action="store_true",
+                        help="Save REPORT_*.json with per-phase and per-molecule timing and memory, and print a summary")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the processing with cProfile and save PROFILE_*.prof")
+    parser.add_argument("--compact", action="store_true",
+                        help="Keep the marked tables in a compact form (categorical labels, numeric standard "
+                             "ranges formatted when written) to reduce memory on large exports")
+    parser.add_argument("--float32", action="store_true",
+                        help="Store quantities as float32 (about 7 significant digits) to reduce memory")
+    parser.add_argument("--unit", dest="target_unit", type=unit_argument, default="",
+                        help="Convert quantities and standard ranges to this unit, e.g. uM or ng/mL "
+                             f"(one of: {', '.join(scfa_units.UNITS)})")
+    parser.add_argument("--calibration", dest="calibration_store", default="",
+                        help="Calibration store (see 'calibrate') with standard ranges for molecules "
+                             "that have no standards in the file")
+    parser.add_argument("--calibration-batch", default=defaults.calibration_batch,
+                        help="Calibration batch in the store (default: %(default)s)")
+    parser.add_argument("--calibration-override", action="store_true",
+                        help="Use the store's standard ranges even for molecules that have standards in the file")
+    parser.add_argument("--consolidate", action="store_true",
+                        help="Also save the marked results of all files in one CONSOLIDATED_MARKED_<time> file "
+                             "with a Source File column, written as each file finishes")
+    parser.add_argument("--stream-rows", type=int, default=defaults.stream_rows, metavar="N",
+                        help="Read each CSV file in chunks of N rows, in two passes, so files larger than "
+                             "memory can be processed; outputs are the same (default: whole file at once)")
+
+
+def unit_argument(text):
+    """--unit 的取值，接受 scfa_units.UNITS 中单位的不同写法（µM、umol/l 等），空值表示不换算"""
+    if not text:
+        return ""
+    unit = scfa_units.normalise_unit(text)
+    if unit not in scfa_units.UNITS:
+        raise argparse.ArgumentTypeError(f"unknown unit {text!r}")
+    return unit
+
+
+def params_from_args(args):
+    """根据命令行参数生成 MarkerParams"""
+    group_list = scfa_engine.parse_group_list(args.groups)
+    return scfa_engine.MarkerParams(
+        dilution=args.dilution,
+        min_coeff=args.min_coeff,
+        max_coeff=args.max_coeff,
+        split_by_group=bool(group_list),
+        group_list=group_list,
+        control_group=args.control,
+        group_layout=args.group_layout,
+        csv_engine=args.csv_engine,
+        output_formats=args.formats or ["xlsx"],
+        save_report=args.report,
+        profile=args.profile,
+        consolidate=args.consolidate,
+        compact=args.compact,
+        float32=args.float32,
+        target_unit=args.target_unit,
+        calibration_store=args.calibration_store,
+        calibration_batch=args.calibration_batch,
+        calibration_override=args.calibration_override,
+        stream_rows=max(args.stream_rows, 0),
+    )
+
+
+def cmd_run(args):
+    import scfa_batch
+    import scfa_preflight
+    import scfa_report
+
+    if args.consolidate and args.stream_rows > 0:
+        # 合并输出追加每个文件的 marked["All"]，分块流式处理不返回标记结果
+        print("--consolidate is not supported with --stream-rows", file=sys.stderr)
+        return 2
+    if args.group_layout == "long-wide" and args.stream_rows > 0:
+        print("--group-layout long-wide is not supported with --stream-rows", file=sys.stderr)
+        return 2
+    params = params_from_args(args)
+    try:
+        scfa_output.resolve_formats(params.output_formats)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    missing = [f for f in args.files if not os.path.isfile(f)]
+    if missing:
+        print(f"File not found: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    if not args.no_preflight:
+        # 只读取表头和样本，发现必然失败的文件时不开始处理
+        start = time.perf_counter()
+        checks = scfa_preflight.check_files(args.files, params)
+        failed = any(not check.ok for check in checks)
+        if args.preflight_only or failed or any(check.warnings for check in checks):
+            print(scfa_preflight.format_checks(checks, time.perf_counter() - start),
+                  file=sys.stdout if args.preflight_only else sys.stderr)
+        if failed:
+            print("Batch not started: fix the errors above or run with --no-preflight", file=sys.stderr)
+            return 2
+        if args.preflight_only:
+            return 0
+    # 默认输出到第一个文件所在目录
+    save_path = args.output or os.path.dirname(os.path.abspath(args.files[0]))
+    os.makedirs(save_path, exist_ok=True)
+
+    workers = args.workers or scfa_batch.default_workers(len(args.files))
+    consolidated = scfa_batch.ConsolidatedWriter(save_path, params) if params.consolidate else None
+    items = scfa_batch.run_batch(args.files, save_path, params, workers, pipeline=args.pipeline,
+                                 on_result=consolidated.add if consolidated else None)
+    n_failed = 0
+    for item in items:
+        if item.result:
+            print(f"Processed file: {os.path.basename(item.file_path)}\n"
+                  + scfa_engine.format_message(item.result, params))
+            if params.save_report:
+                print(scfa_report.format_report(item.result.report))
+        else:
+            n_failed += 1
+            print(f"Processed file: {os.path.basename(item.file_path)}\n"
+                  f"File processing failed: {item.error}", file=sys.stderr)
+    if consolidated:
+        try:
+            for path in consolidated.close():
+                print(f"Consolidated file saved: {path}")
+        except Exception as e:
+            n_failed += 1
+            print(f"Consolidated output failed: {e}", file=sys.stderr)
+    return 1 if n_failed else 0
+
+
+def cmd_sweep(args):
+    import scfa_sweep
+
+    try:
+        min_coeffs = scfa_sweep.parse_grid(args.min_grid)
+        max_coeffs = scfa_sweep.parse_grid(args.max_grid)
+        dilutions = scfa_sweep.parse_grid(args.dilution_grid)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    missing = [f for f in args.files if not os.path.isfile(f)]
+    if missing:
+        print(f"File not found: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    save_path = args.output or os.path.dirname(os.path.abspath(args.files[0]))
+    os.makedirs(save_path, exist_ok=True)
+
+    n_failed = 0
+    for file_path in args.files:
+        try:
+            table = scfa_sweep.sweep_file(file_path, min_coeffs, max_coeffs, dilutions, args.csv_engine)
+            path = scfa_sweep.save_sweep(table, save_path, file_path)
+        except Exception as e:
+            n_failed += 1
+            print(f"Processed file: {os.path.basename(file_path)}\n"
+                  f"File processing failed: {e}", file=sys.stderr)
+            continue
+        print(f"Processed file: {os.path.basename(file_path)}\nSaved file: {path}")
+        summary = scfa_sweep.sweep_summary(table)
+        print(summary.to_string(index=False))
+    return 1 if n_failed else 0
+
+
+def cmd_calibrate(args):
+    import scfa_calibration
+
+    if args.list or args.delete:
+        try:
+            store = scfa_calibration.CalibrationStore(args.store)
+        except FileNotFoundError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        with store:
+            if args.delete:
+                print(f"Deleted {store.delete(args.batch)} molecule(s) of batch '{args.batch}'")
+            else:
+                print(store.batches().to_string(index=False))
+        return 0
+    if not args.files:
+        print("No input files given", file=sys.stderr)
+        return 2
+    missing = [f for f in args.files if not os.path.isfile(f)]
+    if missing:
+        print(f"File not found: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    n_failed = 0
+    for file_path in args.files:
+        try:
+            n_saved = scfa_calibration.save_calibration(file_path, args.store, args.batch, args.csv_engine)
+        except Exception as e:
+            n_failed += 1
+            print(f"Processed file: {os.path.basename(file_path)}\n"
+                  f"File processing failed: {e}", file=sys.stderr)
+            continue
+        print(f"Processed file: {os.path.basename(file_path)}\n"
+              f"Saved standard ranges of {n_saved} molecule(s) to batch '{args.batch}' in {args.store}")
+    return 1 if n_failed else 0
+
+
+def cmd_watch(args):
+    import scfa_batch
+    import scfa_report
+    import scfa_watch
+
+    if args.consolidate:
+        # 监视模式逐个处理文件，没有批量结束的时间点
+        print("--consolidate is not supported in watch mode", file=sys.stderr)
+        return 2
+    params = params_from_args(args)
+    try:
+        scfa_output.resolve_formats(params.output_formats)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if not os.path.isdir(args.directory):
+        print(f"Directory not found: {args.directory}", file=sys.stderr)
+        return 2
+    save_path = args.output or args.directory
+    os.makedirs(save_path, exist_ok=True)
+
+    n_failed = 0
+
+    def on_result(item):
+        nonlocal n_failed
+        if item.result:
+            print(f"Processed file: {os.path.basename(item.file_path)}\n"
+                  + scfa_engine.format_message(item.result, params), flush=True)
+            if params.save_report:
+                print(scfa_report.format_report(item.result.report), flush=True)
+        else:
+            n_failed += 1
+            print(f"Processed file: {os.path.basename(item.file_path)}\n"
+                  f"File processing failed: {item.error}", file=sys.stderr, flush=True)
+
+    stop = scfa_engine.CancelToken()
+    # 作为服务运行时 SIGTERM 与 Ctrl+C 一样停止监视
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.cancel())
+    if not args.once:
+        print(f"Watching {os.path.abspath(args.directory)} for {args.pattern} files, press Ctrl+C to stop",
+              flush=True)
+    n_processed = scfa_watch.watch(
+        args.directory, save_path, params, workers=args.workers or scfa_batch.default_workers(),
+        interval=args.interval, settle=args.settle, pattern=args.pattern,
+        manifest_path=args.manifest, once=args.once, stop=stop, on_result=on_result,
+    )
+    if not args.once:
+        print(f"Stopped, {n_processed} file(s) processed")
+    return 1 if n_failed else 0
+
+
+def cmd_serve(args):
+    import scfa_batch
+    import scfa_cache
+    import scfa_client
+    import scfa_server
+
+    def on_result(job, entry):
+        name = os.path.basename(entry["file"])
+        if entry["state"] == "done":
+            print(f"Job {job.id}: processed {name} in {entry['seconds']:.2f} s", flush=True)
+        elif entry["state"] == "failed":
+            print(f"Job {job.id}: processing {name} failed: {entry['error']}", file=sys.stderr, flush=True)
+
+    def on_ready(address):
+        print(f"Serving on http://{address[0]}:{address[1]} with {workers} worker(s), press Ctrl+C to stop\n"
+              f"Access token: {scfa_client.token_path(address[1])}", flush=True)
+
+    workers = args.workers or scfa_batch.default_workers()
+    stop = scfa_engine.CancelToken()
+    # 作为服务运行时 SIGTERM 与 Ctrl+C 一样停止
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.cancel())
+    try:
+        n_processed = scfa_server.serve(args.host or scfa_server.DEFAULT_HOST,
+                                        scfa_server.DEFAULT_PORT if args.port is None else args.port, workers,
+                                        scfa_cache.DEFAULT_MAX_BYTES if args.cache_mb is None
+                                        else args.cache_mb * 1024 * 1024,
+                                        stop=stop, on_result=on_result, on_ready=on_ready)
+    except OSError as e:
+        print(f"Cannot start the job server: {e}", file=sys.stderr)
+        return 2
+    print(f"Stopped, {n_processed} file(s) processed")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="scfa_cli",
+        description="Mark SCFA quantification results from Skyline CSV exports without the GUI."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Process one or more CSV files")
+    run_parser.add_argument("files", nargs="+", help="Skyline CSV files to process")
+    run_parser.add_argument("-o", "--output", default="",
+                            help="Output directory (default: directory of the first file)")
+    run_parser.add_argument("-j", "--workers", type=int, default=0,
+                            help="Number of worker processes (default: CPU count up to 4, at most one per file)")
+    run_parser.add_argument("--pipeline", action="store_true",
+                            help="With -j 1, read the next file and write the previous one while marking "
+                                 "the current one (uses a separate writer process)")
+    run_parser.add_argument("--no-preflight", action="store_true",
+                            help="Start without checking the headers and a sample of every file first")
+    run_parser.add_argument("--preflight-only", action="store_true",
+                            help="Only check the headers and a sample of every file, then exit")
+    add_param_arguments(run_parser)
+    run_parser.set_defaults(func=cmd_run)
+
+    sweep_parser = subparsers.add_parser(
+        "sweep", help="Count In/High/Low per molecule over grids of coefficients, without writing workbooks"
+    )
+    sweep_parser.add_argument("files", nargs="+", help="Skyline CSV files to process")
+    sweep_parser.add_argument("-o", "--output", default="",
+                              help="Output directory for SWEEP_*.csv (default: directory of the first file)")
+    sweep_parser.add_argument("--min-grid", default="0.8",
+                              help="Minimum coefficients, 'a,b,c' or 'start:stop:step' (default: %(default)s)")
+    sweep_parser.add_argument("--max-grid", default="1.5",
+                              help="Maximum coefficients, 'a,b,c' or 'start:stop:step' (default: %(default)s)")
+    sweep_parser.add_argument("--dilution-grid", default="1",
+                              help="Dilution factors; only the reported thresholds depend on them (default: %(default)s)")
+    sweep_parser.add_argument("--csv-engine", default="auto", choices=["auto", "pyarrow", "c", "python"],
+                              help="CSV parser (default: %(default)s)")
+    sweep_parser.set_defaults(func=cmd_sweep)
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate", help="Save the standard ranges of calibration files to a calibration store"
+    )
+    calibrate_parser.add_argument("files", nargs="*", help="Skyline CSV files with the calibration standards")
+    calibrate_parser.add_argument("--store", required=True, help="Calibration store file (SQLite), created if missing")
+    calibrate_parser.add_argument("--batch", default=scfa_engine.MarkerParams().calibration_batch,
+                                  help="Calibration batch to save to (default: %(default)s)")
+    calibrate_parser.add_argument("--list", action="store_true", help="List the batches in the store")
+    calibrate_parser.add_argument("--delete", action="store_true", help="Delete the batch from the store")
+    calibrate_parser.add_argument("--csv-engine", default="auto", choices=["auto", "pyarrow", "c", "python"],
+                                  help="CSV parser (default: %(default)s)")
+    calibrate_parser.set_defaults(func=cmd_calibrate)
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Watch a directory and process new or changed CSV files until stopped"
+    )
+    watch_parser.add_argument("directory", help="Directory to watch")
+    watch_parser.add_argument("-o", "--output", default="",
+                              help="Output directory (default: the watched directory)")
+    watch_parser.add_argument("-j", "--workers", type=int, default=0,
+                              help="Files processed at the same time (default: CPU count up to 4)")
+    watch_parser.add_argument("--pattern", default="*.csv", help="File name pattern (default: %(default)s)")
+    watch_parser.add_argument("--interval", type=float, default=2.0,
+                              help="Seconds between directory scans (default: %(default)s)")
+    watch_parser.add_argument("--settle", type=float, default=2.0,
+                              help="Seconds a file must stay unchanged before it is processed (default: %(default)s)")
+    watch_parser.add_argument("--manifest", default="",
+                              help="Manifest of processed files (default: .scfa_watch.json "
+                                   "in the output directory)")
+    watch_parser.add_argument("--once", action="store_true",
+                              help="Process the files that need it and exit instead of watching")
+    add_param_arguments(watch_parser)
+    watch_parser.set_defaults(func=cmd_watch)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run a local job server that keeps the engine loaded; submit files with scfa_client.py"
+    )
+    # 默认值在 cmd_serve 中取自 scfa_server 和 scfa_cache
+    serve_parser.add_argument("--host", default="",
+                              help="Address to listen on (default: 127.0.0.1, this computer only)")
+    serve_parser.add_argument("--port", type=int, default=None,
+                              help="Port to listen on, 0 for any free port (default: 8765)")
+    serve_parser.add_argument("-j", "--workers", type=int, default=0,
+                              help="Files processed at the same time; 1 processes them in the server "
+                                   "process (default: CPU count up to 4)")
+    serve_parser.add_argument("--cache-mb", type=int, default=None,
+                              help="Memory for prepared files kept between jobs, shared by the workers; "
+                                   "0 disables the cache (default: 512)")
+    serve_parser.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
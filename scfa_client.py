@@ -0,0 +1,183 @@
+"""
+SCFA Marker 任务服务的客户端
+
+Submits files to a running job server (`python scfa_cli.py serve`) and
+prints the results like `scfa_cli.py run`. The arguments are those of
+`scfa_cli.py run` (without -j and --pipeline) and are parsed by the server.
+This module only uses the standard library (and scfa_report), so a call
+costs the Python start-up and the processing on the server, not the import
+of pandas and the workbook writers.
+
+The server only accepts requests that carry its access token, which it
+writes to a file only the user can read (token_path); the client reads it
+from there.
+
+Examples:
+    python scfa_client.py plate_01.csv -o results --groups "WT, KO"
+    python scfa_client.py plate_*.csv --no-wait
+    python scfa_client.py --job 12
+    python scfa_client.py --status
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# scfa_report 只在模块级导入标准库
+import scfa_report
+
+# 默认服务地址，可用环境变量 SCFA_SERVER 修改
+DEFAULT_SERVER = "http://127.0.0.1:8765"
+# 每次等待任务结束的时间（秒），超时后再次查询
+POLL_SECONDS = 60
+# 服务的访问令牌所在目录，只有本用户可以访问
+TOKEN_DIR = os.path.join(os.path.expanduser("~"), ".scfa_marker")
+
+
+class ServerError(Exception):
+    """服务返回错误或无法连接"""
+
+
+def token_path(port):
+    """端口为 port 的任务服务的访问令牌文件"""
+    return os.path.join(TOKEN_DIR, f"server_{port}.token")
+
+
+def server_token_path(server):
+    """服务地址（如 http://127.0.0.1:8765）对应的访问令牌文件"""
+    return token_path(urllib.parse.urlsplit(server).port or 80)
+
+
+def read_token(path):
+    """读取访问令牌，文件不存在时返回空字符串"""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def request(server, method, path, body=None, timeout=None, token_file=None):
+    """
+    发送请求并返回 JSON 结果
+    Args:
+        token_file (str): 访问令牌文件，默认为 server_token_path(server)
+    Raises:
+        ServerError: 服务返回错误或无法连接
+    """
+    token_file = token_file or server_token_path(server)
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(server.rstrip("/") + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json",
+                                          "Authorization": f"Bearer {read_token(token_file)}"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.load(e).get("error") or str(e)
+        except ValueError:
+            message = str(e)
+        if e.code == 401:
+            message += f" (token file: {token_file})"
+        raise ServerError(message)
+    except (urllib.error.URLError, OSError) as e:
+        raise ServerError(f"Cannot reach the job server at {server}: {getattr(e, 'reason', e)}")
+
+
+def submit(arguments, server=DEFAULT_SERVER, cwd=None, token_file=None):
+    """
+    提交任务
+    Args:
+        arguments (list): `scfa_cli.py run` 的参数，相对路径相对于 cwd
+        cwd (str): 工作目录，默认为当前目录
+        token_file (str): 访问令牌文件，默认为 server_token_path(server)
+    Returns:
+        dict: 任务，见 scfa_server.Job.to_dict
+    """
+    return request(server, "POST", "/jobs", {"args": list(arguments), "cwd": cwd or os.getcwd()},
+                   token_file=token_file)
+
+
+def wait_job(job_id, server=DEFAULT_SERVER, token_file=None):
+    """等待任务结束并返回任务"""
+    while True:
+        job = request(server, "GET", f"/jobs/{job_id}?wait={POLL_SECONDS}", timeout=POLL_SECONDS + 30,
+                      token_file=token_file)
+        if job["state"] in ("done", "canceled"):
+            return job
+
+
+def print_job(job):
+    """
+    按 `scfa_cli.py run` 的格式输出任务结果
+    Returns:
+        int: 失败的文件数
+    """
+    n_failed = 0
+    for entry in job["files"]:
+        name = os.path.basename(entry["file"])
+        if entry["state"] == "done":
+            print(f"Processed file: {name}\n{entry['message']}")
+            if "report" in entry:
+                print(scfa_report.format_report(entry["report"]))
+            print(f"Time: {entry['seconds']:.2f} s (queued {entry['wait_seconds']:.2f} s)")
+        elif entry["state"] == "failed":
+            n_failed += 1
+            print(f"Processed file: {name}\nFile processing failed: {entry['error']}", file=sys.stderr)
+        else:
+            print(f"File {name}: {entry['state']}")
+    return n_failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="scfa_client", allow_abbrev=False,
+        description="Submit files to a running SCFA Marker job server (scfa_cli.py serve). "
+                    "Other arguments are those of 'scfa_cli.py run'.",
+    )
+    parser.add_argument("--server", default=os.environ.get("SCFA_SERVER", DEFAULT_SERVER),
+                        help="Job server address (default: $SCFA_SERVER or %(default)s)")
+    parser.add_argument("--token-file", default=os.environ.get("SCFA_TOKEN_FILE", ""),
+                        help="Access token of the server (default: $SCFA_TOKEN_FILE or "
+                             "~/.scfa_marker/server_<port>.token)")
+    parser.add_argument("--no-wait", action="store_true",
+                        help="Print the job number and return without waiting for the results")
+    parser.add_argument("--job", help="Wait for a submitted job and print its results")
+    parser.add_argument("--cancel", metavar="JOB", help="Cancel a submitted job")
+    parser.add_argument("--status", action="store_true", help="Show the server status")
+    args, arguments = parser.parse_known_args(argv)
+    token_file = args.token_file or None
+    try:
+        if args.status:
+            print(json.dumps(request(args.server, "GET", "/status", token_file=token_file), indent=2))
+            return 0
+        if args.cancel:
+            job = request(args.server, "DELETE", f"/jobs/{args.cancel}", token_file=token_file)
+            print(f"Job {job['id']}: {job['state']}")
+            return 0
+        if args.job:
+            job_id = args.job
+        elif arguments:
+            job = submit(arguments, args.server, token_file=token_file)
+            job_id = job["id"]
+            if args.no_wait:
+                print(f"Job {job_id} submitted ({len(job['files'])} file(s))")
+                return 0
+        else:
+            parser.error("no input files given")
+        job = wait_job(job_id, args.server, token_file)
+    except ServerError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        # 任务继续在服务中运行
+        return 130
+    return 1 if print_job(job) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
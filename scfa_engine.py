@@ -0,0 +1,1737 @@
+"""
+SCFA Marker 处理引擎（不依赖 PyQt5）
+
+The marking and group-splitting logic used by the GUI, usable from scripts,
+the command line and headless processing nodes. Nothing in this module
+imports PyQt5.
+"""
+import io
+import os
+import re
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import scfa_report
+import scfa_units
+
+# 输入文件中需要保留的列
+REQUIRED_COLUMNS = [
+    'Molecule', 'Replicate', 'Quantification', 'Sample Type',
+    'Analyte Concentration', 'Exclude From Calibration'
+]
+
+# 读取时各列的数据类型，Exclude From Calibration 读取后再转换为布尔值
+INPUT_DTYPES = {
+    'Molecule': 'category',
+    'Replicate': str,
+    'Quantification': str,
+    'Sample Type': 'category',
+    'Analyte Concentration': 'float64',
+    'Exclude From Calibration': str,
+}
+
+# read_csv 默认识别的缺失值，pyarrow 解析器也按这些值识别字符串列中的缺失值
+NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+# 分组结果的布局，见 MarkerParams.group_layout
+GROUP_LAYOUTS = ("sheets", "long", "long-wide")
+# 长表布局中长表的名称
+GROUPED_LONG_SHEET = "Grouped"
+
+
+@dataclass
+class MarkerParams:
+    """
+    处理参数，对应界面上的 Parameter Settings
+    Args:
+        dilution (float): 稀释倍数
+        min_coeff (float): 标准范围最小值系数
+        max_coeff (float): 标准范围最大值系数
+        split_by_group (bool): 是否按组别拆分
+        group_list (list): 组别列表
+        control_group (str): 控制组名称（可选）
+        csv_engine (str): CSV 解析器，见 csv_engine
+        output_formats (list): 输出格式，见 scfa_output.FORMATS
+        save_report (bool): 是否在输出目录保存 REPORT_*.json 运行报告
+        profile (bool): 是否用 cProfile 记录处理过程，保存为 PROFILE_*.prof
+        consolidate (bool): 批量处理时是否把所有文件的标记结果合并保存为
+            CONSOLIDATED_MARKED_*，见 scfa_batch.ConsolidatedWriter
+        compact (bool): 紧凑模式，标记结果中重复的文本列为 category，标准范围保存为数值列
+            Standard Min/Standard Max，写出时才格式化，见 display_frame
+        float32 (bool): Quantification 保存为 float32，比较仍按 float64 进行，
+            写出时按最短的十进制表示输出（约 7 位有效数字）
+        target_unit (str): 目标单位（见 scfa_units.UNITS），设置后 Quantification 和标准范围
+            换算为该单位，不同写法和不同单位的数值可以一起标记；为空时不换算
+        calibration_store (str): 标准范围库（SQLite 文件，见 scfa_calibration）的路径，
+            为空时只使用文件中的标准品
+        calibration_batch (str): 使用库中的哪个校准批次
+        calibration_override (bool): 是否用库中的范围替换文件中已有的标准范围，
+            为 False 时只用于文件中没有标准品的分子
+        stream_rows (int): 大于 0 时 process_file 按此行数分块、分两遍读取 CSV 文件，
+            不把整个文件读入内存，见 scfa_stream
+        group_layout (str): 分组结果的布局（GROUP_LAYOUTS）："sheets" 每个 分子_组别 一个表；
+            "long" 所有分子和组别合并为一个长表；"long-wide" 长表之外每个组别一个宽表，见 group_long
+    """
+    dilution: float = 1.0
+    min_coeff: float = 0.8
+    max_coeff: float = 1.5
+    split_by_group: bool = False
+    group_list: list = field(default_factory=list)
+    control_group: str = ""
+    csv_engine: str = "auto"
+    output_formats: list = field(default_factory=lambda: ["xlsx"])
+    save_report: bool = False
+    profile: bool = False
+    consolidate: bool = False
+    compact: bool = False
+    float32: bool = False
+    target_unit: str = ""
+    calibration_store: str = ""
+    calibration_batch: str = "default"
+    calibration_override: bool = False
+    stream_rows: int = 0
+    group_layout: str = "sheets"
+
+
+@dataclass
+class FileResult:
+    """
+    单个文件的处理结果
+    Args:
+        filename (str): 输入文件名
+        marked (dict): 标记后的数据，key 为分子名称，"All" 为合并后的数据
+        grouped (dict): 分组后的数据，key 为 sheet 名称
+        success (list): 处理成功的分子
+        failed (list): 处理失败的分子
+        group_success (list): 分组处理成功信息
+        group_failed (list): 分组处理失败信息
+        failed_groups (list): 数据中不存在的组别
+        saved_files (list): 已保存的文件路径
+        unparsed (dict): 分子 -> Quantification 无法解析（或单位无法换算）的行数
+        calibrated (list): 使用标准范围库中范围的分子
+        report (dict): 运行报告，见 scfa_report.RunRecorder.report
+    """
+    filename: str = ""
+    marked: dict = field(default_factory=dict)
+    grouped: dict = field(default_factory=dict)
+    success: list = field(default_factory=list)
+    failed: list = field(default_factory=list)
+    group_success: list = field(default_factory=list)
+    group_failed: list = field(default_factory=list)
+    failed_groups: list = field(default_factory=list)
+    saved_files: list = field(default_factory=list)
+    unparsed: dict = field(default_factory=dict)
+    calibrated: list = field(default_factory=list)
+    report: dict = field(default_factory=dict)
+
+
+class ProcessingCanceled(Exception):
+    """用户取消处理"""
+
+
+class CancelToken:
+    """
+    协作式取消标记，处理循环中定期调用 check()
+    Args:
+        event: 具有 set()/is_set() 的事件对象，默认为 threading.Event；
+            跨进程使用时可传入 multiprocessing.Manager().Event()
+    """
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_canceled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """等待取消，最多 timeout 秒，返回是否已取消"""
+        return self._event.wait(timeout)
+
+    def check(self):
+        if self._event.is_set():
+            raise ProcessingCanceled("Processing canceled by user.")
+
+
+def check_canceled(cancel):
+    if cancel is not None:
+        cancel.check()
+
+
+def report_progress(progress, stage, done, total):
+    """
+    报告处理进度
+    Args:
+        progress (callable): progress(stage, done, total)，stage 为
+            "mark"、"write_marked"、"group" 或 "write_grouped"；
+            "save" 表示开始保存一个工作簿（done 和 total 为 0），保存过程不能取消
+    """
+    if progress is not None:
+        progress(stage, done, total)
+
+
+def parse_group_list(group_list_str):
+    """获取并处理组别列表"""
+    if not group_list_str or group_list_str == "value1, value2, value3":
+        return []
+    return [x.strip() for x in group_list_str.split(",")]
+
+
+def output_name(filename):
+    """输出文件名使用的原始文件名（不含扩展名）"""
+    return os.path.basename(filename).split(".")[0]
+
+
+def csv_engine(engine="auto"):
+    """
+    选择 CSV 解析器
+    Args:
+        engine (str): "auto"、"pyarrow"、"c" 或 "python"；
+            auto 在安装了 pyarrow 时使用多线程的 pyarrow 解析器，否则使用 c 解析器
+    Returns:
+        str: read_csv 使用的 engine
+    """
+    if engine != "auto":
+        return engine
+    try:
+        import pyarrow  # noqa: F401
+        return "pyarrow"
+    except ImportError:
+        return "c"
+
+
+class _CancelableFile(io.FileIO):
+    """解析器每读取一块（c 解析器 256 KB，pyarrow 1 MB）检查一次取消标记的文件"""
+    def __init__(self, path, cancel):
+        super().__init__(path, "rb")
+        self.cancel = cancel
+
+    def read(self, size=-1):
+        check_canceled(self.cancel)
+        return super().read(size)
+
+    def readinto(self, buffer):
+        check_canceled(self.cancel)
+        return super().readinto(buffer)
+
+
+def _read_pyarrow(handle):
+    """
+    用 pyarrow.csv 读取需要的列。重复的字符串列（Molecule、Replicate、Sample Type、
+    Exclude From Calibration）按字典编码读取，转换为 pandas 时不为每一行创建字符串对象；
+    Quantification 只用于解析数值和单位，保留为 Arrow 字符串列（pd.ArrowDtype）。
+    pd.read_csv(engine="pyarrow") 先把所有列转换为 Python 对象再转换类型，峰值约为这里的两倍
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    column_types = {
+        'Molecule': dictionary,
+        'Replicate': dictionary,
+        'Quantification': pa.string(),
+        'Sample Type': dictionary,
+        'Analyte Concentration': pa.float64(),
+        'Exclude From Calibration': dictionary,
+    }
+    convert_options = pa_csv.ConvertOptions(include_columns=REQUIRED_COLUMNS, column_types=column_types,
+                                            null_values=NA_VALUES, strings_can_be_null=True)
+    table = pa_csv.read_csv(handle, convert_options=convert_options)
+    # 解析时的缓冲区留在 pyarrow 的内存池中，转换前归还给系统，转换后同样处理
+    pool = pa.default_memory_pool()
+    pool.release_unused()
+    # 转换完一列即释放该列的 Arrow 数据
+    df = table.to_pandas(split_blocks=True, self_destruct=True,
+                         types_mapper={pa.string(): pd.ArrowDtype(pa.string())}.get)
+    del table
+    pool.release_unused()
+    for col in ('Replicate', 'Exclude From Calibration'):
+        df[col] = df[col].astype(object)
+    for col in ('Molecule', 'Sample Type'):
+        # 与 pd.read_csv 的 category 一致：类别按值排序
+        df[col] = df[col].cat.set_categories(df[col].cat.categories.sort_values())
+    return df
+
+
+def read_skyline_csv(path, engine="auto", cancel=None):
+    """
+    只读取需要的 6 列，并指定各列的数据类型
+    Args:
+        path (str): CSV 文件路径
+        engine (str): CSV 解析器，见 csv_engine
+        cancel (CancelToken): 取消标记，在解析器读取的每一块之间检查
+    Returns:
+        DataFrame: 只包含 REQUIRED_COLUMNS 的数据框（未规范化）
+    Raises:
+        ProcessingCanceled: 读取时被取消
+    """
+    engine = csv_engine(engine)
+    if engine == "pyarrow":
+        from pandas.io.common import get_handle, infer_compression
+        with (_CancelableFile(path, cancel) if cancel is not None else open(path, "rb")) as raw, \
+                get_handle(raw, "rb", compression=infer_compression(path, "infer"), is_text=False) as handles:
+            df = _read_pyarrow(handles.handle)
+        # pyarrow 先读完文件再完成解析和转换，这部分不能中断
+        check_canceled(cancel)
+        # 列已按 REQUIRED_COLUMNS 的顺序排列，不再复制
+        return df
+    if cancel is None:
+        df = pd.read_csv(path, usecols=REQUIRED_COLUMNS, dtype=INPUT_DTYPES, engine=engine)
+    else:
+        # 传入文件对象时 pandas 不能按扩展名识别压缩格式，需要指定
+        from pandas.io.common import infer_compression
+        with _CancelableFile(path, cancel) as handle:
+            df = pd.read_csv(handle, usecols=REQUIRED_COLUMNS, dtype=INPUT_DTYPES, engine=engine,
+                             compression=infer_compression(path, "infer"))
+    return df[REQUIRED_COLUMNS]
+
+
+def normalise_exclude(series):
+    """
+    Exclude From Calibration 统一为布尔值（不区分大小写），无法识别的值和缺失值为 NA
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype("boolean")
+    mapping = {"true": True, "false": False}
+    codes, uniques = pd.factorize(series)
+    if pd.api.types.infer_dtype(uniques, skipna=True) not in ("string", "empty"):
+        # 混有非字符串对象时（factorize 会把 True 和 1 视为同一个值）逐行转换
+        return series.astype(str).str.lower().map(mapping).astype("boolean")
+    # 只处理不同的值（通常只有 True/False 两种），不为每一行创建小写字符串
+    lowered = pd.Series(np.asarray(uniques, dtype=object)).str.lower()
+    lookup = np.append(lowered.map(mapping).astype("boolean").to_numpy(dtype=object), pd.NA)
+    return pd.Series(lookup[codes], index=series.index, dtype="boolean")
+
+
+def read_input(source, engine="auto", cancel=None):
+    """
+    读取输入数据，只保留需要的 6 列
+    Args:
+        source (str or DataFrame): CSV 文件路径或已读取的数据框
+        engine (str): CSV 解析器，见 csv_engine
+        cancel (CancelToken): 取消标记，读取 CSV 文件时检查
+    Returns:
+        DataFrame: 只包含 REQUIRED_COLUMNS 的数据框，Molecule/Sample Type 为 category，
+            Exclude From Calibration 为 boolean
+    """
+    if isinstance(source, pd.DataFrame):
+        # only keep 6 columns
+        df = source[REQUIRED_COLUMNS].copy()
+    else:
+        df = read_skyline_csv(source, engine, cancel)
+    for col in ('Molecule', 'Sample Type'):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    df['Exclude From Calibration'] = normalise_exclude(df['Exclude From Calibration'])
+    return df
+
+
+def read_input_legacy(source):
+    """
+    原始读取方式：pd.read_csv 默认参数读取全部列，作为参考实现的输入
+    """
+    if isinstance(source, pd.DataFrame):
+        df = source
+    else:
+        df = pd.read_csv(source)
+    # only keep 6 columns
+    df = df[REQUIRED_COLUMNS].copy()
+    # make all str in 'Exclude From Calibration as lower case, convert to str first
+    df['Exclude From Calibration'] = df['Exclude From Calibration'].astype(str).str.lower()
+    return df
+
+
+def _format_range_value(value):
+    """整数显示为整数，其他保留两位小数"""
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def _range_str(min_val, max_val):
+    return f"{_format_range_value(min_val)} - {_format_range_value(max_val)}"
+
+
+# Standard Status 的取值，NaN 为空字符串
+STATUS_LABELS = np.array(["", "Low", "High", "In"], dtype=object)
+
+# 紧凑模式中格式化前后的标准范围列：(输出列, 最小值列, 最大值列)
+RANGE_COLUMNS = [
+    ("Standard Range", "Standard Min", "Standard Max"),
+    ("Standard Range(diluted_adjusted)", "Standard Min(diluted_adjusted)", "Standard Max(diluted_adjusted)"),
+]
+
+
+def _range_categorical(min_vals, max_vals):
+    """数值的标准范围格式化为 category 列，每种 (min, max) 组合只格式化一次"""
+    keys = pd.DataFrame({"min": np.asarray(min_vals, dtype=float), "max": np.asarray(max_vals, dtype=float)})
+    pair_codes = keys.groupby(["min", "max"], dropna=False, sort=False).ngroup().to_numpy()
+    pairs = keys.drop_duplicates().to_numpy()
+    labels, label_codes = np.unique([_range_str(a, b) for a, b in pairs], return_inverse=True)
+    return pd.Categorical.from_codes(label_codes[pair_codes], categories=labels)
+
+
+def _float32_to_float64(values):
+    """float32 按最短十进制表示转换为 float64（12.3 而不是 12.300000190734863）"""
+    return np.asarray(np.asarray(values).astype(str), dtype=np.float64)
+
+
+def display_frame(df):
+    """
+    写出前把紧凑模式的标记结果转换为与普通模式相同的列：
+    Standard Min/Standard Max 合并为 "min - max" 格式的 Standard Range，float32 列转换为 float64。
+    不含这些列的数据框原样返回
+    Args:
+        df (DataFrame): 标记结果（可以是其中的一段行）
+    Returns:
+        DataFrame: 输出用的数据框
+    """
+    pairs = {min_col: (name, max_col) for name, min_col, max_col in RANGE_COLUMNS
+             if min_col in df.columns and max_col in df.columns}
+    has_float32 = any(dtype == np.float32 for dtype in df.dtypes)
+    if not pairs and not has_float32:
+        return df
+    skip = {max_col for _, max_col in pairs.values()}
+    columns = {}
+    for col in df.columns:
+        if col in pairs:
+            name, max_col = pairs[col]
+            columns[name] = _range_categorical(df[col].to_numpy(), df[max_col].to_numpy())
+        elif col in skip:
+            continue
+        elif df[col].dtype == np.float32:
+            columns[col] = _float32_to_float64(df[col].to_numpy())
+        else:
+            columns[col] = df[col].to_numpy()
+    return pd.DataFrame(columns, index=df.index)
+
+
+def molecule_list(df):
+    """排序后的分子列表"""
+    group_list = list(set(df["Molecule"].dropna().unique().tolist()))
+    group_list.sort()
+    return group_list
+
+
+def standard_ranges(df):
+    """
+    一次 groupby 计算每个分子的标准最小值和最大值
+    Args:
+        df (DataFrame): read_input 返回的数据框
+    Returns:
+        DataFrame: index 为分子名称，列为 min 和 max；没有可用标准品的分子为 NaN
+    """
+    not_excluded = df["Exclude From Calibration"].eq(False).fillna(False)
+    is_standard = (df["Sample Type"] == "Standard") & not_excluded
+    ranges = df.loc[is_standard].groupby("Molecule", observed=True)["Analyte Concentration"].agg(["min", "max"])
+    ranges.index = ranges.index.astype(object)
+    return ranges.reindex(molecule_list(df))
+
+
+@dataclass
+class PreparedFrame:
+    """
+    与阈值和稀释倍数无关的预处理结果，参数改变时可直接重新标记
+    Args:
+        molecules (list): 分子列表（排序后）
+        rows (DataFrame): 按分子稳定排序后的行，index 为原始行号，列为
+            Molecule、Replicate、code（分子序号）、value（数值）、Unit（category）、is_standard
+        ranges (DataFrame): 每个分子的标准范围，列为 min、max
+        width (ndarray): 每个分子 Quantification 拆分后的最大列数
+        all_int (ndarray): 每个分子的数值是否全部为整数
+        split_error (Exception): Quantification 不是字符串列时的错误
+        unparsed (ndarray): 每个分子中 Quantification 有内容但无法解析为数值的行数
+        units (list): 每个分子的校准单位，为 None 时由 rows 计算（见 molecule_units）；
+            分块处理时为整个文件的单位
+    """
+    molecules: list
+    rows: pd.DataFrame
+    ranges: pd.DataFrame
+    width: np.ndarray = None
+    all_int: np.ndarray = None
+    split_error: Exception = None
+    unparsed: np.ndarray = None
+    units: list = None
+
+    def nbytes(self):
+        """估算占用的内存（字节）"""
+        total = int(self.rows.memory_usage(index=True, deep=True).sum())
+        total += int(self.ranges.memory_usage(index=True, deep=True).sum())
+        for array in (self.width, self.all_int, self.unparsed):
+            if array is not None:
+                total += array.nbytes
+        return total
+
+
+def prepare_frame(df, cancel=None):
+    """
+    读取后的预处理：按分子排序、拆分 Quantification、计算标准范围
+    Args:
+        df (DataFrame): read_input 返回的数据框
+        cancel (CancelToken): 取消标记
+    Returns:
+        PreparedFrame: 预处理结果
+    """
+    group_list = molecule_list(df)
+
+    # 按分子排序（稳定排序，保留分子内的原始行顺序），NaN 分子被丢弃
+    codes = pd.Categorical(df["Molecule"], categories=group_list).codes
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    df = df.iloc[order]
+    codes = codes[order]
+    check_canceled(cancel)
+
+    # Quantification 一次解析为数值和单位，每个分子必须恰好拆成两列，否则该分子失败
+    split_error = None
+    width = None
+    all_int = None
+    unparsed = np.zeros(len(group_list), dtype=np.int64)
+    value = np.full(len(df), np.nan)
+    unit = pd.Categorical(np.full(len(df), np.nan))
+    try:
+        parsed = scfa_units.parse_quantification(df["Quantification"])
+    except AttributeError as e:
+        # 非字符串列，所有分子都无法拆分
+        split_error = e
+    else:
+        value = parsed.value
+        unit = parsed.unit
+        width = pd.Series(parsed.n_parts).groupby(codes).max().reindex(range(len(group_list))).to_numpy()
+        # 与逐分子 to_numeric 一致：分子内全部为整数时 Quantification 为整数类型
+        all_int = pd.Series(parsed.is_int).groupby(codes).all().reindex(range(len(group_list))).to_numpy()
+        unparsed = np.bincount(codes[parsed.unparsed], minlength=len(group_list))
+    check_canceled(cancel)
+
+    rows = pd.DataFrame({
+        "Molecule": df["Molecule"].to_numpy(),
+        "Replicate": df["Replicate"].to_numpy(),
+        "code": codes,
+        "value": value,
+        "Unit": unit,
+        "is_standard": (df["Sample Type"] == "Standard").to_numpy(),
+    }, index=df.index)
+    return PreparedFrame(
+        molecules=group_list,
+        rows=rows,
+        ranges=standard_ranges(df),
+        width=width,
+        all_int=all_int,
+        split_error=split_error,
+        unparsed=unparsed,
+    )
+
+
+def load_prepared(source, engine="auto", cancel=None):
+    """读取并预处理 CSV 文件或数据框"""
+    check_canceled(cancel)
+    return prepare_frame(read_input(source, engine, cancel), cancel)
+
+
+def unit_counts(prepared):
+    """
+    规范化后的单位编码和每个分子中每种单位的行数
+    Returns:
+        tuple: (单位列表（排序后）, 每一行的单位序号（没有单位时为 -1）,
+            分子数 x 单位数的行数矩阵)
+    """
+    n_molecules = len(prepared.molecules)
+    unit = prepared.rows["Unit"].array
+    # category 的编码可能是 int8，相乘前转换避免溢出
+    codes = prepared.rows["code"].to_numpy().astype(np.int64)
+    # 先规范化单位的写法，每种单位只处理一次
+    names = [scfa_units.normalise_unit(u) for u in unit.categories]
+    uniques = sorted(set(names) - {""})
+    name_codes = np.array([uniques.index(n) if n else -1 for n in names] + [-1], dtype=np.int64)
+    row_name = name_codes[unit.codes]
+    has_unit = row_name >= 0
+    counts = np.bincount(codes[has_unit] * max(len(uniques), 1) + row_name[has_unit],
+                         minlength=n_molecules * max(len(uniques), 1)).reshape(n_molecules, -1)
+    return uniques, row_name, counts[:, :len(uniques)]
+
+
+def _unit_codes(prepared):
+    """
+    规范化后的单位编码
+    Returns:
+        tuple: (单位列表, 每一行的单位序号, 每个分子最常见的单位序号)，没有单位时为 -1
+    """
+    uniques, row_name, counts = unit_counts(prepared)
+    if not uniques:
+        return uniques, row_name, np.full(len(prepared.molecules), -1)
+    molecule_name = np.where(counts.max(axis=1) > 0, counts.argmax(axis=1), -1)
+    return uniques, row_name, molecule_name
+
+
+def molecule_units(prepared):
+    """
+    每个分子最常见的单位（规范化后），即标准曲线浓度的单位
+    Args:
+        prepared (PreparedFrame): 预处理结果
+    Returns:
+        list: 与 prepared.molecules 对应的单位，没有单位时为 ""
+    """
+    if prepared.units is not None:
+        return list(prepared.units)
+    uniques, _, molecule_name = _unit_codes(prepared)
+    return [uniques[i] if i >= 0 else "" for i in molecule_name]
+
+
+def apply_calibration(prepared, params):
+    """
+    用标准范围库（params.calibration_store）中的范围替换文件中的标准范围
+
+    默认只替换文件中没有标准品的分子，calibration_override 为 True 时替换库中有的所有分子。
+    库中的单位与文件中分子的单位不同但可以换算时（例如 uM 与 nM），范围按文件的单位换算；
+    无法换算时保留文件中的范围。
+    Args:
+        prepared (PreparedFrame): 预处理结果（不修改）
+        params (MarkerParams): 处理参数
+    Returns:
+        tuple: (PreparedFrame, 使用库中范围的分子列表)
+    Raises:
+        FileNotFoundError: 库文件不存在
+        ValueError: 库中没有该批次
+    """
+    if not params.calibration_store:
+        return prepared, []
+    import dataclasses
+
+    import scfa_calibration
+
+    with scfa_calibration.CalibrationStore(params.calibration_store) as store:
+        stored = store.load(params.calibration_batch, prepared.molecules)
+    ranges = prepared.ranges
+    # 库中单位与文件单位之间的系数
+    factor = np.ones(len(stored))
+    for i, (stored_unit, file_unit) in enumerate(zip(stored["unit"], molecule_units(prepared))):
+        if isinstance(stored_unit, str) and stored_unit and file_unit and stored_unit != file_unit:
+            if stored_unit in scfa_units.UNITS and file_unit in scfa_units.UNITS:
+                factor[i] = scfa_units.unit_factors([stored_unit], file_unit)[0]
+            else:
+                factor[i] = np.nan
+    use = stored["min"].notna().to_numpy() & ~np.isnan(factor)
+    if not params.calibration_override:
+        use &= ranges["min"].isna().to_numpy() & ranges["max"].isna().to_numpy()
+    if not use.any():
+        return prepared, []
+    ranges = ranges.copy()
+    for col in ("min", "max"):
+        ranges[col] = np.where(use, stored[col].to_numpy(dtype=float) * factor, ranges[col].to_numpy(dtype=float))
+    calibrated = [m for m, u in zip(prepared.molecules, use) if u]
+    return dataclasses.replace(prepared, ranges=ranges), calibrated
+
+
+@dataclass
+class UnitConversion:
+    """
+    换算为目标单位的系数，见 _unit_conversion
+    Args:
+        unit (str): 目标单位
+        row_factor (ndarray): 每一行的系数，单位无法换算的行为 NaN
+        molecule_factor (ndarray): 每个分子的校准单位（最常见的单位）的系数，用于标准范围
+        molecule_unit (list): 每个分子的校准单位，没有单位时为 ""
+        unconverted (ndarray): 每个分子中有数值但单位无法换算的行数
+    """
+    unit: str
+    row_factor: np.ndarray
+    molecule_factor: np.ndarray
+    molecule_unit: list
+    unconverted: np.ndarray
+
+
+def _unit_conversion(prepared, target):
+    """
+    计算 prepared.rows 每一行和每个分子换算为目标单位的系数
+
+    标准曲线的浓度没有单位，按分子中最常见的单位（校准单位，prepared.units 不为 None 时
+    使用其中的单位）换算；没有单位的行也按校准单位换算。
+    Args:
+        prepared (PreparedFrame): 预处理结果
+        target (str): 目标单位，见 scfa_units.UNITS
+    Returns:
+        UnitConversion: 换算系数
+    """
+    n_molecules = len(prepared.molecules)
+    codes = prepared.rows["code"].to_numpy()
+    uniques, row_name, molecule_name = _unit_codes(prepared)
+    name_factor = scfa_units.unit_factors(uniques, target)
+    has_unit = row_name >= 0
+    if prepared.units is None:
+        molecule_unit = [uniques[i] if i >= 0 else "" for i in molecule_name]
+        molecule_factor = np.append(name_factor, np.nan)[molecule_name]
+    else:
+        molecule_unit = list(prepared.units)
+        molecule_factor = scfa_units.unit_factors(molecule_unit, target)
+
+    row_factor = np.where(has_unit, np.append(name_factor, np.nan)[row_name], molecule_factor[codes])
+    unconverted = has_unit & np.isnan(row_factor) & ~np.isnan(prepared.rows["value"].to_numpy())
+    return UnitConversion(
+        unit=scfa_units.normalise_unit(target),
+        row_factor=row_factor,
+        molecule_factor=molecule_factor,
+        molecule_unit=molecule_unit,
+        unconverted=np.bincount(codes[unconverted], minlength=n_molecules),
+    )
+
+
+class MarkedResult(Mapping):
+    """
+    标记结果：所有成功分子的行保存在一个按分子排序的数据框中，不按分子复制
+
+    用法与原来的 group_dict 相同（key 依次为各分子和 "All"）。"All" 即该数据框本身，
+    每个分子的表是其中连续行的切片（按 offsets 取，不复制数据），每次访问时生成；
+    数值全为整数的分子只把 Quantification 一列转换为 int64。
+    Args:
+        frame (DataFrame): 按分子排序的标记结果，即 "All" 表
+        molecules (list): 分子名称，按 frame 中的顺序
+        offsets (ndarray): 第 i 个分子为 frame 的第 offsets[i] 到 offsets[i + 1] 行
+        row_index (Index): 每行在输入中的行号，作为各分子表的 index；为 None 时使用 frame 的 index
+        int_molecules (ndarray): 各分子的 Quantification 是否转换为 int64，为 None 时都不转换
+    """
+
+    def __init__(self, frame, molecules, offsets, row_index=None, int_molecules=None):
+        self.frame = frame
+        self.molecules = list(molecules)
+        self.offsets = np.asarray(offsets)
+        self.row_index = row_index
+        self.int_molecules = int_molecules
+        self._position = {molecule: i for i, molecule in enumerate(self.molecules)}
+
+    def __getitem__(self, key):
+        if key == "All":
+            return self.frame
+        i = self._position[key]
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        df = self.frame.iloc[start:stop]
+        if self.row_index is not None:
+            df.index = self.row_index[start:stop]
+        if self.int_molecules is not None and self.int_molecules[i] and df["Quantification"].dtype != np.int64:
+            # 浅复制后只替换这一列，其余列仍与 frame 共用
+            df = df.copy(deep=False)
+            df["Quantification"] = df["Quantification"].astype("int64")
+        return df
+
+    def __iter__(self):
+        yield from self.molecules
+        yield "All"
+
+    def __len__(self):
+        return len(self.molecules) + 1
+
+    def __contains__(self, key):
+        return key == "All" or key in self._position
+
+
+def mark_prepared(prepared, params, progress=None, cancel=None, verbose=True):
+    """
+    根据阈值和稀释倍数标记预处理后的数据，只做向量化比较，不重新解析
+    Args:
+        prepared (PreparedFrame): prepare_frame 返回的预处理结果
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调，每个分子调用一次
+        cancel (CancelToken): 取消标记
+        verbose (bool): 是否打印分子数和失败的分子（分块处理时每块不再重复打印）
+    Returns:
+        tuple: (group_dict, processed_results)，见 mark_dataframe
+    Raises:
+        ValueError: 没有处理成功的分子
+    """
+    dilution = params.dilution
+    group_list = prepared.molecules
+    if verbose:
+        print(f'total molecules:{len(group_list)}')
+    processed_results = {
+        "success": [],
+        "failed": [],
+        "unparsed": {}
+    }
+
+    min_vals = prepared.ranges["min"].to_numpy(dtype=float)
+    max_vals = prepared.ranges["max"].to_numpy(dtype=float)
+    row_value = prepared.rows["value"].to_numpy()
+    unparsed = prepared.unparsed
+    all_int = prepared.all_int
+    conversion = None
+    if params.target_unit and prepared.split_error is None:
+        conversion = _unit_conversion(prepared, params.target_unit)
+        row_value = row_value * conversion.row_factor
+        min_vals = min_vals * conversion.molecule_factor
+        max_vals = max_vals * conversion.molecule_factor
+        unparsed = unparsed + conversion.unconverted
+        # 换算后的数值不再按整数输出
+        all_int = np.zeros(len(group_list), dtype=bool)
+    if unparsed is not None:
+        processed_results["unparsed"] = {
+            group_list[i]: int(unparsed[i]) for i in np.flatnonzero(unparsed)
+        }
+
+    ok = np.zeros(len(group_list), dtype=bool)
+    range_strs = np.empty(len(group_list), dtype=object)
+    range_strs_dil = np.empty(len(group_list), dtype=object)
+    for i, group in enumerate(group_list):
+        check_canceled(cancel)
+        try:
+            range_strs[i] = _range_str(min_vals[i], max_vals[i])
+            if dilution != 1.0:
+                range_strs_dil[i] = _range_str(min_vals[i] * dilution, max_vals[i] * dilution)
+            if prepared.split_error is not None:
+                raise prepared.split_error
+            if conversion is not None:
+                # 单位写法不同（多余的空格等）也可以换算，不检查拆分后的列数
+                if np.isnan(conversion.molecule_factor[i]):
+                    unit = conversion.molecule_unit[i]
+                    raise ValueError(
+                        f"Unit {unit} cannot be converted to {params.target_unit}" if unit
+                        else f"No unit to convert to {params.target_unit}"
+                    )
+            elif prepared.width[i] != 2:
+                raise ValueError("Columns must be same length as key")
+            ok[i] = True
+            processed_results["success"].append(group)
+        except Exception as e:
+            if verbose:
+                print(f"Processing {group} failed: {str(e)}")
+            processed_results["failed"].append(group)
+
+    if not ok.any():
+        # 与原实现（合并空的 group_dict）的错误相同
+        raise ValueError("No objects to concatenate")
+
+    rows = prepared.rows
+    codes = rows["code"].to_numpy()
+
+    # 阈值广播回每一行
+    min_status = min_vals * params.min_coeff
+    max_status = max_vals * params.max_coeff
+
+    # 筛选成功的分子以及除了 Standard 之外的样本
+    keep = ok[codes] & ~rows["is_standard"].to_numpy()
+    kept_codes = codes[keep]
+    value = row_value[keep]
+    if conversion is None:
+        unit = rows["Unit"].to_numpy()[keep]
+    else:
+        unit = np.full(len(value), conversion.unit, dtype=object)
+
+    # 状态编码，对应 STATUS_LABELS
+    status_code = np.select(
+        [np.isnan(value), value < min_status[kept_codes], value > max_status[kept_codes]],
+        [0, 1, 2],
+        default=3
+    ).astype(np.int8)
+    # 比较按 float64 进行，之后才转换保存的精度
+    stored_dtype = np.float32 if params.float32 else np.float64
+
+    if params.compact:
+        marked = _compact_marked(prepared, params, keep, kept_codes, value, unit, status_code, stored_dtype,
+                                 min_vals[kept_codes], max_vals[kept_codes])
+    else:
+        marked = pd.DataFrame({
+            "Molecule": rows["Molecule"].to_numpy()[keep],
+            "Replicate": rows["Replicate"].to_numpy()[keep],
+            "Quantification": value.astype(stored_dtype, copy=False),
+            "Standard Range": range_strs[kept_codes],
+            "Unit": unit,
+        })
+        if dilution != 1.0:
+            marked["Quantification(diluted_adjusted)"] = (value * dilution).astype(stored_dtype, copy=False)
+            marked["Standard Range(diluted_adjusted)"] = range_strs_dil[kept_codes]
+        status = STATUS_LABELS[status_code]
+        marked["Standard"] = np.where(status == "In", " ", "*").astype(object)
+        marked["Standard Status"] = status
+    # "All" 只有在所有成功的分子都为整数时才是 int64（与原实现合并各分子表的结果相同），
+    # 否则为保存的精度，其中整数分子的表在访问时转换
+    if all_int[ok].all():
+        marked["Quantification"] = marked["Quantification"].astype("int64")
+
+    # 每个分子对应排序后数据中的一段连续行
+    bounds = np.searchsorted(kept_codes, np.arange(len(group_list) + 1))
+    molecules = []
+    offsets = [0]
+    for i, group in enumerate(group_list):
+        check_canceled(cancel)
+        report_progress(progress, "mark", i + 1, len(group_list))
+        if ok[i]:
+            molecules.append(group)
+            offsets.append(bounds[i + 1])
+    group_dict = MarkedResult(marked, molecules, offsets, rows.index[keep], all_int[ok])
+    return group_dict, processed_results
+
+
+def _compact_marked(prepared, params, keep, kept_codes, value, unit, status_code, stored_dtype, min_vals, max_vals):
+    """
+    紧凑模式的标记结果：文本列为 category，标准范围为数值列（写出时由 display_frame 格式化）
+    Args:
+        keep (ndarray): prepared.rows 中保留的行
+        kept_codes (ndarray): 保留的行的分子序号
+        value (ndarray): 保留的行的数值（float64）
+        unit (ndarray): 保留的行的单位
+        status_code (ndarray): Standard Status 的编码，对应 STATUS_LABELS
+        stored_dtype: Quantification 保存的数据类型
+        min_vals (ndarray): 保留的行所属分子的标准范围最小值
+        max_vals (ndarray): 保留的行所属分子的标准范围最大值
+    Returns:
+        DataFrame: 列顺序与普通模式相同，Standard Range 换成 Standard Min、Standard Max
+    """
+    rows = prepared.rows
+    marked = pd.DataFrame({
+        "Molecule": pd.Categorical.from_codes(kept_codes, categories=prepared.molecules),
+        "Replicate": pd.Categorical(rows["Replicate"].to_numpy()[keep]),
+        "Quantification": value.astype(stored_dtype, copy=False),
+        "Standard Min": min_vals,
+        "Standard Max": max_vals,
+        "Unit": pd.Categorical(unit),
+    })
+    if params.dilution != 1.0:
+        marked["Quantification(diluted_adjusted)"] = (value * params.dilution).astype(stored_dtype, copy=False)
+        marked["Standard Min(diluted_adjusted)"] = min_vals * params.dilution
+        marked["Standard Max(diluted_adjusted)"] = max_vals * params.dilution
+    marked["Standard"] = pd.Categorical.from_codes((status_code != 3).astype(np.int8), categories=[" ", "*"])
+    marked["Standard Status"] = pd.Categorical.from_codes(status_code, categories=list(STATUS_LABELS))
+    return marked
+
+
+def mark_dataframe(df, params, progress=None, cancel=None):
+    """
+    按分子计算标准范围并标记每个样本的状态（向量化，一次遍历）
+
+    标准范围由一次 groupby 得到，阈值按分子广播回每一行，
+    Standard/Standard Status 由向量化比较得到。结果与 mark_dataframe_legacy 相同。
+    Args:
+        df (DataFrame): read_input 返回的数据框
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调，每个分子调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (group_dict, processed_results)
+            group_dict 为 MarkedResult，key 为分子名称，"All" 为合并后的数据；
+            processed_results 记录处理成功和失败的分子
+    """
+    return mark_prepared(prepare_frame(df, cancel), params, progress, cancel)
+
+
+def mark_dataframe_legacy(df, params, progress=None, cancel=None):
+    """
+    逐分子标记（原始实现，作为 mark_dataframe 的参考结果）
+
+    输入可以是 read_input_legacy 或 read_input 的结果
+    Args:
+        df (DataFrame): read_input 返回的数据框
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调，每个分子调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (group_dict, processed_results)
+            group_dict 的 key 为分子名称，"All" 为合并后的数据；
+            processed_results 记录处理成功和失败的分子
+    """
+    min_coeff = params.min_coeff
+    max_coeff = params.max_coeff
+    dilution = params.dilution
+
+    group_list = molecule_list(df)
+    print(f'total molecules:{len(group_list)}')
+    group_dict = {}
+    # 布尔值也转换为 "true"/"false"
+    df = df.assign(**{"Exclude From Calibration": df["Exclude From Calibration"].astype(str).str.lower()})
+
+    # 记录处理结果
+    processed_results = {
+        "success": [],
+        "failed": []
+    }
+
+    for i, group in enumerate(group_list):
+        check_canceled(cancel)
+        report_progress(progress, "mark", i + 1, len(group_list))
+        try:
+            dft = df[df["Molecule"] == group].copy()
+            dft_i = dft[(dft["Sample Type"] == "Standard") & (dft["Exclude From Calibration"] == "false")]
+            min_val = dft_i["Analyte Concentration"].min()
+            max_val = dft_i["Analyte Concentration"].max()
+            # 标准范围（原始）
+            dft["Standard Range"] = _range_str(min_val, max_val)
+
+            dft[["Quantification", "Unit"]] = dft["Quantification"].str.split(' ', expand=True)
+            dft["Quantification"] = pd.to_numeric(dft["Quantification"], errors='coerce')
+
+            # 稀释修正后列，仅当dilution!=1时生成
+            if dilution != 1.0:
+                dft["Quantification(diluted_adjusted)"] = dft["Quantification"] * dilution
+                min_val_diluted = min_val * dilution
+                max_val_diluted = max_val * dilution
+                dft["Standard Range(diluted_adjusted)"] = _range_str(min_val_diluted, max_val_diluted)
+
+            min_val_status = min_val * min_coeff
+            max_val_status = max_val * max_coeff
+
+            # 筛选除了 Standard 之外的样本
+            dft = dft[dft["Sample Type"] != "Standard"]
+            dft.drop(columns=["Sample Type", "Analyte Concentration", "Exclude From Calibration"], inplace=True)
+
+            def status_func(x):
+                if pd.isna(x):
+                    return ""
+                if x < min_val_status:
+                    return "Low"
+                elif x > max_val_status:
+                    return "High"
+                else:
+                    return "In"
+            dft["Standard"] = dft["Quantification"].apply(lambda x: " " if status_func(x) == "In" else "*")
+            dft["Standard Status"] = dft["Quantification"].apply(status_func)
+
+            group_dict[group] = dft
+            processed_results["success"].append(group)
+        except Exception as e:
+            print(f"Processing {group} failed: {str(e)}")
+            processed_results["failed"].append(group)
+
+    # 将字典中的数据框合并为一个数据框, and save to dict named "All"
+    group_dict["All"] = pd.concat(group_dict.values(), ignore_index=True)
+    return group_dict, processed_results
+
+
+def _grouped_values(df, dilution):
+    """分组使用的数值：Quantification 按稀释倍数换算，"Out" 状态的值置空"""
+    quantification = df["Quantification"]
+    if quantification.dtype == np.float32:
+        quantification = pd.Series(_float32_to_float64(quantification), index=df.index)
+    quantification = quantification.mask(df["Standard Status"] == "Out")
+    return pd.to_numeric(quantification, errors='coerce') * dilution
+
+
+def _parse_replicates(uniques, individual):
+    """
+    对 Replicate 的每个唯一值解析一次组别
+    Args:
+        uniques (ndarray): Replicate 的唯一值
+        individual (str): 组别名称
+    Returns:
+        tuple: (matched, groups, replicates)，matched 为 None 表示组别名称不是合法的正则表达式；
+            groups 为列名（前缀去掉 "d_" 后加 "_组别"），replicates 为 "_组别_" 之后的部分，
+            不含 "_组别_" 时为 None
+    """
+    try:
+        # 与 str.contains/str.split 相同，组别名称按正则表达式处理
+        contains = re.compile(individual)
+        splitter = re.compile(f"_{individual}_")
+    except re.error:
+        return None, None, None
+    matched = np.zeros(len(uniques), dtype=bool)
+    groups = np.empty(len(uniques), dtype=object)
+    replicates = np.empty(len(uniques), dtype=object)
+    for j, value in enumerate(uniques):
+        if not isinstance(value, str) or contains.search(value) is None:
+            continue
+        parts = splitter.split(value)
+        matched[j] = True
+        groups[j] = parts[0].replace("d_", "") + "_" + individual
+        if len(parts) > 1:
+            replicates[j] = parts[1]
+    return matched, groups, replicates
+
+
+def _sorted_codes(values, na_first=False):
+    """
+    按排序后的位置编码，与 pivot 的行列顺序一致
+    Returns:
+        tuple: (codes, labels)，na_first 为 True 时 None 编码为 0 且对应 NaN
+    """
+    present = values != None  # noqa: E711
+    labels = sorted(set(values[present]))
+    lookup = {label: k for k, label in enumerate(labels)}
+    offset = 1 if na_first else 0
+    codes = np.zeros(len(values), dtype=np.int64)
+    codes[present] = [lookup[v] + offset for v in values[present]]
+    if na_first:
+        labels = [np.nan] + labels
+    return codes, labels
+
+
+def _group_blocks(frames, group_list, dilution, cancel=None, combined=None):
+    """
+    合并所有分子的 Replicate 和数值，对每个组别一次解析、一次排序（process_group 和 group_long 共用）
+    Args:
+        frames (list): 各分子的标记结果
+        group_list (list): 组别列表
+        dilution (float): 稀释倍数
+        combined (DataFrame): frames 依次首尾相接组成的数据框（MarkedResult 的 "All"），
+            给出时直接使用其中的列，不再逐个分子计算后合并
+    Returns:
+        tuple: (values_list, values, sheet_codes, sheet_fallback, blocks)：各分子的分组数值、
+            合并后的数值、每行所属分子、需要交给 _process_individual_data 的分子，
+            以及组别 -> (match_count, has_rep, duplicated, segments, rows, row_code, col_code,
+            row_labels, col_labels)，rows 按分子、行、列排序；组别名称不合法时为 None
+    """
+    # 合并所有分子的 Replicate 和数值
+    lengths = np.array([len(df) for df in frames])
+    sheet_codes = np.repeat(np.arange(len(frames)), lengths)
+    # 稀释倍数为浮点数时各分子的数值都为 float64，与整个表一起计算的结果相同
+    if combined is not None and isinstance(dilution, float):
+        replicates = combined["Replicate"].to_numpy(dtype=object)
+        combined_values = _grouped_values(combined, dilution)
+        values = combined_values.to_numpy(dtype=float, na_value=np.nan)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        values_list = []
+        for i, df in enumerate(frames):
+            sheet_values = combined_values.iloc[offsets[i]:offsets[i + 1]]
+            sheet_values.index = df.index
+            values_list.append(sheet_values)
+    else:
+        replicates = np.concatenate([df["Replicate"].to_numpy(dtype=object) for df in frames])
+        values_list = [_grouped_values(df, dilution) for df in frames]
+        values = np.concatenate([v.to_numpy(dtype=float, na_value=np.nan) for v in values_list])
+    unique_codes, uniques = pd.factorize(replicates)
+    uniques = np.asarray(uniques, dtype=object)
+
+    # 含缺失值或非字符串 Replicate 的分子交给原实现（str.contains 会报错）
+    is_str = np.array([isinstance(value, str) for value in uniques], dtype=bool)
+    row_invalid = (unique_codes < 0) | ~is_str[unique_codes]
+    sheet_fallback = np.bincount(sheet_codes[row_invalid], minlength=len(frames)) > 0
+    for i, df in enumerate(frames):
+        if not (pd.api.types.is_object_dtype(df["Replicate"]) or pd.api.types.is_string_dtype(df["Replicate"])):
+            sheet_fallback[i] = True
+
+    blocks = {}
+    for individual in group_list:
+        check_canceled(cancel)
+        matched, groups, reps = _parse_replicates(uniques, individual)
+        if matched is None:
+            blocks[individual] = None
+            continue
+        row_matched = ~row_invalid & matched[np.where(unique_codes < 0, 0, unique_codes)]
+        rows = np.flatnonzero(row_matched)
+        match_count = np.bincount(sheet_codes[rows], minlength=len(frames))
+        has_rep = np.bincount(sheet_codes[rows[reps[unique_codes[rows]] != None]],  # noqa: E711
+                              minlength=len(frames)) > 0
+        row_code, row_labels = _sorted_codes(reps[unique_codes[rows]], na_first=True)
+        col_code, col_labels = _sorted_codes(groups[unique_codes[rows]])
+        # 一次排序：分子、行、列
+        order = np.lexsort((col_code, row_code, sheet_codes[rows]))
+        rows, row_code, col_code = rows[order], row_code[order], col_code[order]
+        sheets = sheet_codes[rows]
+        same = (np.diff(sheets) == 0) & (np.diff(row_code) == 0) & (np.diff(col_code) == 0)
+        duplicated = np.bincount(sheets[1:][same], minlength=len(frames)) > 0
+        segments = np.searchsorted(sheets, np.arange(len(frames) + 1))
+        blocks[individual] = (match_count, has_rep, duplicated, segments, rows, row_code, col_code,
+                              np.asarray(row_labels, dtype=object), np.asarray(col_labels, dtype=object))
+    return values_list, values, sheet_codes, sheet_fallback, blocks
+
+
+def process_group(group_dict, params, progress=None, cancel=None):
+    """
+    处理分组数据，将数据按照不同的组别进行拆分和重组
+
+    Replicate 的每个唯一值对每个组别只解析一次（所有分子共用），所有分子的数据合并后
+    一次排序、一次检查重复，再按分子切片填充透视表。结果与 process_group_legacy 相同；
+    Replicate 有缺失值、组别名称不合法或存在重复等会导致 pivot 报错的情况，
+    交给 _process_individual_data 处理以得到相同的错误。
+    Args:
+        group_dict (dict): 包含所有分组数据的字典
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调，每个分子调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (result_dict, failed_groups) 处理后的分组数据字典和数据中不存在的组别
+    """
+    group_list = params.group_list
+    if not group_list:
+        print("No group list input, skip group processing")
+        return {}, []
+
+    result_dict = {}
+    failed_groups = []
+    sheet_names = [key for key in group_dict.keys() if key != 'All']
+    if not sheet_names:
+        return result_dict, failed_groups
+
+    frames = [group_dict[name] for name in sheet_names]
+    combined = group_dict["All"] if isinstance(group_dict, MarkedResult) else None
+    values_list, values, _, sheet_fallback, blocks = _group_blocks(frames, group_list, params.dilution,
+                                                                   cancel, combined)
+
+    for i, sheet_name in enumerate(sheet_names):
+        check_canceled(cancel)
+        report_progress(progress, "group", i + 1, len(sheet_names))
+        df = frames[i]
+        print(f"Processing sheet: {sheet_name}")
+        for individual in group_list:
+            block = blocks[individual]
+            fallback = sheet_fallback[i] or block is None
+            if not fallback:
+                match_count, has_rep, duplicated, segments, rows, row_code, col_code, row_labels, col_labels = block
+                fallback = match_count[i] > 0 and (not has_rep[i] or duplicated[i])
+            if fallback:
+                replicate = df["Replicate"]
+                if isinstance(replicate.dtype, pd.CategoricalDtype):
+                    # 紧凑模式，与普通模式相同按字符串处理
+                    replicate = replicate.astype(object)
+                processed_data = _process_individual_data(
+                    pd.DataFrame({"Replicate": replicate, "Quantification": values_list[i]}),
+                    individual, params.control_group
+                )
+            elif match_count[i] == 0:
+                print(f"Group {individual} not found in data")
+                processed_data = None
+            else:
+                start, stop = segments[i], segments[i + 1]
+                row_used, row_index = np.unique(row_code[start:stop], return_inverse=True)
+                col_used, col_index = np.unique(col_code[start:stop], return_inverse=True)
+                data = np.full((len(row_used), len(col_used)), np.nan)
+                data[row_index, col_index] = values[rows[start:stop]]
+                processed_data = pd.DataFrame(
+                    data,
+                    index=pd.Index(list(row_labels[row_used])),
+                    columns=pd.Index(list(col_labels[col_used]), name="Group"),
+                )
+                # 没有空位时保留原数据类型，与 pivot 一致
+                if len(data) and not np.isnan(data).any() and values_list[i].dtype != data.dtype:
+                    processed_data = processed_data.astype(values_list[i].dtype)
+                if params.control_group:
+                    control_group = params.control_group
+                    processed_data = processed_data[sorted(
+                        processed_data.columns,
+                        key=lambda x: control_group in x if x else False,
+                        reverse=True
+                    )]
+            if processed_data is not None:
+                result_dict[f"{sheet_name}_{individual}"] = processed_data
+            else:
+                failed_groups.append(individual)
+    return result_dict, failed_groups
+
+
+def _column_rank(col_labels, control_group):
+    """列的排列位置：按列名排序，有控制组时包含控制组名称的列在前（与 process_group 相同）"""
+    order = list(range(len(col_labels)))
+    if control_group:
+        order.sort(key=lambda k: control_group in col_labels[k] if col_labels[k] else False, reverse=True)
+    rank = np.empty(len(col_labels), dtype=np.int64)
+    rank[order] = np.arange(len(col_labels))
+    return rank
+
+
+def _restore_dtype(values, values_list):
+    """没有空值时恢复各分子分组数值的共同类型（例如整数），与 process_group 的表一致"""
+    dtype = np.result_type(*[v.dtype for v in values_list]) if values_list else values.dtype
+    if len(values) and dtype != values.dtype and not np.isnan(values).any():
+        return values.astype(dtype)
+    return values
+
+
+def group_long(group_dict, params, progress=None, cancel=None):
+    """
+    分组数据的长表布局（params.group_layout 为 "long" 或 "long-wide" 时代替 process_group）
+
+    所有分子、所有组别的样本在一次重排中合并为一个长表，每行为一个与组别匹配的样本：
+    Molecule、Group（组别）、Prefix（Replicate 中 "_组别_" 之前的部分，去掉 "d_"）、
+    Replicate（之后的部分）和 Quantification（与 process_group 相同：乘以稀释倍数，Out 为空）。
+    行按分子、组别列表、列（控制组在前）、Replicate 排列，即 process_group 各表按列展开的顺序。
+    Replicate 缺失或不是文本的样本不属于任何组别，重复的样本都保留。
+
+    "long-wide" 时另外每个组别一个宽表：列为 Molecule、Replicate 和该组别出现的所有列，
+    各分子的行依次排列，每个分子的部分与 process_group 中 分子_组别 的表相同。
+    Args:
+        group_dict (dict): 包含所有分组数据的字典
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调，完成时调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (result_dict, failed_groups)，result_dict 为 {GROUPED_LONG_SHEET: 长表}，
+            "long-wide" 时另有 {组别: 宽表}；没有任何样本与组别匹配时为空
+    Raises:
+        ValueError: 组别名称不是合法的正则表达式，或宽表中同一分子的 Replicate 和列重复
+    """
+    if params.group_layout not in GROUP_LAYOUTS[1:]:
+        raise ValueError(f"Unknown grouped layout: {params.group_layout}. Available: {', '.join(GROUP_LAYOUTS)}")
+    group_list = params.group_list
+    if not group_list:
+        print("No group list input, skip group processing")
+        return {}, []
+    sheet_names = [key for key in group_dict.keys() if key != 'All']
+    if not sheet_names:
+        return {}, []
+
+    frames = [group_dict[name] for name in sheet_names]
+    combined = group_dict["All"] if isinstance(group_dict, MarkedResult) else None
+    values_list, values, sheet_codes, _, blocks = _group_blocks(frames, group_list, params.dilution,
+                                                                cancel, combined)
+    molecule_labels = np.asarray(sheet_names, dtype=object)
+    parts = []
+    wide = {}
+    missing = np.zeros((len(sheet_names), len(group_list)), dtype=bool)
+    for g, individual in enumerate(group_list):
+        check_canceled(cancel)
+        block = blocks[individual]
+        if block is None:
+            raise ValueError(f"Group name {individual!r} is not a valid regular expression")
+        match_count, _, duplicated, _, rows, row_code, col_code, row_labels, col_labels = block
+        missing[:, g] = match_count == 0
+        if not len(rows):
+            print(f"Group {individual} not found in data")
+            continue
+        sheets = sheet_codes[rows]
+        col_rank = _column_rank(col_labels, params.control_group)
+        prefixes = np.array([label[:len(label) - len(individual) - 1] for label in col_labels], dtype=object)
+        # 按列展开：分子、列、行
+        order = np.lexsort((row_code, col_rank[col_code], sheets))
+        parts.append((sheets[order], np.full(len(rows), g), prefixes[col_code[order]],
+                      row_labels[row_code[order]], values[rows[order]]))
+
+        if params.group_layout == "long-wide":
+            if duplicated.any():
+                molecule = sheet_names[int(np.flatnonzero(duplicated)[0])]
+                raise ValueError(f"Duplicate Replicate values for group {individual} in {molecule}, "
+                                 "cannot build the wide table")
+            # rows 已按分子、行、列排序，(分子, 行) 的唯一值即宽表的行
+            row_key = sheets * len(row_labels) + row_code
+            row_used, row_index = np.unique(row_key, return_inverse=True)
+            col_used = np.unique(col_code)
+            col_used = col_used[np.argsort(col_rank[col_used], kind="stable")]
+            col_index = np.empty(len(col_labels), dtype=np.int64)
+            col_index[col_used] = np.arange(len(col_used))
+            data = np.full((len(row_used), len(col_used)), np.nan)
+            data[row_index, col_index[col_code]] = values[rows]
+            table = pd.DataFrame(_restore_dtype(data, values_list), columns=list(col_labels[col_used]))
+            table.insert(0, "Replicate", row_labels[row_used % len(row_labels)])
+            table.insert(0, "Molecule", molecule_labels[row_used // len(row_labels)])
+            wide[individual] = table
+
+    # 与 process_group 相同，每个分子中不存在的组别记录一次
+    failed_groups = [group_list[g] for _, g in zip(*np.nonzero(missing))]
+    report_progress(progress, "group", len(sheet_names), len(sheet_names))
+    if not parts:
+        return {}, failed_groups
+    sheets, groups, prefixes, replicates, quantification = (np.concatenate(arrays) for arrays in zip(*parts))
+    # 各组别内已按分子排序，稳定排序后为分子、组别列表的顺序
+    order = np.argsort(sheets, kind="stable")
+    long_table = pd.DataFrame({
+        "Molecule": molecule_labels[sheets[order]],
+        "Group": np.asarray(group_list, dtype=object)[groups[order]],
+        "Prefix": prefixes[order],
+        "Replicate": replicates[order],
+        "Quantification": _restore_dtype(quantification[order], values_list),
+    })
+    return {GROUPED_LONG_SHEET: long_table, **wide}, failed_groups
+
+
+def process_group_legacy(group_dict, params, progress=None, cancel=None):
+    """
+    处理分组数据，逐个分子、逐个组别筛选并生成透视表（原实现，用于对照）
+    Args:
+        group_dict (dict): 包含所有分组数据的字典
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调，每个分子调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (result_dict, failed_groups) 处理后的分组数据字典和数据中不存在的组别
+    """
+    group_list = params.group_list
+    if not group_list:
+        print("No group list input, skip group processing")
+        return {}, []
+
+    result_dict = {}
+    failed_groups = []
+    sheet_names = [key for key in group_dict.keys() if key != 'All']
+    for i, sheet_name in enumerate(sheet_names):
+        check_canceled(cancel)
+        report_progress(progress, "group", i + 1, len(sheet_names))
+        df = group_dict[sheet_name]
+        print(f"Processing sheet: {sheet_name}")
+        processed_data = _process_sheet_data(
+            df, group_list, params.control_group, sheet_name, failed_groups, params.dilution
+        )
+        if processed_data:
+            result_dict.update(processed_data)
+    return result_dict, failed_groups
+
+
+def _process_sheet_data(df, group_list, control_group, sheet_name, failed_groups, dilution=1.0):
+    """
+    处理单个sheet的数据
+    Args:
+        df (DataFrame): 原始数据框
+        group_list (list): 组别列表
+        control_group (str): 控制组名称（可选）
+        sheet_name (str): 当前sheet名称
+        failed_groups (list): 记录数据中不存在的组别
+        dilution (float): 稀释倍数
+    Returns:
+        dict: 处理后的数据字典
+    """
+    result_dict = {}
+    # 处理Quantification列, "Out" 状态的值置空
+    quantification = df["Quantification"].mask(df["Standard Status"] == "Out")
+    df = pd.DataFrame({
+        "Replicate": df["Replicate"],
+        "Quantification": pd.to_numeric(quantification, errors='coerce') * dilution,
+    })
+    for individual in group_list:
+        processed_data = _process_individual_data(df, individual, control_group)
+        if processed_data is not None:
+            result_dict[f"{sheet_name}_{individual}"] = processed_data
+        else:
+            failed_groups.append(individual)
+    return result_dict
+
+
+def _process_individual_data(df, individual, control_group):
+    """
+    处理单个组别的数据
+
+    Args:
+        df (DataFrame): 原始数据框
+        individual (str): 组别名称
+        control_group (str): 控制组名称（可选）
+
+    Returns:
+        DataFrame: 处理后的数据框，如果组别不存在则返回None
+    """
+    # 筛选特定组别的数据
+    df_individual = df[df["Replicate"].str.contains(individual)].copy()
+    if df_individual.empty:
+        print(f"Group {individual} not found in data")
+        return None
+
+    # 分割Replicate列
+    split_df = df_individual["Replicate"].str.split(f'_{individual}_', expand=True)
+    df_individual['Group'] = split_df[0]
+    df_individual['Replicate'] = split_df[1]
+    df_individual['Individual'] = individual
+
+    # 处理Group列
+    df_individual["Group"] = df_individual["Group"].str.replace("d_", "") + "_" + df_individual['Individual']
+
+    # 转换为透视表
+    df_pivot = df_individual.pivot(
+        index='Replicate',
+        columns='Group',
+        values='Quantification'
+    )
+    df_pivot.index.name = None
+
+    # 如果有控制组，则按控制组优先排序
+    if control_group:
+        df_pivot = df_pivot[sorted(
+            df_pivot.columns,
+            key=lambda x: control_group in x if x else False,
+            reverse=True
+        )]
+
+    return df_pivot
+
+
+# 大 sheet 分块写出，每块之间检查取消
+WRITE_CHUNK_ROWS = 10000
+
+
+def _to_excel_chunked(df, writer, sheet_name, cancel=None):
+    """分块写出一个 sheet，结果与一次 to_excel(index=False) 相同"""
+    for start in range(0, max(len(df), 1), WRITE_CHUNK_ROWS):
+        check_canceled(cancel)
+        display_frame(df.iloc[start:start + WRITE_CHUNK_ROWS]).to_excel(
+            writer, sheet_name=sheet_name, index=False,
+            header=start == 0, startrow=start + 1 if start else 0
+        )
+
+
+@contextmanager
+def excel_writer(path, progress=None, cancel=None):
+    """
+    pd.ExcelWriter，在保存前检查取消。工作簿在关闭时才一次性保存，这一步不能中断：
+    开始保存前报告 "save" 阶段；取消或出错时不保存并删除文件
+    Args:
+        path (str): 文件路径
+        progress (callable): 进度回调
+        cancel (CancelToken): 取消标记
+    Raises:
+        ProcessingCanceled: 保存前被取消
+    """
+    # 自己打开文件，放弃保存时也能关闭它
+    handle = open(path, "wb")
+    try:
+        writer = pd.ExcelWriter(handle)
+        yield writer
+        check_canceled(cancel)
+        report_progress(progress, "save", 0, 0)
+        writer.close()
+    except BaseException:
+        handle.close()
+        os.remove(path)
+        raise
+    handle.close()
+
+
+def write_marked(group_dict, save_path_marked, progress=None, cancel=None):
+    """保存标记结果，"All" 为第一个 sheet，其余每个分子一个 sheet"""
+    sheet_names = ["All"] + [key for key in group_dict.keys() if key != "All"]
+    with excel_writer(save_path_marked, progress, cancel) as writer:
+        for i, key in enumerate(sheet_names):
+            _to_excel_chunked(group_dict[key], writer, key, cancel)
+            report_progress(progress, "write_marked", i + 1, len(sheet_names))
+
+
+def write_grouped(res_dict, save_path_grouped, progress=None, cancel=None):
+    """保存分组结果，每个 分子_组别 一个 sheet"""
+    with excel_writer(save_path_grouped, progress, cancel) as writer:
+        for i, (sheet_name, dft) in enumerate(res_dict.items()):
+            check_canceled(cancel)
+            # set index name to replicate
+            dft.index.name = "Replicate"
+            dft.to_excel(writer, sheet_name=sheet_name, index=True)
+            report_progress(progress, "write_grouped", i + 1, len(res_dict))
+
+
+def write_or_remove(write_func, data, path, progress, cancel):
+    """写出文件，取消时删除未写完的文件"""
+    try:
+        write_func(data, path, progress, cancel)
+    except ProcessingCanceled:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def load_source(source, params, recorder, cancel=None, cache=None):
+    """
+    读取并预处理输入，记录 read/prepare（或使用缓存时的 load）阶段
+    Args:
+        source (str, DataFrame or PreparedFrame): CSV 文件路径、数据框或预处理结果
+        params (MarkerParams): 处理参数
+        recorder (RunRecorder): 运行记录
+        cancel (CancelToken): 取消标记
+        cache (scfa_cache.PreparedCache): 预处理结果缓存，source 为文件路径时使用
+    Returns:
+        PreparedFrame: 预处理结果
+    """
+    if isinstance(source, PreparedFrame):
+        return source
+    if cache is not None and not isinstance(source, pd.DataFrame):
+        hits = cache.hits
+        with recorder.phase("load") as record:
+            prepared = cache.load(source, params.csv_engine, cancel)
+            record.update(rows=len(prepared.rows), cached=cache.hits > hits)
+        return prepared
+    with recorder.phase("read") as record:
+        df = read_input(source, params.csv_engine, cancel)
+        record["rows"] = len(df)
+    with recorder.phase("prepare", rows=len(df)):
+        return prepare_frame(df, cancel)
+
+
+def process_frame(source, params, filename="", progress=None, cancel=None, cache=None, recorder=None):
+    """
+    标记并分组数据，不写出任何文件
+    Args:
+        source (str, DataFrame or PreparedFrame): CSV 文件路径、数据框或预处理结果
+        params (MarkerParams): 处理参数
+        filename (str): 结果中记录的文件名，默认为 source 路径
+        progress (callable): 进度回调 progress(stage, done, total)
+        cancel (CancelToken): 取消标记，取消时抛出 ProcessingCanceled
+        cache (scfa_cache.PreparedCache): 预处理结果缓存，source 为文件路径时使用
+        recorder (RunRecorder): 运行记录，默认新建，结果保存在 result.report
+    Returns:
+        FileResult: 包含 marked 和 grouped 数据的处理结果
+    """
+    if not filename and not isinstance(source, (pd.DataFrame, PreparedFrame)):
+        filename = source
+    result = FileResult(filename=filename)
+    if recorder is None:
+        recorder = scfa_report.RunRecorder(params.save_report or params.profile)
+        progress = recorder.wrap_progress(progress)
+    check_canceled(cancel)
+    prepared = load_source(source, params, recorder, cancel, cache)
+    if params.calibration_store:
+        with recorder.phase("calibration", rows=len(prepared.molecules)):
+            prepared, result.calibrated = apply_calibration(prepared, params)
+    if filename:
+        print(f'Start processing file: {os.path.basename(filename)}')
+
+    with recorder.phase("mark", rows=len(prepared.rows)) as record:
+        result.marked, processed_results = mark_prepared(prepared, params, progress, cancel)
+    if params.save_report:
+        # 标记结果占用的内存，用于比较普通模式和紧凑模式
+        record["frame_mb"] = scfa_report.frame_memory_mb(result.marked["All"])
+    result.success = processed_results["success"]
+    result.failed = processed_results["failed"]
+    result.unparsed = processed_results["unparsed"]
+
+    if params.split_by_group:
+        try:
+            with recorder.phase("group", rows=len(result.marked["All"])):
+                group_func = process_group if params.group_layout == "sheets" else group_long
+                result.grouped, result.failed_groups = group_func(result.marked, params, progress, cancel)
+        except ProcessingCanceled:
+            raise
+        except Exception as e:
+            result.group_failed.append(f"Group processing: {str(e)}")
+    input_rows = np.bincount(prepared.rows["code"].to_numpy(), minlength=len(prepared.molecules))
+    input_rows = dict(zip(prepared.molecules, input_rows.tolist()))
+    result.report = recorder.report(
+        str(filename), params, _molecule_report(result, recorder, input_rows, params.group_list)
+    )
+    return result
+
+
+def _molecule_report(result, recorder, input_rows, group_list=()):
+    """
+    每个分子的行数和耗时（分组和写出阶段中该分子的 sheet 的耗时之和）
+    Args:
+        result (FileResult): 处理结果
+        recorder (RunRecorder): 运行记录
+        input_rows (dict): 分子 -> 输入行数
+        group_list (list): 组别列表
+    Returns:
+        list: 每个分子一个 dict
+    """
+    molecules = [key for key in result.marked.keys() if key != "All"]
+    seconds = dict.fromkeys(molecules, 0.0)
+    timed = False
+    for phase, durations in recorder.items.items():
+        stage = phase.split(":")[0]
+        if stage == "group":
+            names = molecules
+        elif stage == "write_marked":
+            names = ["All"] + molecules
+        elif stage == "write_grouped":
+            # GROUPED 的 sheet 名称为 分子_组别
+            owner = {f"{m}_{g}": m for m in molecules for g in group_list}
+            names = [owner.get(key) for key in result.grouped]
+        else:
+            continue
+        if len(durations) != len(names):
+            continue
+        timed = True
+        for name, duration in zip(names, durations):
+            if name in seconds:
+                seconds[name] += duration
+
+    calibrated = set(result.calibrated)
+    report = []
+    for molecule in result.success + result.failed:
+        entry = {
+            "molecule": molecule,
+            "status": "success" if molecule in result.marked else "failed",
+            "input_rows": int(input_rows.get(molecule, 0)),
+            "marked_rows": len(result.marked[molecule]) if molecule in result.marked else 0,
+            "unparsed_rows": result.unparsed.get(molecule, 0),
+            "range_source": "store" if molecule in calibrated else "file",
+        }
+        if timed and molecule in seconds:
+            entry["seconds"] = round(seconds[molecule], 4)
+        report.append(entry)
+    return report
+
+
+def process_file(source, save_path, params, filename="", progress=None, cancel=None, cache=None):
+    """
+    处理单个文件并保存 MARKED_* 和 GROUPED_* 文件（格式见 params.output_formats）
+    Args:
+        source (str, DataFrame or PreparedFrame): CSV 文件路径、数据框或预处理结果
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        filename (str): 用于命名输出文件，source 为数据框时必须提供
+        progress (callable): 进度回调 progress(stage, done, total)
+        cancel (CancelToken): 取消标记，取消时抛出 ProcessingCanceled，不保留未写完的文件
+        cache (scfa_cache.PreparedCache): 预处理结果缓存，见 process_frame
+    Returns:
+        FileResult: 处理结果，result.report 为运行报告
+    """
+    import scfa_output
+
+    if params.stream_rows > 0 and isinstance(source, str):
+        import scfa_stream
+        return scfa_stream.process_file_stream(source, save_path, params, filename, progress, cancel)
+
+    recorder = scfa_report.RunRecorder(params.save_report or params.profile)
+    progress = recorder.wrap_progress(progress)
+    profiler = None
+    if params.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        result = process_frame(source, params, filename, progress, cancel, cache, recorder)
+        if not result.filename:
+            raise ValueError("A filename is required to name the output files.")
+        scfa_output.write_outputs(result, save_path, params, progress, cancel, recorder)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    return finish_report(result, save_path, params, recorder, profiler)
+
+
+def finish_report(result, save_path, params, recorder, profiler=None, molecules=None):
+    """
+    写出之后重新生成运行报告（包含写出阶段），按参数保存 PROFILE_* 和 REPORT_* 文件
+    Args:
+        result (FileResult): 已写出的处理结果
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        recorder (RunRecorder): 处理和写出该文件时使用的运行记录
+        profiler (cProfile.Profile): 已停止的 profiler，为 None 时不保存 PROFILE_*
+        molecules (list): 报告中每个分子的信息，默认由 result 重新生成
+            （流式处理不保留标记结果，由 scfa_stream 提供）
+    Returns:
+        FileResult: 更新 report 和 saved_files 后的处理结果
+    """
+    if molecules is None:
+        input_rows = {m["molecule"]: m["input_rows"] for m in result.report["molecules"]}
+        molecules = _molecule_report(result, recorder, input_rows, params.group_list)
+    result.report = recorder.report(str(result.filename), params, molecules)
+    original_name = output_name(result.filename)
+    if profiler is not None:
+        import io
+        import pstats
+
+        profile_path = os.path.join(save_path, f"PROFILE_{original_name}.prof")
+        profiler.dump_stats(profile_path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(25)
+        result.report["profile_file"] = profile_path
+        result.report["profile"] = stream.getvalue().splitlines()
+    if params.save_report:
+        report_path = os.path.join(save_path, f"REPORT_{original_name}.json")
+        result.report["report_file"] = report_path
+        scfa_report.save_report(result.report, report_path)
+        result.saved_files.append(report_path)
+    return result
+
+
+def format_message(result, params):
+    """生成结果对话框中显示的文本"""
+    msg = f"File processing completed.\n"
+    msg += "Saved files:\n"
+    for f in result.saved_files:
+        msg += f"{f}\n"
+    msg += "\n"
+    if result.success:
+        msg += f"Successfully processed molecules ({len(result.success)}):\n"
+        msg += ", ".join(result.success) + "\n\n"
+    if result.failed:
+        msg += f"Failed molecules ({len(result.failed)}):\n"
+        msg += ", ".join(result.failed) + "\n\n"
+    if result.calibrated:
+        msg += (f"Standard ranges from calibration batch '{params.calibration_batch}' "
+                f"({len(result.calibrated)}):\n")
+        msg += ", ".join(result.calibrated) + "\n\n"
+    if result.unparsed:
+        msg += f"Unparsed Quantification values ({sum(result.unparsed.values())}):\n"
+        msg += ", ".join(f"{m} ({n})" for m, n in result.unparsed.items()) + "\n\n"
+    if params.split_by_group:
+        if result.group_success:
+            msg += "Group processing succeeded\n"
+        if result.group_failed:
+            msg += f"Group processing failed:\n{result.group_failed[0]}\n"
+    return msg
@@ -0,0 +1,688 @@
+"""
+SCFA Marker 输出格式
+
+Each output format knows how to write the marked tables (the "All" table
+plus one table per molecule) and the grouped tables. Besides the default
+pandas/openpyxl workbook there is a streaming Excel mode that writes rows
+with constant memory (xlsxwriter when installed, otherwise openpyxl's
+write-only mode), and Parquet/Feather/CSV outputs for pipelines that
+read columnar files directly. Every format can also be opened as an
+append-only stream (open_stream), which the chunked streaming mode uses to
+write a file piece by piece without holding the whole table.
+"""
+import os
+import re
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+import scfa_engine
+from scfa_engine import check_canceled, display_frame, report_progress
+
+# 流式写出时每次转换的行数
+STREAM_CHUNK_ROWS = 10000
+# 合并输出的文件名（不含扩展名）和来源文件列
+CONSOLIDATED_NAME = "CONSOLIDATED_MARKED"
+SOURCE_COLUMN = "Source File"
+# Excel 每个 sheet 的最大行数（包括表头）
+EXCEL_MAX_ROWS = 1048576
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """
+    一种输出格式
+    Args:
+        name (str): 格式名称
+        suffix (str): 文件扩展名
+        write_marked (callable): write_marked(group_dict, path, progress, cancel)
+        write_grouped (callable): write_grouped(res_dict, path, progress, cancel)
+        description (str): 界面和命令行中显示的说明
+        open_stream (callable): open_stream(path, kind, sheet_names)，返回逐块追加写出的
+            WorkbookStream 或 TableStream（分块流式处理使用，见 scfa_stream）；
+            kind 为 "marked"、"grouped" 或 "grouped-long"，sheet_names 为可能出现的 sheet 名称
+        write_grouped_long (callable): write_grouped_long(res_dict, path, progress, cancel)，
+            保存 scfa_engine.group_long 的结果（params.group_layout 不为 "sheets" 时使用）
+    """
+    name: str
+    suffix: str
+    write_marked: object
+    write_grouped: object
+    description: str = ""
+    open_stream: object = None
+    write_grouped_long: object = None
+
+
+def _frame_columns(df, index=False):
+    """按列转换为 Python 对象，NaN 转为 None"""
+    series_list = [df.index.to_series()] if index else []
+    series_list += [df.iloc[:, j] for j in range(df.shape[1])]
+    columns = []
+    for series in series_list:
+        values = series.astype(object).to_numpy()
+        missing = pd.isna(values)
+        if missing.any():
+            values = values.copy()
+            values[missing] = None
+        columns.append(values.tolist())
+    return columns
+
+
+def _check_sheet_rows(sheet_name, first_row, rows):
+    """
+    检查追加 rows 行后 sheet 是否超过 Excel 的行数上限
+    Args:
+        sheet_name (str): sheet 名称
+        first_row (int): 追加的第一行（从 0 开始，表头为第 0 行）
+        rows (int): 追加的行数
+    Raises:
+        ValueError: 超过 EXCEL_MAX_ROWS 行
+    """
+    if first_row + rows > EXCEL_MAX_ROWS:
+        raise ValueError(
+            f"Sheet {sheet_name!r} would have {first_row + rows} rows, more than the Excel limit of "
+            f"{EXCEL_MAX_ROWS}. Use the csv, parquet or feather output for tables this large."
+        )
+
+
+def _frame_header(df, index=False):
+    header = [str(col) for col in df.columns]
+    if index:
+        header = [df.index.name or ""] + header
+    return header
+
+
+class _XlsxwriterBook:
+    """xlsxwriter constant_memory 模式：逐行写出，写完一行即释放；每个 sheet 的行按顺序追加"""
+    def __init__(self, path):
+        import xlsxwriter
+
+        self.wb = xlsxwriter.Workbook(path, {"constant_memory": True, "nan_inf_to_errors": True})
+        # 与 pandas to_excel 相同的表头样式：加粗、细边框、居中
+        self.header_format = self.wb.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        # sheet 名称 -> [worksheet, 下一行]
+        self.sheets = {}
+
+    def append(self, sheet_name, df, index=False, cancel=None):
+        """追加行，第一次写入某个 sheet 时创建它并写出表头"""
+        if sheet_name not in self.sheets:
+            ws = self.wb.add_worksheet(sheet_name)
+            for j, value in enumerate(_frame_header(display_frame(df.iloc[:0]), index)):
+                ws.write_string(0, j, value, self.header_format)
+            self.sheets[sheet_name] = [ws, 1]
+        ws, first_row = self.sheets[sheet_name]
+        _check_sheet_rows(sheet_name, first_row, len(df))
+        header_format = self.header_format
+        for start in range(0, len(df), STREAM_CHUNK_ROWS):
+            check_canceled(cancel)
+            columns = _frame_columns(display_frame(df.iloc[start:start + STREAM_CHUNK_ROWS]), index)
+            for row_num, row in enumerate(zip(*columns), start=first_row + start):
+                for j, value in enumerate(row):
+                    # openpyxl 不保存空字符串，与之保持一致
+                    if value is None or value == "":
+                        if index and j == 0:
+                            ws.write_blank(row_num, j, None, header_format)
+                        continue
+                    cell_format = header_format if index and j == 0 else None
+                    if isinstance(value, str):
+                        code = ws.write_string(row_num, j, value, cell_format)
+                    else:
+                        code = ws.write_number(row_num, j, value, cell_format)
+                    if code:
+                        # xlsxwriter 不抛出异常，只返回 -1（超出 sheet 范围）或 -2（字符串超过 32767 个字符）
+                        raise ValueError(
+                            f"Cannot write row {row_num + 1}, column {j + 1} of sheet {sheet_name!r} "
+                            f"(xlsxwriter error code {code})."
+                        )
+        self.sheets[sheet_name][1] = first_row + len(df)
+
+    def close(self, save=True):
+        if save:
+            self.wb.close()
+            return
+        # 取消或出错时不组装工作簿（这一步不能中断），只删除 constant_memory 模式的临时文件
+        for ws in self.wb.worksheets():
+            ws.row_data_fh.close()
+            os.remove(ws.row_data_filename)
+
+
+class _OpenpyxlBook:
+    """openpyxl 只写模式"""
+    def __init__(self, path):
+        from openpyxl import Workbook
+        from openpyxl.styles import Alignment, Border, Font, Side
+
+        side = Side(style="thin")
+        self.font = Font(bold=True)
+        self.border = Border(left=side, right=side, top=side, bottom=side)
+        self.alignment = Alignment(horizontal="center", vertical="top")
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        # sheet 名称 -> [worksheet, 下一行]
+        self.sheets = {}
+
+    def _header_cell(self, ws, value):
+        from openpyxl.cell import WriteOnlyCell
+
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = self.font
+        cell.border = self.border
+        cell.alignment = self.alignment
+        return cell
+
+    def append(self, sheet_name, df, index=False, cancel=None):
+        """追加行，第一次写入某个 sheet 时创建它并写出表头"""
+        if sheet_name not in self.sheets:
+            ws = self.wb.create_sheet(title=sheet_name)
+            ws.append([self._header_cell(ws, value) for value in _frame_header(display_frame(df.iloc[:0]), index)])
+            self.sheets[sheet_name] = [ws, 1]
+        ws, first_row = self.sheets[sheet_name]
+        _check_sheet_rows(sheet_name, first_row, len(df))
+        for start in range(0, len(df), STREAM_CHUNK_ROWS):
+            check_canceled(cancel)
+            columns = _frame_columns(display_frame(df.iloc[start:start + STREAM_CHUNK_ROWS]), index)
+            if index:
+                columns[0] = [self._header_cell(ws, value) for value in columns[0]]
+            for row in zip(*columns):
+                ws.append(row)
+        self.sheets[sheet_name][1] = first_row + len(df)
+
+    def close(self, save=True):
+        if save:
+            self.wb.save(self.path)
+
+
+def _stream_with_xlsxwriter(path, sheets, stage, progress, cancel):
+    """xlsxwriter constant_memory 模式：逐行写出，写完一行即释放"""
+    book = _XlsxwriterBook(path)
+    try:
+        for i, (sheet_name, df, index) in enumerate(sheets):
+            check_canceled(cancel)
+            book.append(sheet_name, df, index, cancel)
+            report_progress(progress, stage, i + 1, len(sheets))
+        check_canceled(cancel)
+    except BaseException:
+        book.close(save=False)
+        raise
+    report_progress(progress, "save", 0, 0)
+    book.close()
+
+
+def _stream_with_openpyxl(path, sheets, stage, progress, cancel):
+    """openpyxl 只写模式"""
+    book = _OpenpyxlBook(path)
+    for i, (sheet_name, df, index) in enumerate(sheets):
+        check_canceled(cancel)
+        book.append(sheet_name, df, index, cancel)
+        report_progress(progress, stage, i + 1, len(sheets))
+    check_canceled(cancel)
+    report_progress(progress, "save", 0, 0)
+    book.close()
+
+
+def _xlsxwriter_available(sheet_names):
+    """xlsxwriter 已安装，且所有 sheet 名称都能被它接受（不超过 31 个字符、不重复）"""
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        return False
+    lowered = [name.lower() for name in sheet_names]
+    return all(len(name) <= 31 for name in sheet_names) and len(set(lowered)) == len(lowered)
+
+
+def _write_stream_workbook(path, sheets, stage, progress, cancel):
+    """
+    流式写出工作簿，内容与样式与 pandas to_excel 相同
+    Args:
+        sheets (list): (sheet 名称, 数据框, 是否写出 index) 列表
+    """
+    if _xlsxwriter_available([name for name, _, _ in sheets]):
+        _stream_with_xlsxwriter(path, sheets, stage, progress, cancel)
+    else:
+        _stream_with_openpyxl(path, sheets, stage, progress, cancel)
+
+
+def write_marked_stream(group_dict, path, progress=None, cancel=None):
+    """流式保存标记结果，"All" 为第一个 sheet"""
+    sheet_names = ["All"] + [key for key in group_dict.keys() if key != "All"]
+    sheets = [(key, group_dict[key], False) for key in sheet_names]
+    _write_stream_workbook(path, sheets, "write_marked", progress, cancel)
+
+
+def write_tables(res_dict, path, progress=None, cancel=None):
+    """保存分组结果的长表布局，每个表一个 sheet，不写出 index"""
+    with scfa_engine.excel_writer(path, progress, cancel) as writer:
+        for i, (sheet_name, df) in enumerate(res_dict.items()):
+            scfa_engine._to_excel_chunked(df, writer, sheet_name, cancel)
+            report_progress(progress, "write_grouped", i + 1, len(res_dict))
+
+
+def write_tables_stream(res_dict, path, progress=None, cancel=None):
+    """流式保存分组结果的长表布局"""
+    sheets = [(sheet_name, df, False) for sheet_name, df in res_dict.items()]
+    _write_stream_workbook(path, sheets, "write_grouped", progress, cancel)
+
+
+def write_grouped_stream(res_dict, path, progress=None, cancel=None):
+    """流式保存分组结果，index 列名为 Replicate"""
+    sheets = []
+    for sheet_name, dft in res_dict.items():
+        dft.index.name = "Replicate"
+        sheets.append((sheet_name, dft, True))
+    _write_stream_workbook(path, sheets, "write_grouped", progress, cancel)
+
+
+class WorkbookStream:
+    """
+    逐块追加写出的工作簿：每次 append 把行追加到一个 sheet 的末尾，
+    sheet 按第一次追加的顺序排列。内容与样式与 write_marked_stream/write_grouped_stream 相同
+    Args:
+        path (str): 文件路径
+        sheet_names (list): 可能出现的 sheet 名称，用于选择 xlsxwriter 或 openpyxl
+        index (bool): 是否写出 index（分组结果，index 列名为 Replicate）
+    """
+    def __init__(self, path, sheet_names, index=False):
+        book_class = _XlsxwriterBook if _xlsxwriter_available(list(sheet_names)) else _OpenpyxlBook
+        self.book = book_class(path)
+        self.index = index
+
+    def append(self, sheet_name, df, cancel=None):
+        if self.index:
+            df.index.name = "Replicate"
+        self.book.append(sheet_name, df, self.index, cancel)
+
+    def close(self, save=True):
+        """save 为 False 时（出错或取消）只释放资源，由调用方删除文件"""
+        self.book.close(save)
+
+
+class TableStream:
+    """
+    逐块追加写出的单表文件（Parquet/Feather/CSV），内容与 _columnar_writer 写出的相同：
+    标记结果只保存 "All" 表，分组结果转换为长表（长表布局只保存长表）。追加的行累积到 rows 行后一次写出
+    Args:
+        path (str): 文件路径
+        table_format (str): "parquet"、"feather" 或 "csv"
+        kind (str): "marked"、"grouped" 或 "grouped-long"（只保存长表）
+        rows (int): 每次写出的最少行数（Parquet 的 row group、Feather 的 record batch）
+    """
+    def __init__(self, path, table_format, kind="marked", rows=STREAM_CHUNK_ROWS):
+        self.path = path
+        self.table_format = table_format
+        self.kind = kind
+        self.rows = rows
+        self.pending = []
+        self.pending_rows = 0
+        self.writer = None
+        self.schema = None
+        # 没有任何行时写出的空表（保留列名）
+        self.empty = None
+
+    def append(self, sheet_name, df, cancel=None):
+        check_canceled(cancel)
+        if self.kind == "marked":
+            if sheet_name != "All":
+                return
+            df = display_frame(df)
+        elif self.kind == "grouped-long":
+            if sheet_name != scfa_engine.GROUPED_LONG_SHEET:
+                return
+        else:
+            df = grouped_long_table({sheet_name: df})
+        if self.empty is None:
+            self.empty = df.iloc[:0]
+        if not len(df):
+            return
+        self.pending.append(df)
+        self.pending_rows += len(df)
+        if self.pending_rows >= self.rows:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        df = pd.concat(self.pending, ignore_index=True)
+        self.pending, self.pending_rows = [], 0
+        if self.table_format == "csv":
+            df.to_csv(self.path, index=False, mode="a" if self.writer else "w", header=not self.writer)
+            self.writer = True
+            return
+        import pyarrow as pa
+
+        if self.writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # 第一块中全部为空的文本列会被推断为 null 类型，按字符串保存
+            for i, schema_field in enumerate(schema):
+                if pa.types.is_null(schema_field.type):
+                    schema = schema.set(i, pa.field(schema_field.name, pa.string()))
+            self.schema = schema
+            if self.table_format == "parquet":
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, schema)
+            else:
+                # 与 to_feather 相同：可用时使用 lz4 压缩
+                compression = "lz4" if pa.Codec.is_available("lz4") else None
+                self.writer = pa.ipc.new_file(self.path, schema,
+                                              options=pa.ipc.IpcWriteOptions(compression=compression))
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self, save=True):
+        """save 为 False 时（出错或取消）只释放资源，由调用方删除文件"""
+        if save:
+            self._flush()
+        if self.writer is not None and self.writer is not True:
+            self.writer.close()
+        elif self.writer is None and save and self.empty is not None:
+            TABLE_WRITERS[self.table_format](self.empty, self.path)
+
+
+def _workbook_stream(path, kind, sheet_names=()):
+    # 长表布局的表与标记结果一样不写出 index
+    return WorkbookStream(path, sheet_names, index=kind == "grouped")
+
+
+def _table_stream(table_format):
+    def open_stream(path, kind, sheet_names=()):
+        return TableStream(path, table_format, kind)
+    return open_stream
+
+
+def grouped_long_table(res_dict):
+    """
+    把分组结果合并为一个长表，便于列式格式保存
+    Args:
+        res_dict (dict): process_group 返回的分组数据字典
+    Returns:
+        DataFrame: 列为 Sheet、Replicate、Group、Quantification，
+            按 sheet 顺序、列顺序（控制组在前）和行顺序排列
+    """
+    tables = []
+    for sheet_name, dft in res_dict.items():
+        long_df = dft.melt(ignore_index=False, var_name="Group", value_name="Quantification")
+        long_df.index.name = "Replicate"
+        long_df = long_df.reset_index()
+        long_df.insert(0, "Sheet", sheet_name)
+        tables.append(long_df[["Sheet", "Replicate", "Group", "Quantification"]])
+    if not tables:
+        return pd.DataFrame(columns=["Sheet", "Replicate", "Group", "Quantification"])
+    return pd.concat(tables, ignore_index=True)
+
+
+def _columnar_writer(write_table):
+    """
+    列式格式：标记结果保存 "All" 表（含 Molecule 列），分组结果保存长表
+    Returns:
+        tuple: (write_marked, write_grouped, write_grouped_long)
+    """
+    def write_marked(group_dict, path, progress=None, cancel=None):
+        check_canceled(cancel)
+        write_table(display_frame(group_dict["All"]), path, cancel)
+        report_progress(progress, "write_marked", 1, 1)
+
+    def write_grouped(res_dict, path, progress=None, cancel=None):
+        check_canceled(cancel)
+        write_table(grouped_long_table(res_dict), path, cancel)
+        report_progress(progress, "write_grouped", 1, 1)
+
+    def write_grouped_long(res_dict, path, progress=None, cancel=None):
+        # 长表布局的宽表只在工作簿中保存
+        check_canceled(cancel)
+        write_table(res_dict[scfa_engine.GROUPED_LONG_SHEET], path, cancel)
+        report_progress(progress, "write_grouped", 1, 1)
+
+    return write_marked, write_grouped, write_grouped_long
+
+
+def _write_parquet(df, path, cancel=None):
+    df.to_parquet(path, index=False)
+
+
+def _write_feather(df, path, cancel=None):
+    df.reset_index(drop=True).to_feather(path)
+
+
+def _write_csv(df, path, cancel=None):
+    # 分块写出，每块之间检查取消
+    for start in range(0, max(len(df), 1), STREAM_CHUNK_ROWS):
+        check_canceled(cancel)
+        df.iloc[start:start + STREAM_CHUNK_ROWS].to_csv(
+            path, index=False, mode="w" if start == 0 else "a", header=start == 0
+        )
+
+
+TABLE_WRITERS = {"parquet": _write_parquet, "feather": _write_feather, "csv": _write_csv}
+
+FORMATS = {}
+
+
+def register_format(output_format):
+    """注册输出格式，name 重复时覆盖"""
+    FORMATS[output_format.name] = output_format
+
+
+def _columnar_format(name, suffix, write_table, description):
+    write_marked, write_grouped, write_grouped_long = _columnar_writer(write_table)
+    return OutputFormat(name, suffix, write_marked, write_grouped, description, _table_stream(name),
+                        write_grouped_long)
+
+
+register_format(OutputFormat(
+    "xlsx", ".xlsx", scfa_engine.write_marked, scfa_engine.write_grouped,
+    "Excel workbook", _workbook_stream, write_tables
+))
+register_format(OutputFormat(
+    "xlsx-stream", ".xlsx", write_marked_stream, write_grouped_stream,
+    "Excel workbook written row by row with constant memory", _workbook_stream, write_tables_stream
+))
+register_format(_columnar_format("parquet", ".parquet", _write_parquet, "Parquet table (requires pyarrow)"))
+register_format(_columnar_format("feather", ".feather", _write_feather, "Feather table (requires pyarrow)"))
+register_format(_columnar_format("csv", ".csv", _write_csv, "CSV table"))
+
+
+def resolve_formats(names):
+    """
+    检查输出格式名称
+    Args:
+        names (list): 格式名称
+    Returns:
+        list: OutputFormat 列表
+    """
+    formats = []
+    suffixes = {}
+    for name in names:
+        if name not in FORMATS:
+            raise ValueError(f"Unknown output format: {name}. Available: {', '.join(FORMATS)}")
+        output_format = FORMATS[name]
+        if output_format.suffix in suffixes:
+            raise ValueError(
+                f"Output formats {suffixes[output_format.suffix]} and {name} "
+                f"would both write {output_format.suffix} files."
+            )
+        suffixes[output_format.suffix] = name
+        formats.append(output_format)
+    return formats
+
+
+def _phase(recorder, name, rows):
+    return recorder.phase(name, rows=rows) if recorder is not None else nullcontext()
+
+
+def write_outputs(result, save_path, params, progress=None, cancel=None, recorder=None):
+    """
+    按 params.output_formats 保存标记和分组结果，结果路径记录在 result.saved_files
+    Args:
+        result (FileResult): process_frame 返回的处理结果
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        progress (callable): 进度回调
+        cancel (CancelToken): 取消标记
+        recorder (RunRecorder): 运行记录，每个格式的写出记录为一个阶段
+    Returns:
+        FileResult: 更新后的处理结果
+    """
+    formats = resolve_formats(params.output_formats)
+    original_name = scfa_engine.output_name(result.filename)
+    for output_format in formats:
+        path = os.path.join(save_path, f"MARKED_{original_name}{output_format.suffix}")
+        with _phase(recorder, f"write_marked:{output_format.name}", len(result.marked["All"])):
+            scfa_engine.write_or_remove(output_format.write_marked, result.marked, path, progress, cancel)
+        result.saved_files.append(path)
+
+    if result.grouped:
+        try:
+            for output_format in formats:
+                path = os.path.join(save_path, f"GROUPED_{original_name}{output_format.suffix}")
+                write_grouped = output_format.write_grouped
+                if params.group_layout != "sheets":
+                    write_grouped = output_format.write_grouped_long
+                    if write_grouped is None:
+                        raise ValueError(f"Output format {output_format.name} does not support "
+                                         f"the {params.group_layout} grouped layout")
+                rows = sum(len(dft) for dft in result.grouped.values())
+                with _phase(recorder, f"write_grouped:{output_format.name}", rows):
+                    scfa_engine.write_or_remove(write_grouped, result.grouped, path, progress, cancel)
+                result.saved_files.append(path)
+            result.group_success.append("Group processing")
+        except scfa_engine.ProcessingCanceled:
+            raise
+        except Exception as e:
+            result.group_failed.append(f"Group processing: {str(e)}")
+    return result
+
+
+def close_streams(streams, save=True):
+    """
+    关闭 open_stream 返回的写出器；save 为 False 时（或某个写出器出错后）删除未写完的文件
+    Args:
+        streams (list): (文件路径, 写出器) 列表
+    Raises:
+        Exception: 第一个关闭时出现的错误
+    """
+    error = None
+    for path, stream in streams:
+        try:
+            stream.close(save)
+        except Exception as e:
+            error = error or e
+            save = False
+        if not save and os.path.exists(path):
+            os.remove(path)
+    if error is not None:
+        raise error
+
+
+class ConsolidatedStream:
+    """
+    合并输出：每个文件处理完成后追加它的标记结果，不在内存中保留各文件的表。
+    每种输出格式一个 CONSOLIDATED_MARKED_<批次标识> 文件，第一列为 Source File；"All" 表按文件顺序排列，
+    其余每个分子一个表，包含所有文件中该分子的行（按文件顺序）。后面的文件是否全为整数事先未知，
+    Quantification 统一保存为浮点数。
+    Excel 输出中 "All" 表超过 Excel 行数上限时接着写入 All_2、All_3 ...（排在分子表之后），
+    单个分子表超过上限时报错。分子名称须能作为 Excel sheet 名称（不超过 31 个字符，
+    不区分大小写时不重复），每个文件都检查，与文件顺序无关
+    Args:
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数，使用 output_formats 和 float32
+        batch_id (str): 文件名中的批次标识，默认为开始时间；同名文件已存在时加上序号，不覆盖
+    """
+    def __init__(self, save_path, params, batch_id=""):
+        self.formats = resolve_formats(params.output_formats)
+        self.quantification_dtype = np.float32 if params.float32 else np.float64
+        batch_id = batch_id or time.strftime("%Y%m%d_%H%M%S")
+        name = f"{CONSOLIDATED_NAME}_{batch_id}"
+        n = 1
+        while any(os.path.exists(os.path.join(save_path, name + f.suffix)) for f in self.formats):
+            n += 1
+            name = f"{CONSOLIDATED_NAME}_{batch_id}_{n}"
+        self.paths = [os.path.join(save_path, name + f.suffix) for f in self.formats]
+        self.streams = []
+        self.n_files = 0
+        # Excel 输出的 sheet：小写名称 -> 分子名称；"All" 表的序号和当前 "All" 表已写出的行数
+        self.workbook = any(f.suffix == ".xlsx" for f in self.formats)
+        self.sheet_names = {}
+        self.all_sheets = 1
+        self.all_rows = 0
+
+    def _check_sheet_names(self, molecules):
+        """
+        检查分子名称能否作为 Excel sheet 名称，错误信息与文件顺序无关
+        Raises:
+            ValueError: 名称超过 31 个字符、与 "All" 表同名，或与其他分子只有大小写不同
+        """
+        for molecule in molecules:
+            if re.fullmatch(r"all(_\d+)?", molecule.lower()):
+                raise ValueError(
+                    f"Molecule {molecule!r} has the name of an \"All\" sheet of the consolidated Excel file."
+                )
+            if len(molecule) > 31:
+                raise ValueError(
+                    f"Molecule {molecule!r} is longer than 31 characters and cannot be a sheet of the "
+                    f"consolidated Excel file. Use the csv, parquet or feather output."
+                )
+            existing = self.sheet_names.setdefault(molecule.lower(), molecule)
+            if existing != molecule:
+                first, second = sorted([existing, molecule])
+                raise ValueError(
+                    f"Molecules {first!r} and {second!r} differ only by case and cannot both be sheets of "
+                    f"the consolidated Excel file. Use the csv, parquet or feather output."
+                )
+
+    def _append_all(self, stream, df, cancel):
+        """把行追加到 "All" 表；超过 Excel 行数上限时接着写入 All_2、All_3 ..."""
+        start = 0
+        while True:
+            sheet_name = "All" if self.all_sheets == 1 else f"All_{self.all_sheets}"
+            rows = min(EXCEL_MAX_ROWS - 1 - self.all_rows, len(df) - start)
+            stream.append(sheet_name, df.iloc[start:start + rows], cancel)
+            self.all_rows += rows
+            start += rows
+            if start >= len(df):
+                return
+            self.all_sheets += 1
+            self.all_rows = 0
+
+    def append(self, source, df, cancel=None):
+        """
+        追加一个文件的标记结果
+        Args:
+            source (str): 来源文件名，写入 Source File 列
+            df (DataFrame): 该文件标记结果的 "All" 表，同一分子的行相邻（mark_prepared 的结果）
+            cancel (CancelToken): 取消标记
+        """
+        df = df.copy(deep=False)
+        df.insert(0, SOURCE_COLUMN, pd.Categorical.from_codes(np.zeros(len(df), dtype=np.int8), [source]))
+        df["Quantification"] = df["Quantification"].astype(self.quantification_dtype)
+        codes, molecules = pd.factorize(df["Molecule"])
+        bounds = np.searchsorted(codes, np.arange(len(molecules) + 1))
+        if self.workbook:
+            self._check_sheet_names(molecules)
+        if not self.streams:
+            # 文件在第一次追加时创建；名称都已检查，只用于选择 xlsxwriter 或 openpyxl
+            sheet_names = ["All"] + list(molecules)
+            self.streams = [(path, output_format.open_stream(path, "marked", sheet_names))
+                            for output_format, path in zip(self.formats, self.paths)]
+        for _, stream in self.streams:
+            if isinstance(stream, WorkbookStream):
+                self._append_all(stream, df, cancel)
+            else:
+                stream.append("All", df, cancel)
+        for k, molecule in enumerate(molecules):
+            check_canceled(cancel)
+            for _, stream in self.streams:
+                stream.append(molecule, df.iloc[bounds[k]:bounds[k + 1]], cancel)
+        self.n_files += 1
+
+    def close(self, save=True):
+        """
+        保存文件
+        Args:
+            save (bool): False 时（出错或取消）删除已写出的部分
+        Returns:
+            list: 保存的文件路径，没有追加任何文件时为空
+        """
+        save = save and self.n_files > 0
+        close_streams(self.streams, save)
+        return [path for path, _ in self.streams] if save else []
@@ -0,0 +1,218 @@
+"""
+流水线批量处理：读取、计算和写出同时进行
+
+run_pipeline processes files in one process with three stages running at
+the same time on consecutive files:
+
+    reader thread    reads and prepares file N+1 (CSV parsing, Quantification split)
+    calling thread   marks and groups file N
+    writer process   writes the MARKED_/GROUPED_ outputs and the report of file N-1
+
+The writers (openpyxl, to_csv) hold the GIL for most of their run, so they
+get their own process; the results are pickled to it, which costs a small
+fraction of the write time. Reading mostly releases the GIL (pyarrow) and
+runs in a thread. Bounded queues between the stages cap how many files are
+held in memory: at most `depth` prepared files wait for the compute stage
+and at most `depth` results wait for or are in the writer. A batch then
+takes about as long as its slowest stage instead of the sum of all stages.
+
+Outputs are the same as run_batch with one worker. The peak memory of the
+read and compute phases in the run report is measured for the whole main
+process, so it includes the other stage running at the same time.
+"""
+import multiprocessing
+import queue
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import ExitStack
+from dataclasses import dataclass
+from functools import partial
+
+import scfa_batch
+import scfa_engine
+import scfa_output
+import scfa_report
+
+# 读取阶段结束标记
+_DONE = object()
+
+
+@dataclass
+class _Job:
+    """在阶段之间传递的单个文件"""
+    item: scfa_batch.BatchItem
+    recorder: scfa_report.RunRecorder
+    progress: object = None
+    prepared: scfa_engine.PreparedFrame = None
+
+
+def _fail(item, error):
+    """记录阶段中的错误，与 scfa_batch._process_one 相同"""
+    if isinstance(error, scfa_engine.ProcessingCanceled):
+        item.canceled = True
+    else:
+        item.canceled = False
+        item.error = str(error)
+        item.traceback = traceback.format_exc()
+
+
+def _write_one(result, recorder, save_path, params, cancel=None):
+    """
+    在写出进程中保存一个文件的结果
+    Returns:
+        BatchItem: result 为不含数据框的处理结果（saved_files、report 等已更新）
+    """
+    item = scfa_batch.BatchItem(file_path=result.filename)
+    try:
+        progress = recorder.wrap_progress(None)
+        scfa_output.write_outputs(result, save_path, params, progress, cancel, recorder)
+        scfa_engine.finish_report(result, save_path, params, recorder)
+        result.marked, result.grouped = {}, {}
+        item.result = result
+    except Exception as e:
+        _fail(item, e)
+    return item
+
+
+def run_pipeline(file_paths, save_path, params, depth=1, on_progress=None, on_file_progress=None,
+                 cancel=None, keep_frames=False, cache=None, poll_interval=0.1, on_result=None):
+    """
+    按流水线批量处理多个文件（读取、计算、写出三个阶段重叠）
+    Args:
+        file_paths (list): 输入文件路径
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        depth (int): 每个阶段之间最多等待的文件数
+        on_progress (callable): on_progress(done, total, file_path)，每个文件结束（写出或出错）后按输入顺序调用
+        on_file_progress (callable): on_file_progress(file_path, stage, done, total)，
+            计算阶段每个分子调用一次（写出进程中的进度不返回）
+        cancel (CancelToken): 取消标记，各阶段在下一个检查点停止，未开始的文件不再处理
+        keep_frames (bool or str): 是否在结果中保留 marked/grouped 数据框；
+            "marked" 只保留 marked["All"]
+        cache (PreparedCache): 预处理结果缓存，读取阶段使用
+        poll_interval (float): 等待写出进程时检查取消的间隔（秒）
+        on_result (callable): on_result(item)，每个未取消的文件（包括读取、计算出错的文件）结束后
+            按输入顺序调用，见 run_batch
+    Returns:
+        list: 与 file_paths 顺序一致的 BatchItem 列表，取消的文件 canceled 为 True
+    """
+    total = len(file_paths)
+    depth = max(1, depth)
+    items = [scfa_batch.BatchItem(file_path=f, canceled=True) for f in file_paths]
+    read_queue = queue.Queue(maxsize=depth)
+    # 计算阶段意外退出时通知读取阶段停止
+    stop = threading.Event()
+
+    def stopped():
+        return stop.is_set() or (cancel is not None and cancel.is_canceled())
+
+    def reader():
+        try:
+            for i, file_path in enumerate(file_paths):
+                if stopped():
+                    break
+                recorder = scfa_report.RunRecorder(params.save_report or params.profile)
+                progress = None
+                if on_file_progress is not None:
+                    progress = partial(on_file_progress, file_path)
+                job = _Job(items[i], recorder, recorder.wrap_progress(progress))
+                try:
+                    job.prepared = scfa_engine.load_source(file_path, params, recorder, cancel, cache)
+                except Exception as e:
+                    _fail(job.item, e)
+                read_queue.put((i, job))
+        finally:
+            read_queue.put(_DONE)
+
+    done_count = 0
+    # 按输入顺序排队等待报告的文件：(序号, future, 计算阶段的结果)；读取或计算出错的文件 future 为 None
+    writing = deque()
+
+    def writing_count():
+        return sum(1 for _, future, _ in writing if future is not None)
+
+    def collect(block):
+        """按输入顺序报告已结束的文件；block 为 True 时等待最早提交写出的文件"""
+        nonlocal done_count
+        while writing and (block or writing[0][1] is None or writing[0][1].done()):
+            i, future, result = writing.popleft()
+            if future is not None:
+                block = False
+                while not future.done():
+                    if stopped() and shared_cancel is not None:
+                        # 正在写出的文件在下一个检查点停止
+                        shared_cancel.cancel()
+                    wait([future], timeout=poll_interval)
+                try:
+                    items[i] = future.result()
+                except Exception as e:
+                    # 写出进程异常退出
+                    items[i] = scfa_batch.BatchItem(file_path=file_paths[i], error=str(e),
+                                                    traceback=traceback.format_exc())
+                if items[i].result is not None:
+                    items[i].result.marked, items[i].result.grouped = result.marked, result.grouped
+                    scfa_batch.drop_frames(items[i].result, params, keep_frames)
+            if items[i].canceled:
+                continue
+            if on_result:
+                on_result(items[i])
+            # 与 run_batch 相同，出错的文件也计入进度
+            done_count += 1
+            if on_progress:
+                on_progress(done_count, total, file_paths[i])
+
+    reading_done = False
+    with ExitStack() as stack:
+        shared_cancel = None
+        if cancel is not None:
+            # threading.Event 不能传给写出进程，使用 Manager 的共享事件
+            manager = stack.enter_context(multiprocessing.Manager())
+            shared_cancel = scfa_engine.CancelToken(manager.Event())
+        executor = stack.enter_context(ProcessPoolExecutor(max_workers=1))
+        # 在启动读取线程之前创建写出进程
+        executor.submit(int).result()
+        thread = threading.Thread(target=reader, name="scfa-reader", daemon=True)
+        thread.start()
+        try:
+            while True:
+                entry = read_queue.get()
+                if entry is _DONE:
+                    reading_done = True
+                    break
+                i, job = entry
+                collect(block=False)
+                if job.prepared is None or stopped():
+                    if not job.item.canceled:
+                        # 读取出错的文件排在前面的文件之后报告
+                        writing.append((i, None, None))
+                    continue
+                try:
+                    result = scfa_engine.process_frame(job.prepared, params, file_paths[i], job.progress,
+                                                       cancel, recorder=job.recorder)
+                except Exception as e:
+                    _fail(job.item, e)
+                    if not job.item.canceled:
+                        writing.append((i, None, None))
+                    continue
+                finally:
+                    job.prepared = None
+                while writing_count() >= depth:
+                    collect(block=True)
+                if stopped():
+                    continue
+                future = executor.submit(_write_one, result, job.recorder, save_path, params, shared_cancel)
+                writing.append((i, future, result))
+            while writing:
+                collect(block=True)
+        finally:
+            if not reading_done:
+                # 计算阶段意外退出（例如 KeyboardInterrupt）：停止读取并清空队列，使读取线程不会阻塞
+                stop.set()
+                if shared_cancel is not None:
+                    shared_cancel.cancel()
+                while read_queue.get() is not _DONE:
+                    pass
+            thread.join()
+    return items
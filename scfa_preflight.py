@@ -0,0 +1,252 @@
+"""
+批量处理前的快速检查
+
+check_files looks at every input of a batch before any file is processed,
+so a batch that is bound to fail stops before the long work starts. Only
+the header and a sample of each file are read: small files whole, larger
+ones as SAMPLE_SLICES slices of SLICE_BYTES spread over the file. The files
+are checked in parallel threads.
+
+Errors make a file fail (or the whole batch refuse to start):
+    - the file cannot be read, or required columns are missing
+    - no molecule can be marked (only when the whole file was read)
+    - a group name is not a valid regular expression
+
+Warnings are reported but do not stop the batch:
+    - molecules that will fail (Quantification not "<value> <unit>",
+      units that cannot be converted)
+    - Quantification values that cannot be parsed as numbers
+    - molecules without usable standards (no calibration store given)
+    - groups or the control group matching no Replicate
+
+Per-molecule findings only cover molecules whose rows lie completely inside
+a slice (Skyline exports list the rows of a molecule together); molecules
+cut by a slice boundary are skipped, so a sample never reports a molecule
+it has only seen in part.
+"""
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+import scfa_engine
+
+# 每个文件读取的片段数和每段的字节数，不超过两者之积的文件整个读取
+SAMPLE_SLICES = 8
+SLICE_BYTES = 512 * 1024
+# 每条提示中最多列出的分子数
+MAX_LISTED = 10
+
+
+@dataclass
+class FileCheck:
+    """
+    单个文件的检查结果
+    Args:
+        file_path (str): 输入文件路径
+        errors (list): 会导致处理失败的问题
+        warnings (list): 不影响处理但结果可能不完整的问题
+        rows (int): 检查的行数
+        complete (bool): 是否读取了整个文件
+        seconds (float): 检查耗时（秒）
+    """
+    file_path: str
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+    rows: int = 0
+    complete: bool = False
+    seconds: float = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def _listed(names, counts=None):
+    """分子列表，超过 MAX_LISTED 个时省略"""
+    names = list(names)
+    items = [f"{name} ({counts[name]})" if counts else str(name) for name in names[:MAX_LISTED]]
+    if len(names) > MAX_LISTED:
+        items.append(f"... {len(names) - MAX_LISTED} more")
+    return ", ".join(items)
+
+
+def _parse_block(header, block, engine):
+    """按原始列读取一段 CSV（表头 + 若干完整的行）"""
+    return pd.read_csv(io.BytesIO(header + block), usecols=scfa_engine.REQUIRED_COLUMNS,
+                       dtype=scfa_engine.INPUT_DTYPES, engine=engine)
+
+
+def read_sample(path, engine="c"):
+    """
+    读取文件的表头和样本
+    Args:
+        path (str): CSV 文件路径
+        engine (str): "c" 或 "python"
+    Returns:
+        tuple: (columns, df, complete, partial, problems)：表头中的列名；样本（read_input 的结果，
+            缺少必需的列时为 None）；是否读取了整个文件；被片段边界截断的分子；无法解析的片段
+    Raises:
+        OSError, ValueError: 文件无法读取，或第一段无法解析
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as handle:
+        header = handle.readline()
+        columns = list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+        if any(col not in columns for col in scfa_engine.REQUIRED_COLUMNS):
+            return columns, None, False, set(), []
+        complete = size <= SAMPLE_SLICES * SLICE_BYTES
+        if complete:
+            starts = [handle.tell()]
+        else:
+            starts = np.linspace(handle.tell(), size - SLICE_BYTES, SAMPLE_SLICES).astype(np.int64)
+        frames = []
+        partial = set()
+        problems = []
+        for k, start in enumerate(starts):
+            handle.seek(start)
+            if k > 0:
+                # 跳过不完整的行
+                handle.readline()
+            block = handle.read() if complete else handle.read(SLICE_BYTES)
+            at_end = handle.tell() >= size
+            if not at_end:
+                block = block[:block.rfind(b"\n") + 1]
+            try:
+                df = _parse_block(header, block, engine)
+            except (ValueError, pd.errors.ParserError) as e:
+                if k == 0:
+                    raise
+                problems.append(f"rows near byte {int(start)} could not be parsed: {e}")
+                continue
+            molecules = df["Molecule"].dropna()
+            if len(molecules):
+                if k > 0:
+                    partial.add(molecules.iloc[0])
+                if not at_end:
+                    partial.add(molecules.iloc[-1])
+            frames.append(df)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return columns, scfa_engine.read_input(df), complete, partial, problems
+
+
+def _group_checks(check, prepared, params, complete):
+    """组别和控制组是否与 Replicate 匹配"""
+    replicates = prepared.rows["Replicate"].to_numpy(dtype=object)[~prepared.rows["is_standard"].to_numpy()]
+    uniques = np.asarray(pd.unique(replicates), dtype=object)
+    where = "" if complete else " in the sampled rows"
+    labels = []
+    for individual in params.group_list:
+        matched, groups, _ = scfa_engine._parse_replicates(uniques, individual)
+        if matched is None:
+            check.errors.append(f"Group name '{individual}' is not a valid regular expression")
+        elif not matched.any():
+            check.warnings.append(f"Group '{individual}' matches no Replicate{where}")
+        else:
+            labels.extend(groups[matched])
+    control = params.control_group
+    if control and labels and not any(control in label for label in labels):
+        check.warnings.append(f"Control group '{control}' matches no grouped column{where}")
+
+
+def check_file(path, params):
+    """
+    检查单个文件
+    Args:
+        path (str): CSV 文件路径
+        params (MarkerParams): 处理参数
+    Returns:
+        FileCheck: 检查结果
+    """
+    start = time.perf_counter()
+    check = FileCheck(file_path=path)
+    try:
+        columns, df, complete, partial, problems = read_sample(
+            path, "python" if params.csv_engine == "python" else "c")
+    except (OSError, ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        check.errors.append(f"Cannot read file: {e}")
+        check.seconds = time.perf_counter() - start
+        return check
+    if df is None:
+        missing = [col for col in scfa_engine.REQUIRED_COLUMNS if col not in columns]
+        check.errors.append(f"Missing required column(s): {', '.join(missing)}")
+        check.seconds = time.perf_counter() - start
+        return check
+    check.rows = len(df)
+    check.complete = complete
+    check.warnings.extend(problems)
+
+    prepared = scfa_engine.prepare_frame(df)
+    # 被片段截断的分子不报告
+    covered = [m for m in prepared.molecules if complete or m not in partial]
+    try:
+        _, results = scfa_engine.mark_prepared(prepared, params, verbose=False)
+    except ValueError:
+        results = {"success": [], "failed": list(prepared.molecules), "unparsed": {}}
+        if complete:
+            check.errors.append("No molecule can be marked" if prepared.molecules else "No molecules in the file")
+
+    failed = set(results["failed"])
+    failed_covered = [m for m in covered if m in failed]
+    if failed_covered and not (complete and not results["success"]):
+        check.warnings.append(f"{len(failed_covered)} molecule(s) will fail: {_listed(failed_covered)}")
+    unparsed = results["unparsed"]
+    if unparsed:
+        check.warnings.append(f"{sum(unparsed.values())} Quantification value(s) cannot be parsed: "
+                              f"{_listed(unparsed, unparsed)}")
+    if not params.calibration_store:
+        ranges = prepared.ranges
+        no_standards = [m for m in covered if m not in failed and np.isnan(ranges.at[m, "min"])]
+        if no_standards:
+            check.warnings.append(f"{len(no_standards)} molecule(s) have no usable standards: "
+                                  f"{_listed(no_standards)}")
+    if params.split_by_group and params.group_list and check.rows:
+        _group_checks(check, prepared, params, complete)
+    check.seconds = time.perf_counter() - start
+    return check
+
+
+def check_files(file_paths, params, workers=0):
+    """
+    并行检查多个文件
+    Args:
+        file_paths (list): 输入文件路径
+        params (MarkerParams): 处理参数
+        workers (int): 线程数，0 表示按文件数和 CPU 核数决定
+    Returns:
+        list: 与 file_paths 顺序一致的 FileCheck 列表
+    """
+    workers = workers or min(len(file_paths), (os.cpu_count() or 1) + 4)
+    if workers <= 1:
+        return [check_file(path, params) for path in file_paths]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda path: check_file(path, params), file_paths))
+
+
+def format_checks(checks, seconds=None):
+    """
+    检查结果的文本：每个有问题的文件列出错误和警告，最后一行为汇总
+    Args:
+        checks (list): check_files 返回的 FileCheck 列表
+        seconds (float): 总耗时（秒），为 None 时不显示
+    """
+    lines = []
+    for check in checks:
+        if not check.errors and not check.warnings:
+            continue
+        sampled = "" if check.complete or not check.rows else f" (sampled {check.rows} rows)"
+        lines.append(f"{os.path.basename(check.file_path)}{sampled}:")
+        lines.extend(f"  error: {message}" for message in check.errors)
+        lines.extend(f"  warning: {message}" for message in check.warnings)
+    n_errors = sum(1 for check in checks if check.errors)
+    n_warnings = sum(1 for check in checks if check.warnings and not check.errors)
+    summary = f"Pre-flight: {len(checks)} file(s) checked"
+    if seconds is not None:
+        summary += f" in {seconds:.2f} s"
+    summary += f", {n_errors} with errors, {n_warnings} with warnings only"
+    lines.append(summary)
+    return "\n".join(lines)
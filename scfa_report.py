@@ -0,0 +1,235 @@
+"""
+运行报告：各阶段耗时、行数和内存峰值
+
+RunRecorder collects wall time, rows and peak memory for each phase of
+process_file (read, prepare, mark, group and the writers), plus per-molecule
+times taken from the progress callbacks of the group and write stages. The
+report is a plain dict so it can be returned from worker processes, saved as
+JSON next to the outputs and summarised in the result dialog.
+
+Peak memory is only measured when the recorder is created with
+measure_memory=True (a report or profile was requested). It is the
+process's resident peak (VmHWM), reset at the start of a phase on Linux.
+The counter belongs to the whole process, so a phase only resets it when no
+other measured phase is running, and a phase that overlapped another one
+(the pipeline reader thread, the server's worker threads) gets no peak:
+its number would include the other thread's memory. Other platforms only
+report the peak since the start of the process, so per-phase peaks are left
+empty there.
+"""
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# 正在测量内存的阶段数和已开始的阶段数；VmHWM 属于整个进程，只在没有其他阶段测量时重置
+_phase_lock = threading.Lock()
+_phase_state = {"active": 0, "started": 0}
+
+
+def _status_mb(field):
+    """读取 /proc/self/status 中的内存字段（MB），不可用时返回 None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_memory():
+    """
+    Linux 下重置进程的内存峰值（VmHWM），使后续测量只包含之后的处理过程
+    Returns:
+        bool: 是否成功重置
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_mb():
+    """当前进程的内存峰值（MB）"""
+    peak = _status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_memory_mb():
+    rss = _status_mb("VmRSS")
+    return rss if rss is not None else peak_memory_mb()
+
+
+def frame_memory_mb(df):
+    """数据框占用的内存（MB，包含字符串对象）"""
+    return round(df.memory_usage(index=True, deep=True).sum() / 1024 ** 2, 1)
+
+
+class RunRecorder:
+    """
+    记录一个文件处理过程中各阶段的耗时、行数和内存峰值
+    Args:
+        measure_memory (bool): 是否测量各阶段的内存峰值（需要运行报告或性能分析时）
+    """
+    def __init__(self, measure_memory=False):
+        self.measure_memory = measure_memory
+        self.started = time.time()
+        self.phases = []
+        # 阶段名称 -> 该阶段中每次进度回调（每个分子/sheet）之间的耗时
+        self.items = {}
+        self._current = None
+        self._last = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name, rows=None):
+        """
+        记录一个阶段，with 语句中可以向返回的 dict 添加字段（例如 rows）。测量内存时 peak_memory_mb
+        为阶段中的峰值减去阶段开始时的内存，start_memory_mb 为阶段开始时的内存
+        Args:
+            name (str): 阶段名称
+            rows (int): 处理的行数
+        """
+        record = {"phase": name, "seconds": None, "rows": rows, "peak_memory_mb": None}
+        measured = False
+        if self.measure_memory:
+            with _phase_lock:
+                # 其他阶段正在测量时不重置，这个阶段也不报告峰值
+                measured = _phase_state["active"] == 0 and reset_peak_memory()
+                _phase_state["active"] += 1
+                _phase_state["started"] += 1
+                started = _phase_state["started"]
+                base = current_memory_mb()
+        start = time.perf_counter()
+        self._current, self._last = name, start
+        try:
+            yield record
+        finally:
+            self._current = None
+            record["seconds"] = round(time.perf_counter() - start, 4)
+            if self.measure_memory:
+                with _phase_lock:
+                    _phase_state["active"] -= 1
+                    # 期间有其他阶段开始时，峰值包含其他线程的内存
+                    if measured and _phase_state["started"] == started:
+                        record["peak_memory_mb"] = round(max(peak_memory_mb() - base, 0.0), 1)
+                        record["start_memory_mb"] = round(base, 1)
+            self.phases.append(record)
+
+    def wrap_progress(self, progress):
+        """
+        包装进度回调，记录每个分子/sheet 的耗时后再调用原回调
+        Args:
+            progress (callable): progress(stage, done, total) 或 None
+        Returns:
+            callable: 新的进度回调
+        """
+        def recording_progress(stage, done, total):
+            if not total:
+                # "save" 等没有计数的阶段不计入分子/sheet 的耗时
+                if progress is not None:
+                    progress(stage, done, total)
+                return
+            now = time.perf_counter()
+            self.items.setdefault(self._current or stage, []).append(round(now - self._last, 4))
+            self._last = now
+            if progress is not None:
+                progress(stage, done, total)
+        return recording_progress
+
+    def item_seconds(self, phase, names):
+        """
+        阶段中每个分子/sheet 的耗时
+        Args:
+            phase (str): 阶段名称
+            names (list): 与进度回调顺序一致的名称
+        Returns:
+            dict: 名称 -> 秒；回调次数与名称数量不一致时为空
+        """
+        durations = self.items.get(phase, [])
+        if len(durations) != len(names):
+            return {}
+        return dict(zip(names, durations))
+
+    def report(self, filename="", params=None, molecules=None):
+        """
+        生成运行报告
+        Args:
+            filename (str): 输入文件
+            params: 处理参数（dataclass）
+            molecules (list): 每个分子的信息，见 process_file
+        Returns:
+            dict: 可保存为 JSON 的报告
+        """
+        from dataclasses import asdict, is_dataclass
+
+        import numpy
+        import pandas
+
+        return {
+            "file": filename,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "total_seconds": round(sum(p["seconds"] for p in self.phases), 4),
+            "phases": list(self.phases),
+            "molecules": molecules or [],
+            "params": asdict(params) if is_dataclass(params) else params,
+            "environment": {
+                "python": platform.python_version(),
+                "pandas": pandas.__version__,
+                "numpy": numpy.__version__,
+                "platform": platform.platform(),
+                "pid": os.getpid(),
+            },
+        }
+
+
+def save_report(report, path):
+    """保存运行报告为 JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+
+
+def format_report(report, slowest=5):
+    """
+    生成结果对话框中显示的运行报告摘要
+    Args:
+        report (dict): RunRecorder.report 返回的报告
+        slowest (int): 显示耗时最长的分子数
+    Returns:
+        str: 摘要文本
+    """
+    if not report:
+        return ""
+    msg = f"Run report (total {report['total_seconds']:.2f} s):\n"
+    for p in report["phases"]:
+        line = f"  {p['phase']:<22}{p['seconds']:>9.3f} s"
+        if p.get("rows") is not None:
+            line += f"{p['rows']:>12,} rows"
+        if p.get("peak_memory_mb") is not None:
+            line += f"   peak +{p['peak_memory_mb']:.1f} MB"
+        if p.get("frame_mb") is not None:
+            line += f"   frames {p['frame_mb']:.1f} MB"
+        msg += line + "\n"
+    timed = [m for m in report.get("molecules", []) if m.get("seconds")]
+    if timed:
+        timed.sort(key=lambda m: m["seconds"], reverse=True)
+        msg += "Slowest molecules (group + write): " + ", ".join(
+            f"{m['molecule']} {m['seconds']:.3f} s" for m in timed[:slowest]
+        ) + "\n"
+    if report.get("profile_file"):
+        msg += f"Profile saved: {report['profile_file']}\n"
+    return msg
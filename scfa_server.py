@@ -0,0 +1,532 @@
+"""
+本地任务服务：常驻进程保持处理引擎已加载
+
+serve starts an HTTP server on localhost that accepts processing jobs (input
+files, output directory and parameters) and runs them on a pool that stays
+alive between jobs. A script that submits many small files thus pays the
+start-up of Python, pandas and the workbook writers once, not once per file.
+Each worker also keeps a PreparedCache, so a file submitted again with other
+coefficients only repeats the marking and the writers.
+
+API (JSON):
+    POST   /jobs        {"files": [...], "output": "...", "params": {MarkerParams fields}}
+                        or {"args": [arguments of `scfa_cli.py run`], "cwd": "..."};
+                        returns the job
+    GET    /jobs/<id>   job state and per-file results; ?wait=S waits up to S
+                        seconds for the job to finish
+    DELETE /jobs/<id>   cancel the files of the job that have not finished
+    GET    /status      workers, jobs by state and files processed
+
+Relative paths are resolved against "cwd" (default: the server's working
+directory). scfa_client.py is a client that only uses the standard library.
+
+Every request must carry the server's access token as "Authorization:
+Bearer <token>". serve creates a new token for each run and writes it to a
+file only the user can read (scfa_client.token_path(port)), so other users
+of the computer cannot submit jobs. Requests whose Host header is not
+localhost or an IP address are refused (a web page could otherwise reach the
+server through DNS rebinding), and POST bodies must be sent as
+application/json, which a browser does not send across origins without
+asking the server first.
+"""
+import argparse
+import hmac
+import importlib
+import ipaddress
+import json
+import os
+import secrets
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.managers import SyncManager
+from urllib.parse import parse_qs, urlparse, urlsplit
+
+import scfa_batch
+import scfa_cache
+import scfa_client
+import scfa_engine
+import scfa_output
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# 保留的已结束任务数，更早的任务不能再查询
+MAX_FINISHED_JOBS = 1000
+# 请求内容的大小上限（字节）
+MAX_REQUEST_BYTES = 1024 * 1024
+# ?wait= 的上限（秒）
+MAX_WAIT_SECONDS = 3600
+# 启动时导入的模块，第一个任务不再付出导入时间；未安装的跳过
+WARM_MODULES = ("openpyxl", "openpyxl.styles", "xlsxwriter", "pyarrow", "pyarrow.csv", "pyarrow.parquet",
+                "scfa_calibration")
+
+# 工作进程（单进程模式下为服务进程）中的预处理结果缓存
+_cache = None
+
+
+def _ignore_interrupt():
+    # Ctrl+C 由服务进程处理，工作进程通过取消标记停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def warm_up(cache_bytes=scfa_cache.DEFAULT_MAX_BYTES):
+    """
+    导入写出结果使用的模块并创建预处理结果缓存
+    Args:
+        cache_bytes (int): 缓存上限，0 表示不缓存
+    """
+    global _cache
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    _cache = scfa_cache.PreparedCache(cache_bytes) if cache_bytes > 0 else None
+
+
+def _init_worker(cache_bytes):
+    _ignore_interrupt()
+    warm_up(cache_bytes)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_file(file_path, save_path, params, cancel):
+    """
+    在工作进程中处理一个文件
+    Returns:
+        tuple: (BatchItem, 开始时间, 结束时间)
+    """
+    started = time.time()
+    # 流式处理不把整个文件读入内存，不使用缓存
+    cache = _cache if params.stream_rows <= 0 else None
+    item = scfa_batch._process_one(file_path, save_path, params, cancel=cancel, cache=cache)
+    return item, started, time.time()
+
+
+class _RequestParser(argparse.ArgumentParser):
+    """参数错误时抛出 ValueError，而不是退出服务进程"""
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _job_from_args(arguments, cwd):
+    """按 `scfa_cli.py run` 的参数（不含 -j 和 --pipeline）解析任务"""
+    # 参数定义在 scfa_cli 中；只在收到 args 形式的请求时导入
+    import scfa_cli
+    parser = _RequestParser(prog="scfa_client", add_help=False)
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("-o", "--output", default="")
+    scfa_cli.add_param_arguments(parser)
+    args = parser.parse_args([str(a) for a in arguments])
+    files = [os.path.join(cwd, f) for f in args.files]
+    save_path = os.path.join(cwd, args.output) if args.output else ""
+    return files, save_path, scfa_cli.params_from_args(args)
+
+
+def job_from_request(body):
+    """
+    解析 POST /jobs 的请求内容并检查输入文件和参数
+    Args:
+        body (dict): {"files", "output", "params"} 或 {"args", "cwd"}
+    Returns:
+        tuple: (输入文件的绝对路径列表, 输出目录, MarkerParams)
+    Raises:
+        ValueError: 请求无效
+    """
+    if not isinstance(body, dict):
+        raise ValueError("the request must be a JSON object")
+    cwd = body.get("cwd") or os.getcwd()
+    if "args" in body:
+        if not isinstance(body["args"], list):
+            raise ValueError("args must be a list")
+        files, save_path, params = _job_from_args(body["args"], cwd)
+    else:
+        files = body.get("files")
+        if not isinstance(files, list) or not files or not all(isinstance(f, str) for f in files):
+            raise ValueError("files must be a non-empty list of paths")
+        files = [os.path.join(cwd, f) for f in files]
+        save_path = os.path.join(cwd, body["output"]) if body.get("output") else ""
+        values = body.get("params") or {}
+        if not isinstance(values, dict):
+            raise ValueError("params must be an object")
+        unknown = sorted(set(values) - {f.name for f in fields(scfa_engine.MarkerParams)})
+        if unknown:
+            raise ValueError(f"unknown parameters: {', '.join(unknown)}")
+        if isinstance(values.get("group_list"), str):
+            values["group_list"] = scfa_engine.parse_group_list(values["group_list"])
+        params = scfa_engine.MarkerParams(**values)
+        if params.group_list and "split_by_group" not in values:
+            params.split_by_group = True
+    if params.consolidate:
+        # 任务中的文件分别返回结果，没有合并输出
+        raise ValueError("consolidate is not supported by the job server")
+    scfa_output.resolve_formats(params.output_formats)
+    files = [os.path.abspath(f) for f in files]
+    missing = [f for f in files if not os.path.isfile(f)]
+    if missing:
+        raise ValueError(f"File not found: {', '.join(missing)}")
+    # 默认输出到第一个文件所在目录
+    save_path = os.path.abspath(save_path) if save_path else os.path.dirname(files[0])
+    try:
+        os.makedirs(save_path, exist_ok=True)
+    except OSError as e:
+        raise ValueError(f"Cannot create output directory: {e}")
+    return files, save_path, params
+
+
+class Job:
+    """
+    一个处理任务
+    Args:
+        job_id (str): 任务编号
+        files (list): 输入文件的绝对路径
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        cancel (CancelToken): 该任务的取消标记
+    """
+    def __init__(self, job_id, files, save_path, params, cancel):
+        self.id = job_id
+        self.files = files
+        self.save_path = save_path
+        self.params = params
+        self.cancel = cancel
+        self.submitted = time.time()
+        self.futures = []
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def file_state(self, index):
+        """
+        第 index 个文件的状态和结果
+        Returns:
+            dict: file、state（queued、running、done、failed 或 canceled），结束后还有
+                saved_files、message、error、wait_seconds（排队时间）和 seconds（处理时间）
+        """
+        future = self.futures[index]
+        entry = {"file": self.files[index], "state": "queued"}
+        if future.cancelled():
+            entry["state"] = "canceled"
+            return entry
+        if not future.done():
+            if future.running():
+                entry["state"] = "running"
+            return entry
+        try:
+            item, started, finished = future.result()
+        except Exception as e:
+            # 工作进程异常退出
+            entry.update(state="failed", error=str(e))
+            return entry
+        entry.update(wait_seconds=round(started - self.submitted, 3), seconds=round(finished - started, 3))
+        if item.canceled:
+            entry["state"] = "canceled"
+        elif item.result is None:
+            entry.update(state="failed", error=item.error, traceback=item.traceback)
+        else:
+            entry.update(state="done", saved_files=list(item.result.saved_files),
+                         message=scfa_engine.format_message(item.result, self.params))
+            if self.params.save_report:
+                entry["report"] = item.result.report
+        return entry
+
+    def state(self):
+        """queued、running、done 或 canceled"""
+        if self.done():
+            return "canceled" if self.cancel.is_canceled() else "done"
+        if any(future.running() or future.done() for future in self.futures):
+            return "running"
+        return "queued"
+
+    def to_dict(self):
+        files = [self.file_state(i) for i in range(len(self.files))]
+        return {
+            "id": self.id,
+            "state": self.state(),
+            "output": self.save_path,
+            "submitted": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.submitted)),
+            "files": files,
+            "failed": sum(entry["state"] == "failed" for entry in files),
+        }
+
+
+class JobServer:
+    """
+    任务队列和常驻的处理池
+    Args:
+        workers (int): 同时处理的文件数；1 表示在服务进程的一个后台线程中处理
+        cache_bytes (int): 预处理结果缓存的上限（多个工作进程时平分），0 表示不缓存
+        on_result (callable): on_result(job, entry)，每个文件结束后调用，entry 见 Job.file_state
+    """
+    def __init__(self, workers=1, cache_bytes=scfa_cache.DEFAULT_MAX_BYTES, on_result=None):
+        self.workers = max(1, workers)
+        self.on_result = on_result
+        self.started = time.time()
+        self.jobs = {}
+        self.n_files = 0
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.manager = None
+        if self.workers > 1:
+            # threading.Event 不能传给工作进程，使用 Manager 的共享事件
+            self.manager = SyncManager()
+            self.manager.start(_ignore_interrupt)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                initargs=(cache_bytes // self.workers,))
+            # 立即启动所有工作进程，第一个任务不需要等待进程启动
+            wait([self.executor.submit(_ping) for _ in range(self.workers)])
+        else:
+            warm_up(cache_bytes)
+            self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, files, save_path, params):
+        """
+        提交任务，文件按顺序进入处理池
+        Returns:
+            Job: 新任务
+        """
+        event = self.manager.Event() if self.manager is not None else None
+        with self._lock:
+            job = Job(str(self._next_id), files, save_path, params, scfa_engine.CancelToken(event))
+            self._next_id += 1
+        job.futures = [self.executor.submit(_run_file, file_path, save_path, params, job.cancel)
+                       for file_path in files]
+        for i, future in enumerate(job.futures):
+            future.add_done_callback(lambda _, i=i: self._finished(job, i))
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        return job
+
+    def _finished(self, job, index):
+        entry = job.file_state(index)
+        if entry["state"] in ("done", "failed"):
+            with self._lock:
+                self.n_files += 1
+        if self.on_result is not None:
+            self.on_result(job, entry)
+
+    def _prune(self):
+        """只保留最近 MAX_FINISHED_JOBS 个已结束的任务"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.done()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def wait(self, job, timeout=None):
+        """等待任务结束，最多 timeout 秒，返回是否已结束"""
+        wait(job.futures, timeout=timeout)
+        return job.done()
+
+    def cancel(self, job):
+        """未开始的文件不再处理，正在处理的文件在下一个检查点停止"""
+        job.cancel.cancel()
+        for future in job.futures:
+            future.cancel()
+
+    def status(self):
+        with self._lock:
+            jobs = list(self.jobs.values())
+        states = {"queued": 0, "running": 0, "done": 0, "canceled": 0}
+        for job in jobs:
+            states[job.state()] += 1
+        return {
+            "pid": os.getpid(),
+            "workers": self.workers,
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "jobs": states,
+            "files_processed": self.n_files,
+        }
+
+    def close(self):
+        """取消所有任务并关闭处理池"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.manager is not None:
+            self.manager.shutdown()
+
+
+def write_token(path):
+    """
+    生成新的访问令牌并写入只有本用户可读写的文件（0600）
+    Returns:
+        str: 令牌
+    """
+    token = secrets.token_urlsafe(32)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # 旧文件的权限可能更宽，删除后重新创建
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token + "\n")
+    return token
+
+
+def _host_allowed(host):
+    """Host 请求头是否为 localhost 或 IP 地址；其他域名可能经 DNS 重绑定指向本机"""
+    try:
+        name = urlsplit("//" + host).hostname if host else None
+    except ValueError:
+        return False
+    if not name:
+        return False
+    if name == "localhost":
+        return True
+    try:
+        ipaddress.ip_address(name)
+    except ValueError:
+        return False
+    return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "SCFAMarker"
+
+    def log_message(self, format, *args):
+        # 每个文件的结果由 on_result 输出
+        pass
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        """检查 Host 请求头和访问令牌，不通过时返回错误并返回 False"""
+        if not _host_allowed(self.headers.get("Host")):
+            self._send(403, {"error": "invalid Host header"})
+            return False
+        scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), self.server.token.encode()):
+            self._send(401, {"error": "invalid or missing access token"})
+            return False
+        return True
+
+    def _find_job(self, path):
+        """/jobs/<id> 对应的任务，不存在时返回 404 并返回 None"""
+        parts = path.strip("/").split("/")
+        job = self.server.jobs.get(parts[1]) if len(parts) == 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._send(404, {"error": f"not found: {path}"})
+        return job
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        url = urlparse(self.path)
+        if url.path.rstrip("/") == "/status":
+            self._send(200, self.server.jobs.status())
+            return
+        job = self._find_job(url.path)
+        if job is None:
+            return
+        timeout = parse_qs(url.query).get("wait")
+        if timeout:
+            try:
+                self.server.jobs.wait(job, min(max(float(timeout[0]), 0.0), MAX_WAIT_SECONDS))
+            except ValueError:
+                self._send(400, {"error": f"invalid wait: {timeout[0]}"})
+                return
+        self._send(200, job.to_dict())
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if urlparse(self.path).path.rstrip("/") != "/jobs":
+            self._send(404, {"error": f"not found: {self.path}"})
+            return
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self._send(415, {"error": "the request must be sent as application/json"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self._send(413, {"error": "request too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            files, save_path, params = job_from_request(body)
+        except (ValueError, TypeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        job = self.server.jobs.submit(files, save_path, params)
+        self._send(202, job.to_dict())
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        job = self._find_job(urlparse(self.path).path)
+        if job is None:
+            return
+        self.server.jobs.cancel(job)
+        self._send(200, job.to_dict())
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1, cache_bytes=scfa_cache.DEFAULT_MAX_BYTES,
+          stop=None, on_result=None, on_ready=None, token_file=None):
+    """
+    运行任务服务，直到 stop 被取消（或 Ctrl+C）
+    Args:
+        host (str): 监听地址，默认只接受本机连接
+        port (int): 端口，0 表示由系统选择
+        workers (int): 同时处理的文件数，1 表示在服务进程中处理
+        cache_bytes (int): 预处理结果缓存的上限，0 表示不缓存
+        stop (CancelToken): 停止标记，正在处理的文件在下一个检查点停止
+        on_result (callable): on_result(job, entry)，每个文件结束后调用
+        on_ready (callable): on_ready((host, port))，开始接受任务时调用
+        token_file (str): 访问令牌文件，默认为 scfa_client.token_path(port)，停止时删除
+    Returns:
+        int: 处理完成（成功或失败）的文件数
+    """
+    stop = stop or scfa_engine.CancelToken()
+    jobs = JobServer(workers, cache_bytes, on_result)
+    try:
+        httpd = ThreadingHTTPServer((host, port), _Handler)
+    except OSError:
+        jobs.close()
+        raise
+    httpd.daemon_threads = True
+    httpd.jobs = jobs
+    token_file = token_file or scfa_client.token_path(httpd.server_address[1])
+    try:
+        httpd.token = write_token(token_file)
+    except OSError:
+        httpd.server_close()
+        jobs.close()
+        raise
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.5}, daemon=True)
+    thread.start()
+    try:
+        if on_ready is not None:
+            on_ready(httpd.server_address[:2])
+        while not stop.wait(0.5):
+            pass
+    except KeyboardInterrupt:
+        stop.cancel()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        jobs.close()
+        # 令牌文件已被其他服务替换时保留
+        if scfa_client.read_token(token_file) == httpd.token:
+            os.remove(token_file)
+    return jobs.n_files
@@ -0,0 +1,354 @@
+"""
+分块流式处理：两遍读取 CSV，内存不随文件大小增长
+
+process_file_stream handles exports that do not fit in memory. The CSV is
+read in chunks of MarkerParams.stream_rows rows, twice:
+
+    scan    every chunk is prepared as usual and reduced to per-molecule
+            statistics: standard min/max, Quantification width, whether all
+            values are integers, unit counts and row counts
+    mark    every chunk is marked with mark_prepared against those
+            whole-file statistics; the marked rows of each molecule are
+            appended (pickled) to a spill file in the output directory
+    write   the spill files are read back molecule by molecule and appended
+            to every output format (OutputFormat.open_stream), so the "All"
+            table and the per-molecule tables come out in the same order as
+            process_file writes them
+
+Only one chunk is held in memory at a time, plus, with group splitting, the
+marked rows of one molecule (process_group needs all replicates of a
+molecule). Output files are the same as process_file; the compact mode has no
+effect because rows are not kept in memory. The spill files are written next
+to the outputs rather than to the temporary directory, which is often in
+memory.
+"""
+import dataclasses
+import os
+import pickle
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import scfa_engine
+import scfa_output
+import scfa_report
+from scfa_engine import check_canceled, report_progress
+
+# 没有指定时每块的行数
+DEFAULT_STREAM_ROWS = 200_000
+
+
+@dataclasses.dataclass
+class _MoleculeStats:
+    """第一遍中一个分子的累计统计"""
+    min: float = np.nan
+    max: float = np.nan
+    width: float = np.nan
+    all_int: bool = True
+    rows: int = 0
+    units: Counter = dataclasses.field(default_factory=Counter)
+
+
+def _read_chunks(handle, params):
+    """
+    分块读取 CSV，每块为 read_input 返回的数据框（pyarrow 解析器不支持分块，使用 c 解析器）
+    """
+    engine = "python" if params.csv_engine == "python" else "c"
+    reader = pd.read_csv(handle, usecols=scfa_engine.REQUIRED_COLUMNS, dtype=scfa_engine.INPUT_DTYPES,
+                         engine=engine, chunksize=params.stream_rows)
+    with reader:
+        for chunk in reader:
+            yield scfa_engine.read_input(chunk[scfa_engine.REQUIRED_COLUMNS])
+
+
+def _chunk_progress(progress, stage, handle, size):
+    """按已读取的字节报告进度（百分比）"""
+    report_progress(progress, stage, min(int(handle.tell() * 100 / max(size, 1)), 100), 100)
+
+
+def scan_file(path, params, progress=None, cancel=None):
+    """
+    第一遍：逐块累计整个文件中每个分子的统计
+    Args:
+        path (str): CSV 文件路径
+        params (MarkerParams): 处理参数，使用 stream_rows 和 csv_engine
+        progress (callable): 进度回调，每块调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (PreparedFrame, input_rows)。PreparedFrame 不含行（rows 为空），
+            molecules、ranges、width、all_int、units 与读取整个文件时相同；
+            input_rows 为每个分子的输入行数
+    """
+    stats = {}
+    split_error = None
+    size = os.path.getsize(path)
+    with open(path, "rb") as handle:
+        for df in _read_chunks(handle, params):
+            check_canceled(cancel)
+            prepared = scfa_engine.prepare_frame(df, cancel)
+            if prepared.split_error is not None:
+                split_error = prepared.split_error
+            uniques, _, counts = scfa_engine.unit_counts(prepared)
+            rows = np.bincount(prepared.rows["code"].to_numpy(), minlength=len(prepared.molecules))
+            ranges = prepared.ranges.to_numpy(dtype=float)
+            for i, molecule in enumerate(prepared.molecules):
+                entry = stats.setdefault(molecule, _MoleculeStats())
+                entry.min = np.fmin(entry.min, ranges[i, 0])
+                entry.max = np.fmax(entry.max, ranges[i, 1])
+                if prepared.width is not None:
+                    entry.width = np.fmax(entry.width, prepared.width[i])
+                    entry.all_int = entry.all_int and bool(prepared.all_int[i])
+                entry.rows += int(rows[i])
+                for j in np.flatnonzero(counts[i]):
+                    entry.units[uniques[j]] += int(counts[i, j])
+            _chunk_progress(progress, "scan", handle, size)
+
+    molecules = sorted(stats)
+    entries = [stats[m] for m in molecules]
+    # 与 molecule_units 相同：最常见的单位，数量相同时取排序在前的单位
+    units = [min(e.units, key=lambda u: (-e.units[u], u)) if e.units else "" for e in entries]
+    rows = pd.DataFrame({
+        "Molecule": np.empty(0, dtype=object),
+        "Replicate": np.empty(0, dtype=object),
+        "code": np.empty(0, dtype=np.int64),
+        "value": np.empty(0),
+        "Unit": pd.Categorical([]),
+        "is_standard": np.empty(0, dtype=bool),
+    })
+    summary = scfa_engine.PreparedFrame(
+        molecules=molecules,
+        rows=rows,
+        ranges=pd.DataFrame({"min": [e.min for e in entries], "max": [e.max for e in entries]},
+                            index=pd.Index(molecules, dtype=object), dtype=float),
+        width=None if split_error is not None else np.array([e.width for e in entries], dtype=float),
+        all_int=None if split_error is not None else np.array([e.all_int for e in entries], dtype=bool),
+        split_error=split_error,
+        unparsed=np.zeros(len(molecules), dtype=np.int64),
+        units=units,
+    )
+    return summary, np.array([e.rows for e in entries], dtype=np.int64)
+
+
+def _spill_path(spill_dir, index):
+    return os.path.join(spill_dir, f"{index}.pkl")
+
+
+def _read_spill(spill_dir, index):
+    """按写入顺序读回一个分子的标记结果"""
+    path = _spill_path(spill_dir, index)
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def mark_chunks(path, summary, params, spill_dir, progress=None, cancel=None):
+    """
+    第二遍：按整个文件的统计逐块标记，每个分子的标记结果追加到 spill_dir 中各自的文件
+    Args:
+        path (str): CSV 文件路径
+        summary (PreparedFrame): scan_file 返回的统计（可已应用标准范围库）
+        params (MarkerParams): 处理参数
+        spill_dir (str): 临时文件目录
+        progress (callable): 进度回调，每块调用一次
+        cancel (CancelToken): 取消标记
+    Returns:
+        tuple: (每个分子的标记行数, 分子 -> 无法解析或换算的行数)
+    """
+    lookup = {molecule: i for i, molecule in enumerate(summary.molecules)}
+    n_molecules = len(summary.molecules)
+    marked_rows = np.zeros(n_molecules, dtype=np.int64)
+    unparsed = Counter()
+    # 不保留标记结果，紧凑模式没有作用
+    mark_params = dataclasses.replace(params, compact=False)
+    size = os.path.getsize(path)
+    with open(path, "rb") as handle:
+        for df in _read_chunks(handle, params):
+            check_canceled(cancel)
+            prepared = scfa_engine.prepare_frame(df, cancel)
+            # 块内的分子序号换成整个文件中的序号（两个列表都已排序，行的顺序不变）
+            code_map = np.array([lookup[m] for m in prepared.molecules], dtype=np.int64)
+            chunk_unparsed = np.zeros(n_molecules, dtype=np.int64)
+            chunk_unparsed[code_map] = prepared.unparsed
+            chunk = dataclasses.replace(
+                summary,
+                rows=prepared.rows.assign(code=code_map[prepared.rows["code"].to_numpy()]),
+                unparsed=chunk_unparsed,
+            )
+            group_dict, processed_results = scfa_engine.mark_prepared(chunk, mark_params, cancel=cancel,
+                                                                     verbose=False)
+            unparsed.update(processed_results["unparsed"])
+            for molecule, dft in group_dict.items():
+                if molecule == "All" or not len(dft):
+                    continue
+                i = lookup[molecule]
+                with open(_spill_path(spill_dir, i), "ab") as f:
+                    pickle.dump(dft, f, protocol=pickle.HIGHEST_PROTOCOL)
+                marked_rows[i] += len(dft)
+            _chunk_progress(progress, "mark", handle, size)
+    # 与 mark_prepared 相同，按分子顺序
+    unparsed = {m: unparsed[m] for m in summary.molecules if unparsed[m]}
+    return marked_rows, unparsed
+
+
+def write_spilled(result, template, spill_dir, molecule_index, save_path, params, progress=None, cancel=None):
+    """
+    第三遍：按分子顺序读回标记结果，追加写出 MARKED_*（以及按组别拆分时的 GROUPED_*）
+    Args:
+        result (FileResult): 处理结果，更新 saved_files、failed_groups、group_success、group_failed
+        template (dict): mark_prepared 对统计（不含行）返回的 group_dict，
+            提供成功的分子和各表的列
+        spill_dir (str): mark_chunks 写入的临时文件目录
+        molecule_index (dict): 分子 -> 临时文件序号（在 scan_file 分子列表中的位置）
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+    """
+    formats = scfa_output.resolve_formats(params.output_formats)
+    original_name = scfa_engine.output_name(result.filename)
+    molecules = [key for key in template if key != "All"]
+    # "All" 表中 Quantification 的类型：所有分子都为整数时为整数，与 pd.concat 的结果相同
+    stored_dtype = np.float32 if params.float32 else np.float64
+    all_dtype = np.int64
+    if any(template[m]["Quantification"].dtype != np.int64 for m in molecules):
+        all_dtype = stored_dtype
+
+    group_list = params.group_list if params.split_by_group else []
+    if params.split_by_group and not group_list:
+        print("No group list input, skip group processing")
+    marked_streams = []
+    grouped_streams = []
+    try:
+        for output_format in formats:
+            path = os.path.join(save_path, f"MARKED_{original_name}{output_format.suffix}")
+            marked_streams.append((path, output_format.open_stream(path, "marked", ["All"] + molecules)))
+        if group_list:
+            kind, sheet_names = "grouped", [f"{m}_{g}" for m in molecules for g in group_list]
+            if params.group_layout != "sheets":
+                # 长表布局：每个分子的长表依次追加
+                kind, sheet_names = "grouped-long", [scfa_engine.GROUPED_LONG_SHEET]
+            for output_format in formats:
+                path = os.path.join(save_path, f"GROUPED_{original_name}{output_format.suffix}")
+                grouped_streams.append((path, output_format.open_stream(path, kind, sheet_names)))
+        for _, stream in marked_streams:
+            stream.append("All", template["All"].astype({"Quantification": all_dtype}), cancel)
+
+        n_sheets = 0
+        for k, molecule in enumerate(molecules):
+            check_canceled(cancel)
+            for _, stream in marked_streams:
+                # 没有样本行的分子也有一个只含表头的表
+                stream.append(molecule, template[molecule], cancel)
+            pieces = _read_spill(spill_dir, molecule_index[molecule])
+            if grouped_streams:
+                # 分组需要一个分子的全部行
+                pieces = list(pieces)
+                pieces = [pd.concat(pieces) if pieces else template[molecule]]
+            for dft in pieces:
+                for _, stream in marked_streams:
+                    stream.append("All", dft.astype({"Quantification": all_dtype}), cancel)
+                    stream.append(molecule, dft, cancel)
+            if grouped_streams:
+                try:
+                    group_func = scfa_engine.process_group
+                    if params.group_layout != "sheets":
+                        group_func = scfa_engine.group_long
+                    res_dict, failed_groups = group_func({molecule: pieces[0]}, params, cancel=cancel)
+                    result.failed_groups.extend(failed_groups)
+                    for sheet_name, dft in res_dict.items():
+                        for _, stream in grouped_streams:
+                            stream.append(sheet_name, dft, cancel)
+                    n_sheets += len(res_dict)
+                except scfa_engine.ProcessingCanceled:
+                    raise
+                except Exception as e:
+                    # 与 process_file 相同：分组失败时不保存 GROUPED_* 文件
+                    result.group_failed.append(f"Group processing: {str(e)}")
+                    streams, grouped_streams = grouped_streams, []
+                    scfa_output.close_streams(streams, save=False)
+            report_progress(progress, "write_marked", k + 1, len(molecules))
+        # 保存工作簿不能中断，开始前最后检查一次
+        check_canceled(cancel)
+    except BaseException:
+        scfa_output.close_streams(marked_streams + grouped_streams, save=False)
+        raise
+    report_progress(progress, "save", 0, 0)
+    scfa_output.close_streams(marked_streams)
+    result.saved_files.extend(path for path, _ in marked_streams)
+    if grouped_streams and n_sheets:
+        scfa_output.close_streams(grouped_streams)
+        result.saved_files.extend(path for path, _ in grouped_streams)
+        result.group_success.append("Group processing")
+    else:
+        # 没有任何分组结果时与 process_file 一样不保存 GROUPED_* 文件
+        scfa_output.close_streams(grouped_streams, save=False)
+
+
+def process_file_stream(source, save_path, params, filename="", progress=None, cancel=None):
+    """
+    分块处理单个 CSV 文件并保存 MARKED_* 和 GROUPED_* 文件，输出与 process_file 相同
+    Args:
+        source (str): CSV 文件路径
+        save_path (str): 输出目录，同时存放临时文件
+        params (MarkerParams): 处理参数，stream_rows 为每块的行数
+        filename (str): 用于命名输出文件，默认为 source
+        progress (callable): 进度回调 progress(stage, done, total)，scan/mark 阶段为读取的百分比
+        cancel (CancelToken): 取消标记，取消时抛出 ProcessingCanceled，不保留未写完的文件
+    Returns:
+        FileResult: 处理结果，不含 marked/grouped 数据框
+    """
+    if params.stream_rows <= 0:
+        params = dataclasses.replace(params, stream_rows=DEFAULT_STREAM_ROWS)
+    if params.split_by_group and params.group_layout == "long-wide":
+        # 宽表的列要等所有分子处理完才能确定，不能逐个分子追加
+        raise ValueError("The long-wide grouped layout is not supported when streaming.")
+    filename = filename or source
+    result = scfa_engine.FileResult(filename=filename)
+    recorder = scfa_report.RunRecorder(params.save_report or params.profile)
+    progress = recorder.wrap_progress(progress)
+    profiler = None
+    if params.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        check_canceled(cancel)
+        with recorder.phase("scan") as record:
+            summary, input_rows = scan_file(source, params, progress, cancel)
+            record["rows"] = int(input_rows.sum())
+        if params.calibration_store:
+            with recorder.phase("calibration", rows=len(summary.molecules)):
+                summary, result.calibrated = scfa_engine.apply_calibration(summary, params)
+        print(f'Start processing file: {os.path.basename(filename)}')
+        # 对不含行的统计标记一次：得到成功和失败的分子，以及各表的列
+        template, processed_results = scfa_engine.mark_prepared(summary, dataclasses.replace(params, compact=False))
+        result.success = processed_results["success"]
+        result.failed = processed_results["failed"]
+        molecule_index = {molecule: i for i, molecule in enumerate(summary.molecules)}
+        with tempfile.TemporaryDirectory(prefix=".scfa_stream_", dir=save_path) as spill_dir:
+            with recorder.phase("mark", rows=int(input_rows.sum())):
+                marked_rows, result.unparsed = mark_chunks(source, summary, params, spill_dir, progress, cancel)
+            with recorder.phase("write", rows=int(marked_rows.sum())):
+                write_spilled(result, template, spill_dir, molecule_index, save_path, params, progress, cancel)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+    calibrated = set(result.calibrated)
+    molecules = []
+    for molecule in result.success + result.failed:
+        i = molecule_index[molecule]
+        molecules.append({
+            "molecule": molecule,
+            "status": "success" if molecule in template else "failed",
+            "input_rows": int(input_rows[i]),
+            "marked_rows": int(marked_rows[i]) if molecule in template else 0,
+            "unparsed_rows": result.unparsed.get(molecule, 0),
+            "range_source": "store" if molecule in calibrated else "file",
+        })
+    return scfa_engine.finish_report(result, save_path, params, recorder, profiler, molecules)
@@ -0,0 +1,170 @@
+"""
+参数扫描：一次计算多组系数下的 In/High/Low 数量
+
+sweep_prepared evaluates every combination of min coefficient, max
+coefficient and dilution factor on an already parsed file (PreparedFrame)
+without building the marked tables or writing any workbook. For each
+molecule the non-standard values are sorted once and the threshold grid is
+located with searchsorted, so the cost grows with the number of molecules,
+not with the number of combinations times the number of rows.
+
+The Standard Status never depends on the dilution factor (values and
+standard ranges are both scaled by it), so the dilution grid only changes
+the reported thresholds, which are given in diluted-adjusted units.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import scfa_engine
+
+SWEEP_COLUMNS = [
+    "Molecule", "Min Coefficient", "Max Coefficient", "Dilution",
+    "Low Threshold", "High Threshold", "Samples", "In", "High", "Low", "No Value"
+]
+
+
+def parse_grid(text):
+    """
+    解析参数网格
+    Args:
+        text (str): 逗号分隔的数值 "0.7, 0.8, 0.9"，或 "start:stop:step"（包含 stop）
+    Returns:
+        list: 数值列表
+    """
+    text = text.strip()
+    if ":" in text:
+        parts = [float(p) for p in text.split(":")]
+        if len(parts) != 3 or parts[2] <= 0:
+            raise ValueError(f"Invalid grid '{text}', expected start:stop:step with step > 0")
+        start, stop, step = parts
+        n = int(np.floor((stop - start) / step + 1e-9)) + 1
+        return [round(start + i * step, 10) for i in range(max(n, 0))]
+    values = [float(p) for p in text.split(",") if p.strip()]
+    if not values:
+        raise ValueError("Empty parameter grid")
+    return values
+
+
+def _molecule_counts(values, min_val, max_val, min_coeffs, max_coeffs):
+    """
+    单个分子在 min_coeffs x max_coeffs 网格上的计数
+    Returns:
+        tuple: (n_low, n_high)，形状均为 (len(min_coeffs), len(max_coeffs))
+    """
+    lo = min_val * min_coeffs
+    hi = max_val * max_coeffs
+    n = len(values)
+    # 没有标准品的分子阈值为 NaN，与 mark_dataframe 一致全部为 In
+    n_low = np.where(np.isnan(lo), 0, np.searchsorted(values, lo, side="left"))
+    # Low 优先：lo > hi 时 High 只统计不低于 lo 的值
+    above_hi = np.where(np.isnan(hi), n, np.searchsorted(values, hi, side="right"))
+    n_high = n - np.maximum(above_hi[None, :], n_low[:, None])
+    n_high = np.where(np.isnan(hi)[None, :], 0, n_high)
+    return np.broadcast_to(n_low[:, None], n_high.shape), n_high
+
+
+def sweep_prepared(prepared, min_coeffs, max_coeffs, dilutions=(1.0,), cancel=None):
+    """
+    在参数网格上统计每个分子的 In/High/Low 数量
+    Args:
+        prepared (PreparedFrame): scfa_engine.load_prepared 返回的预处理结果
+        min_coeffs (list): 标准范围最小值系数
+        max_coeffs (list): 标准范围最大值系数
+        dilutions (list): 稀释倍数，只影响报告的阈值
+        cancel (CancelToken): 取消标记
+    Returns:
+        DataFrame: 列见 SWEEP_COLUMNS，每个分子和参数组合一行；
+            处理失败的分子（Quantification 无法拆分）不包含在内
+    """
+    min_coeffs = np.asarray(min_coeffs, dtype=float)
+    max_coeffs = np.asarray(max_coeffs, dtype=float)
+    dilutions = np.asarray(dilutions, dtype=float)
+    n_min, n_max, n_dil = len(min_coeffs), len(max_coeffs), len(dilutions)
+
+    rows = prepared.rows
+    codes = rows["code"].to_numpy()
+    keep = ~rows["is_standard"].to_numpy()
+    codes = codes[keep]
+    values = rows["value"].to_numpy()[keep]
+    # 按分子、数值排序，NaN 排在每个分子的最后
+    order = np.lexsort((values, codes))
+    codes = codes[order]
+    values = values[order]
+    bounds = np.searchsorted(codes, np.arange(len(prepared.molecules) + 1))
+    min_vals = prepared.ranges["min"].to_numpy(dtype=float)
+    max_vals = prepared.ranges["max"].to_numpy(dtype=float)
+
+    mol_index, samples, counts_low, counts_high, counts_nan = [], [], [], [], []
+    for i in range(len(prepared.molecules)):
+        scfa_engine.check_canceled(cancel)
+        if prepared.split_error is not None or prepared.width[i] != 2:
+            continue
+        segment = values[bounds[i]:bounds[i + 1]]
+        n_valid = int(np.count_nonzero(~np.isnan(segment)))
+        n_low, n_high = _molecule_counts(segment[:n_valid], min_vals[i], max_vals[i], min_coeffs, max_coeffs)
+        mol_index.append(i)
+        samples.append(len(segment))
+        counts_low.append(n_low)
+        counts_high.append(n_high)
+        counts_nan.append(len(segment) - n_valid)
+
+    n_mol = len(mol_index)
+    n_combo = n_min * n_max
+    shape = (n_mol, n_min, n_max, n_dil)
+    low = np.broadcast_to(np.asarray(counts_low, dtype=np.int64).reshape(n_mol, n_min, n_max, 1), shape)
+    high = np.broadcast_to(np.asarray(counts_high, dtype=np.int64).reshape(n_mol, n_min, n_max, 1), shape)
+    samples = np.broadcast_to(np.asarray(samples, dtype=np.int64).reshape(n_mol, 1, 1, 1), shape)
+    no_value = np.broadcast_to(np.asarray(counts_nan, dtype=np.int64).reshape(n_mol, 1, 1, 1), shape)
+
+    min_grid = min_coeffs.reshape(1, n_min, 1, 1)
+    max_grid = max_coeffs.reshape(1, 1, n_max, 1)
+    dil_grid = dilutions.reshape(1, 1, 1, n_dil)
+    low_threshold = min_vals[mol_index].reshape(n_mol, 1, 1, 1) * min_grid * dil_grid
+    high_threshold = max_vals[mol_index].reshape(n_mol, 1, 1, 1) * max_grid * dil_grid
+
+    n_rows = n_mol * n_combo * n_dil
+    table = pd.DataFrame({
+        "Molecule": np.repeat(np.asarray(prepared.molecules, dtype=object)[mol_index], n_combo * n_dil),
+        "Min Coefficient": np.broadcast_to(min_grid, shape).reshape(n_rows),
+        "Max Coefficient": np.broadcast_to(max_grid, shape).reshape(n_rows),
+        "Dilution": np.broadcast_to(dil_grid, shape).reshape(n_rows),
+        "Low Threshold": np.broadcast_to(low_threshold, shape).reshape(n_rows),
+        "High Threshold": np.broadcast_to(high_threshold, shape).reshape(n_rows),
+        "Samples": samples.reshape(n_rows),
+        "In": (samples - no_value - low - high).reshape(n_rows),
+        "High": high.reshape(n_rows),
+        "Low": low.reshape(n_rows),
+        "No Value": no_value.reshape(n_rows),
+    }, columns=SWEEP_COLUMNS)
+    return table
+
+
+def sweep_summary(table):
+    """按参数组合汇总所有分子的数量"""
+    keys = ["Min Coefficient", "Max Coefficient", "Dilution"]
+    return table.groupby(keys, sort=False)[["Samples", "In", "High", "Low", "No Value"]].sum().reset_index()
+
+
+def sweep_file(source, min_coeffs, max_coeffs, dilutions=(1.0,), engine="auto", cache=None, cancel=None):
+    """
+    读取文件并进行参数扫描
+    Args:
+        source (str or DataFrame): CSV 文件路径或数据框
+        cache (PreparedCache): 预处理结果缓存，可选
+    Returns:
+        DataFrame: 见 sweep_prepared
+    """
+    if cache is not None and not isinstance(source, pd.DataFrame):
+        prepared = cache.load(source, engine, cancel)
+    else:
+        prepared = scfa_engine.load_prepared(source, engine, cancel)
+    return sweep_prepared(prepared, min_coeffs, max_coeffs, dilutions, cancel)
+
+
+def save_sweep(table, save_path, filename):
+    """保存为 SWEEP_{文件名}.csv，返回保存路径"""
+    path = os.path.join(save_path, f"SWEEP_{scfa_engine.output_name(filename)}.csv")
+    table.to_csv(path, index=False)
+    return path
@@ -0,0 +1,284 @@
+"""
+标记结果预览：Qt model/view 表格直接显示内存中的标记数据框
+
+MarkedTableModel is a QAbstractTableModel over the marked "All" DataFrame.
+It keeps references to the frame's column arrays (no copy) and an array of
+row positions; filtering by molecule or status and sorting only rebuild that
+position array with vectorised pandas/numpy operations on the frame. The view
+asks for the cells it paints, so no widget item is created per cell, and rows
+are announced to the view in blocks (canFetchMore/fetchMore) while scrolling.
+A result with a million rows opens without walking its rows.
+
+ResultViewer is the dialog around the model, with a molecule filter, a status
+filter and (for batches) a file selector.
+"""
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QTableView, QHeaderView, QAbstractItemView, QPushButton
+)
+
+# 每次向视图增加的行数
+FETCH_ROWS = 5000
+
+# Standard Status 的筛选项：(显示文本, 状态值)
+STATUS_FILTERS = [
+    ("All statuses", None),
+    ("In range", "In"),
+    ("Low", "Low"),
+    ("High", "High"),
+    ("No value", ""),
+]
+
+
+class _Column:
+    """数据框中一列的只读访问，不复制数据"""
+    def __init__(self, series):
+        values = series.array
+        self.categories = None
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            self.codes = values.codes
+            self.categories = np.asarray(values.categories, dtype=object)
+        elif isinstance(series.dtype, np.dtype):
+            values = series.to_numpy()
+        self.values = values
+        self.numeric = pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+
+    def get(self, position):
+        if self.categories is not None:
+            code = self.codes[position]
+            return None if code < 0 else self.categories[code]
+        return self.values[position]
+
+
+def format_cell(value):
+    """单元格显示文本，缺失值为空"""
+    if value is None or value is pd.NA:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else format(float(value), ".15g")
+    return str(value)
+
+
+class MarkedTableModel(QAbstractTableModel):
+    """
+    标记结果的表格模型
+    Args:
+        frame (DataFrame): 标记结果（通常为 FileResult.marked["All"]），模型不修改也不复制它
+        parent (QObject): 父对象
+    """
+    def __init__(self, frame, parent=None):
+        super().__init__(parent)
+        self.frame = frame
+        self.columns = [str(col) for col in frame.columns]
+        self._columns = [_Column(frame.iloc[:, i]) for i in range(frame.shape[1])]
+        # 排序键按列缓存，同一列再次排序时不再计算
+        self._sort_keys = {}
+        self._filters = {}
+        self._sort_column = -1
+        self._sort_order = Qt.AscendingOrder
+        # 当前显示的行在 frame 中的位置（筛选并排序后）
+        self._positions = np.arange(len(frame))
+        self._loaded = min(FETCH_ROWS, len(self._positions))
+
+    # ---- QAbstractTableModel ----
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = self._columns[index.column()]
+        if role == Qt.DisplayRole:
+            return format_cell(column.get(self._positions[index.row()]))
+        if role == Qt.TextAlignmentRole and column.numeric:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section]
+        # 行号为该行在完整结果中的位置，排序和筛选后仍可对应
+        return str(self._positions[section] + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._positions)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        n = min(FETCH_ROWS, len(self._positions) - self._loaded)
+        if n <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + n - 1)
+        self._loaded += n
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        self._refresh()
+
+    # ---- 筛选 ----
+    def total_rows(self):
+        """结果的总行数"""
+        return len(self.frame)
+
+    def visible_rows(self):
+        """筛选后的行数"""
+        return len(self._positions)
+
+    def set_filter(self, column, value):
+        """
+        只显示 column 等于 value 的行
+        Args:
+            column (str): 列名，例如 "Molecule"、"Standard Status"
+            value: 需要的值，None 表示取消该列的筛选
+        """
+        if value is None:
+            self._filters.pop(column, None)
+        else:
+            self._filters[column] = value
+        self._refresh()
+
+    def distinct_values(self, column):
+        """某列中出现的值（排序后），用于筛选选项"""
+        if column not in self.frame.columns:
+            return []
+        values = self.frame[column].dropna().unique()
+        return sorted(str(value) for value in values)
+
+    def _sort_key(self, column):
+        """可直接 argsort 的浮点排序键，缺失值为 NaN（升序和降序都排在最后）"""
+        if column not in self._sort_keys:
+            col = self._columns[column]
+            if col.categories is not None:
+                # 按类别文本的顺序给编码排名
+                rank = np.empty(len(col.categories) + 1)
+                rank[:-1] = np.argsort(np.argsort(col.categories.astype(str), kind="stable"))
+                rank[-1] = np.nan
+                key = rank[col.codes]
+            elif col.numeric:
+                key = np.asarray(col.values, dtype=float)
+            else:
+                codes, _ = pd.factorize(self.frame.iloc[:, column], sort=True)
+                key = np.where(codes < 0, np.nan, codes)
+            self._sort_keys[column] = key
+        return self._sort_keys[column]
+
+    def _refresh(self):
+        """按筛选和排序重新计算显示的行，视图从第一块行重新开始"""
+        self.beginResetModel()
+        mask = None
+        for column, value in self._filters.items():
+            match = (self.frame[column] == value).to_numpy(dtype=bool, na_value=False)
+            mask = match if mask is None else mask & match
+        positions = np.arange(len(self.frame)) if mask is None else np.flatnonzero(mask)
+        if 0 <= self._sort_column < len(self._columns):
+            key = self._sort_key(self._sort_column)[positions]
+            if self._sort_order == Qt.DescendingOrder:
+                key = -key
+            positions = positions[np.argsort(key, kind="stable")]
+        self._positions = positions
+        self._loaded = min(FETCH_ROWS, len(positions))
+        self.endResetModel()
+
+
+class ResultViewer(QDialog):
+    """
+    标记结果预览窗口
+    Args:
+        frames (dict): 文件名 -> 标记结果数据框
+        parent (QWidget): 父窗口
+    """
+    def __init__(self, frames, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Marked results")
+        self.resize(1000, 600)
+        self.frames = frames
+        self.model = None
+
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        self.comboBox_file = QComboBox()
+        for name in frames:
+            self.comboBox_file.addItem(name)
+        self.comboBox_file.currentIndexChanged.connect(self._show_current_file)
+        file_label = QLabel("File:")
+        filter_layout.addWidget(file_label)
+        filter_layout.addWidget(self.comboBox_file)
+        # 单个文件时不需要选择
+        file_label.setVisible(len(frames) > 1)
+        self.comboBox_file.setVisible(len(frames) > 1)
+        filter_layout.addWidget(QLabel("Molecule:"))
+        self.comboBox_molecule = QComboBox()
+        self.comboBox_molecule.setMinimumContentsLength(20)
+        self.comboBox_molecule.currentIndexChanged.connect(self._on_molecule_changed)
+        filter_layout.addWidget(self.comboBox_molecule)
+        filter_layout.addWidget(QLabel("Status:"))
+        self.comboBox_status = QComboBox()
+        for label, value in STATUS_FILTERS:
+            self.comboBox_status.addItem(label, value)
+        self.comboBox_status.currentIndexChanged.connect(self._on_status_changed)
+        filter_layout.addWidget(self.comboBox_status)
+        filter_layout.addStretch()
+        self.label_rows = QLabel()
+        filter_layout.addWidget(self.label_rows)
+        layout.addLayout(filter_layout)
+
+        self.table_view = QTableView()
+        self.table_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_view.setAlternatingRowColors(True)
+        self.table_view.setWordWrap(False)
+        # 固定行高，视图不需要逐行计算高度
+        vertical_header = self.table_view.verticalHeader()
+        vertical_header.setSectionResizeMode(QHeaderView.Fixed)
+        vertical_header.setDefaultSectionSize(self.table_view.fontMetrics().height() + 6)
+        self.table_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        # 打开时保持原始顺序：先设置无排序列，再启用排序（启用时会立即按排序列排序一次）
+        self.table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table_view.setSortingEnabled(True)
+        layout.addWidget(self.table_view)
+
+        btn = QPushButton("Close")
+        btn.clicked.connect(self.accept)
+        layout.addWidget(btn)
+        self._show_current_file()
+
+    def _show_current_file(self):
+        name = self.comboBox_file.currentText()
+        if name not in self.frames:
+            return
+        self.model = MarkedTableModel(self.frames[name], self)
+        self.table_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table_view.setModel(self.model)
+        self.model.modelReset.connect(self._update_row_label)
+        # 重新填充分子列表时不触发筛选
+        self.comboBox_molecule.blockSignals(True)
+        self.comboBox_molecule.clear()
+        self.comboBox_molecule.addItem("All molecules", None)
+        for molecule in self.model.distinct_values("Molecule"):
+            self.comboBox_molecule.addItem(molecule, molecule)
+        self.comboBox_molecule.blockSignals(False)
+        self.comboBox_status.setEnabled("Standard Status" in self.model.frame.columns)
+        status = self.comboBox_status.currentData()
+        if status is not None and "Standard Status" in self.model.frame.columns:
+            self.model.set_filter("Standard Status", status)
+        self._update_row_label()
+
+    def _on_molecule_changed(self):
+        if self.model is not None:
+            self.model.set_filter("Molecule", self.comboBox_molecule.currentData())
+
+    def _on_status_changed(self):
+        if self.model is not None and "Standard Status" in self.model.frame.columns:
+            self.model.set_filter("Standard Status", self.comboBox_status.currentData())
+
+    def _update_row_label(self):
+        self.label_rows.setText(f"{self.model.visible_rows():,} of {self.model.total_rows():,} rows")
@@ -0,0 +1,258 @@
+"""
+监视文件夹：自动处理新的或修改过的 Skyline 导出文件
+
+watch polls a directory for CSV files and runs process_file on every file
+that is new or has changed since it was last processed. A file is taken once
+its size and modification time have stayed the same for `settle` seconds,
+so exports that are still being written are not read half-way.
+
+Processed files are recorded in a JSON manifest (by default
+.scfa_watch.json in the output directory) with the SHA-256 of their
+content and a hash of the processing parameters. After a restart a file is
+only processed again if its content or the parameters changed; a file that
+was merely touched is recognised by its hash and skipped.
+
+At most `workers` files are processed at the same time. Files found beyond
+that stay in the directory and are picked up by later polls, so a burst of
+exports never queues more work than the pool can run.
+"""
+import fnmatch
+import hashlib
+import json
+import os
+import signal
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict
+from multiprocessing.managers import SyncManager
+
+import scfa_batch
+import scfa_engine
+
+MANIFEST_NAME = ".scfa_watch.json"
+# 处理结果文件的前缀，输出目录与监视目录相同时不作为输入
+OUTPUT_PREFIXES = ("MARKED_", "GROUPED_", "SWEEP_", "REPORT_", "PROFILE_")
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def params_digest(params):
+    """处理参数的哈希，参数改变后所有文件重新处理"""
+    text = json.dumps(asdict(params), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class Manifest:
+    """
+    已处理文件的记录，保存为 JSON
+    Args:
+        path (str): 清单文件路径，不存在时为空清单
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f).get("files", {})
+
+    def get(self, file_path):
+        return self.entries.get(os.path.abspath(file_path))
+
+    def is_current(self, file_path, stat, params_key):
+        """修改时间、大小和参数都与记录一致时不需要计算哈希"""
+        entry = self.get(file_path)
+        return (entry is not None and entry["params"] == params_key
+                and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size)
+
+    def record(self, file_path, stat, digest, params_key, item=None):
+        """
+        记录文件的处理结果
+        Args:
+            stat (os.stat_result): 计算哈希时的文件状态
+            digest (str): 文件内容的 SHA-256
+            params_key (str): params_digest 的结果
+            item (BatchItem): 处理结果，为 None 时只更新文件状态（内容未改变）
+        """
+        key = os.path.abspath(file_path)
+        entry = dict(self.entries.get(key) or {})
+        entry.update(sha256=digest, params=params_key, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        if item is not None:
+            entry.update(
+                processed=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                saved_files=list(item.result.saved_files) if item.result else [],
+                error=item.error,
+            )
+        self.entries[key] = entry
+
+    def save(self):
+        """先写临时文件再替换，中断时不会留下不完整的清单"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.entries}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def scan(directory, pattern="*.csv"):
+    """
+    目录中符合 pattern 的输入文件（不含子目录和处理结果）
+    Returns:
+        dict: 路径 -> os.stat_result
+    """
+    found = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (not entry.is_file() or not fnmatch.fnmatch(entry.name.lower(), pattern.lower())
+                    or entry.name.startswith(OUTPUT_PREFIXES)):
+                continue
+            try:
+                found[entry.path] = entry.stat()
+            except OSError:
+                # 扫描期间被删除
+                continue
+    return found
+
+
+def _ignore_interrupt():
+    # Ctrl+C 由主进程处理，工作进程通过取消标记停止
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def watch(directory, save_path, params, workers=1, interval=2.0, settle=2.0, pattern="*.csv",
+          manifest_path="", once=False, stop=None, on_result=None):
+    """
+    监视目录并处理新的或修改过的文件
+    Args:
+        directory (str): 监视的目录
+        save_path (str): 输出目录
+        params (MarkerParams): 处理参数
+        workers (int): 同时处理的文件数，1 表示在当前进程中处理
+        interval (float): 两次扫描的间隔（秒）
+        settle (float): 文件大小和修改时间保持不变多少秒后才处理
+        pattern (str): 输入文件名的通配符
+        manifest_path (str): 清单文件路径，默认为输出目录中的 .scfa_watch.json
+        once (bool): 只处理当前已有的文件，处理完后返回
+        stop (CancelToken): 停止标记，正在处理的文件在下一个检查点停止
+        on_result (callable): on_result(item)，每个文件处理完成（成功或失败）后调用
+    Returns:
+        int: 处理的文件数
+    """
+    stop = stop or scfa_engine.CancelToken()
+    manifest = Manifest(manifest_path or os.path.join(save_path, MANIFEST_NAME))
+    params_key = params_digest(params)
+    # 路径 -> 上次扫描时的 (mtime_ns, size, 首次出现该状态的时间)
+    seen = {}
+    running = {}
+    n_processed = 0
+
+    def finish(file_path, stat, digest, item):
+        nonlocal n_processed
+        if item.canceled:
+            return
+        manifest.record(file_path, stat, digest, params_key, item)
+        manifest.save()
+        n_processed += 1
+        if on_result is not None:
+            on_result(item)
+
+    def ready_files():
+        """本次扫描中内容稳定、需要处理的文件"""
+        now = time.time()
+        ready = []
+        found = scan(directory, pattern)
+        for path in list(seen):
+            if path not in found:
+                del seen[path]
+        for path, stat in sorted(found.items()):
+            if path in running or path in attempted or manifest.is_current(path, stat, params_key):
+                continue
+            state = (stat.st_mtime_ns, stat.st_size)
+            if seen.get(path, (None,))[:2] != state:
+                seen[path] = state + (now,)
+            if not once and now - max(seen[path][2], stat.st_mtime_ns / 1e9) < settle:
+                # 可能仍在写入
+                continue
+            ready.append((path, stat))
+        return ready
+
+    def digest_if_changed(path, stat):
+        """计算哈希；内容和参数都未改变时只更新清单中的文件状态并返回 None"""
+        try:
+            digest = file_digest(path)
+        except OSError:
+            return None
+        entry = manifest.get(path)
+        if entry is not None and entry["sha256"] == digest and entry["params"] == params_key:
+            manifest.record(path, stat, digest, params_key)
+            manifest.save()
+            return None
+        return digest
+
+    # once 模式下每个文件只尝试一次
+    attempted = set()
+    executor = manager = None
+    shared_stop = stop
+    try:
+        if workers > 1:
+            # threading.Event 不能传给工作进程，使用 Manager 的共享事件
+            manager = SyncManager()
+            manager.start(_ignore_interrupt)
+            shared_stop = scfa_engine.CancelToken(manager.Event())
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupt)
+        while not stop.is_canceled():
+            ready = ready_files()
+            for path, stat in ready:
+                if len(running) >= workers or stop.is_canceled():
+                    # 其余文件留到下次扫描
+                    break
+                if once:
+                    attempted.add(path)
+                digest = digest_if_changed(path, stat)
+                if digest is None:
+                    continue
+                if executor is None:
+                    finish(path, stat, digest, scfa_batch._process_one(path, save_path, params, cancel=stop))
+                else:
+                    future = executor.submit(scfa_batch._process_one, path, save_path, params,
+                                             False, None, shared_stop)
+                    running[path] = (future, stat, digest)
+            if running:
+                futures = {future: path for path, (future, _, _) in running.items()}
+                finished, _ = wait(futures, timeout=interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = futures[future]
+                    _, stat, digest = running.pop(path)
+                    try:
+                        item = future.result()
+                    except Exception as e:
+                        # 工作进程异常退出
+                        item = scfa_batch.BatchItem(file_path=path, error=str(e),
+                                                    traceback=traceback.format_exc())
+                    finish(path, stat, digest, item)
+            elif once:
+                if not ready:
+                    break
+            else:
+                stop.wait(interval)
+    except KeyboardInterrupt:
+        stop.cancel()
+    finally:
+        if executor is not None:
+            # 正在处理的文件在下一个检查点停止，已完成的文件仍然记录
+            shared_stop.cancel()
+            for path, (future, stat, digest) in running.items():
+                try:
+                    finish(path, stat, digest, future.result())
+                except Exception:
+                    pass
+            executor.shutdown(wait=True, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+    return n_processed